@@ -3,18 +3,39 @@ import csv
 from dotenv import load_dotenv
 from google import genai
 from google.genai import types
+from google.genai import errors as genai_errors
 from pathlib import Path
-from typing import List, Union, Optional, Generator
+from typing import Callable, List, Union, Optional, Generator
 import mysql.connector
+from mysql.connector import FieldType
 from mysql.connector.pooling import MySQLConnectionPool
+import asyncio
+import bisect
+import atexit
+import concurrent.futures
+import contextlib
 import datetime
+import functools
+import time
 import os
+import queue
+import hashlib
+import heapq
+import math
+import threading
 import re
 import io
 import uuid
+from urllib.parse import urlencode
+import zlib
 import json
+from json.encoder import encode_basestring_ascii
 import decimal
 from pydantic import BaseModel
+from cachetools import TTLCache
+from tnt_polygon import DEFAULT_POLYGON_COORDINATES
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from flask import Flask
 from flask_cors import CORS
@@ -31,13 +52,76 @@ class Config:
     RETHINKAI_API_KEYS = os.getenv("RETHINKAI_API_KEYS").split(",")
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     GEMINI_MODEL = os.getenv("GEMINI_MODEL")
+    # Gemini API endpoint override, e.g. test/fake_gemini_server.py for offline load tests
+    GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "")
     GEMINI_CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", "0.125"))
+    # Seconds a request waits for another worker to finish building the same context cache
+    GEMINI_CACHE_BUILD_TIMEOUT = int(os.getenv("GEMINI_CACHE_BUILD_TIMEOUT", "120"))
+    # Seconds between attempts to take a context cache build lock another worker holds
+    GEMINI_CACHE_LOCK_POLL = float(os.getenv("GEMINI_CACHE_LOCK_POLL", "1"))
+    # Context cache refresh-ahead: check interval, how close to expiry a cache is extended,
+    # and how long after its last use a cache is left to lapse (all seconds)
+    GEMINI_CACHE_REFRESH_INTERVAL = int(os.getenv("GEMINI_CACHE_REFRESH_INTERVAL", "300"))
+    GEMINI_CACHE_REFRESH_AHEAD = int(os.getenv("GEMINI_CACHE_REFRESH_AHEAD", "1800"))
+    GEMINI_CACHE_IDLE_TIMEOUT = int(os.getenv("GEMINI_CACHE_IDLE_TIMEOUT", "3600"))
+    # Contexts built at startup and kept alive, "app_version:context_request[:spatial]" comma separated
+    GEMINI_WARM_CONTEXTS = [
+        x.strip() for x in os.getenv("GEMINI_WARM_CONTEXTS", "").split(",") if x.strip()
+    ]
     HOST = os.getenv("API_HOST", "127.0.0.1")
     PORT = os.getenv("API_PORT", "8888")
     DATASTORE_PATH = BASE_DIR / Path(
         os.getenv("DATASTORE_PATH", "./datastore").lstrip("./")
     )
     PROMPTS_PATH = BASE_DIR / Path(os.getenv("PROMPTS_PATH", "./prompts").lstrip("./"))
+    # Seconds between checks of the datastore and prompts directories for changed files
+    ASSET_CHECK_INTERVAL = float(os.getenv("ASSET_CHECK_INTERVAL", "5"))
+    # Retrieval context (context_request=retrieval): index file, passages per question and words per passage
+    RETRIEVAL_INDEX_PATH = BASE_DIR / Path(
+        os.getenv("RETRIEVAL_INDEX_PATH", "./retrieval_index.json").lstrip("./")
+    )
+    RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+    RETRIEVAL_CHUNK_WORDS = int(os.getenv("RETRIEVAL_CHUNK_WORDS", "200"))
+    # Characters per token measured against Gemini, written by GET /chat/context?option=calibrate
+    TOKEN_CALIBRATION_PATH = BASE_DIR / Path(
+        os.getenv("TOKEN_CALIBRATION_PATH", "./token_calibration.json").lstrip("./")
+    )
+    # /data/query response cache, bounded by total body size
+    RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    RESPONSE_CACHE_MAX_BYTES = int(
+        os.getenv("RESPONSE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))
+    )
+    RESPONSE_CACHE_MAX_ENTRY_BYTES = int(
+        os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(32 * 1024 * 1024))
+    )
+    # Largest page a keyset-paginated request may ask for
+    PAGE_MAX_ROWS = int(os.getenv("PAGE_MAX_ROWS", "100000"))
+    # Rows per fetchmany() and target chunk size for streamed JSON / NDJSON
+    STREAM_FETCH_ROWS = int(os.getenv("STREAM_FETCH_ROWS", "5000"))
+    STREAM_CHUNK_BYTES = int(os.getenv("STREAM_CHUNK_BYTES", str(64 * 1024)))
+    # Rows per record batch / row group for arrow and parquet output
+    ARROW_BATCH_ROWS = int(os.getenv("ARROW_BATCH_ROWS", "50000"))
+    # Seconds between checks that in_tnt_polygon matches DEFAULT_POLYGON_COORDINATES
+    POLYGON_CHECK_INTERVAL = int(os.getenv("POLYGON_CHECK_INTERVAL", "300"))
+    # Gemini calls in flight per process, how many more may wait, and how long a call may take in total
+    GEMINI_MAX_CONCURRENT = int(os.getenv("GEMINI_MAX_CONCURRENT", "8"))
+    GEMINI_MAX_QUEUED = int(os.getenv("GEMINI_MAX_QUEUED", "4"))
+    GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "120"))
+    # Request threads per worker process (gunicorn gthread --threads), and how many of them
+    # Gemini calls may never take, so /data/query always has threads to run on
+    WORKER_THREADS = int(os.getenv("WORKER_THREADS", "16"))
+    DATA_RESERVED_THREADS = int(os.getenv("DATA_RESERVED_THREADS", "4"))
+    # Memoized /chat answers (chat_answer_cache table): seconds kept and most rows kept
+    CHAT_ANSWER_CACHE_TTL = int(os.getenv("CHAT_ANSWER_CACHE_TTL", "86400"))
+    CHAT_ANSWER_CACHE_MAX_ROWS = int(os.getenv("CHAT_ANSWER_CACHE_MAX_ROWS", "5000"))
+    # Seconds between reads of the context data version (rollup_watermark)
+    DATA_VERSION_CHECK_INTERVAL = int(os.getenv("DATA_VERSION_CHECK_INTERVAL", "300"))
+    # Background interaction_log writer: queued events kept at most, rows per flush, seconds between flushes
+    LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+    LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+    LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+    # Seconds the exit handler waits for the writer to finish
+    LOG_SHUTDOWN_TIMEOUT = float(os.getenv("LOG_SHUTDOWN_TIMEOUT", "10"))
     ALLOWED_EXTENSIONS = {"csv", "txt"}
     MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB limit
     FLASK_SECRET_KEY = os.getenv("FLASK_SECRET_KEY", "rethinkAI2025!")
@@ -45,6 +129,13 @@ class Config:
         os.getenv("FLASK_SESSION_COOKIE_SECURE", "False").lower() == "true"
     )
 
+    # Connection pool: size (at most 32), seconds a checkout waits for a free connection,
+    # and seconds after which a connection is reopened on checkout
+    DB_POOL_NAME = os.getenv("DB_POOL_NAME", "rethinkai_api")
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+
     # Database configuration
     DB_CONFIG = {
         "host": os.getenv("DB_HOST", "localhost"),
@@ -55,10 +146,19 @@ class Config:
 
 
 # Initialize GenAI client
-genai_client = genai.Client(api_key=Config.GEMINI_API_KEY)
+genai_client = genai.Client(
+    api_key=Config.GEMINI_API_KEY,
+    http_options=(
+        types.HttpOptions(base_url=Config.GEMINI_BASE_URL)
+        if Config.GEMINI_BASE_URL
+        else None
+    ),
+)
 
 # Create connection pool
-db_pool = MySQLConnectionPool(**Config.DB_CONFIG)
+db_pool = MySQLConnectionPool(
+    pool_name=Config.DB_POOL_NAME, pool_size=Config.DB_POOL_SIZE, **Config.DB_CONFIG
+)
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -103,9 +203,8 @@ class Structured_Data(BaseModel):
 # SQL Query Constants
 #
 class SQLConstants:
-    # TNT neighborhood coordinates. Using less specific rectangular shape for now.
-    # Format: "lng_bottom_left lat_bottom_left, lng_top_left lat_top_left, lng_top_right lat_top_right, lng_bottom_right lat_bottom_right, lng_bottom_left lat_bottom_left"
-    DEFAULT_POLYGON_COORDINATES = "-71.081297 42.284182, -71.081784 42.293107, -71.071730 42.293255, -71.071601 42.284301, -71.081297 42.284182"
+    # TNT neighborhood coordinates, defined in tnt_polygon.py for setup/post_ingest.py as well
+    DEFAULT_POLYGON_COORDINATES = DEFAULT_POLYGON_COORDINATES
 
     # 311 category mappings
     CATEGORY_TYPES = {
@@ -120,54 +219,18 @@ class SQLConstants:
         [cat for cat in ", ".join(CATEGORY_TYPES.values()).split(", ")]
     )
 
-    BOS311_NORMALIZED_TYPE_CASE = f"""
-    CASE
-        WHEN type IN ({CATEGORY_TYPES['living_conditions']}) THEN 'Living Conditions'
-        WHEN type IN ({CATEGORY_TYPES['trash']}) THEN 'Trash, Recycling, And Waste'
-        WHEN type IN ({CATEGORY_TYPES['streets']}) THEN 'Streets, Sidewalks, And Parks'
-        WHEN type IN ({CATEGORY_TYPES['parking']}) THEN 'Parking'
-    END AS normalized_type,
-    """
-    # Common aggregation columns for monthly/quarterly breakdowns
-    BOS911_TIME_BREAKDOWN = """
-    COUNT(*) AS total_by_year,
-    SUM(CASE WHEN quarter = 1 THEN 1 ELSE 0 END) AS q1_total,
-    SUM(CASE WHEN quarter = 2 THEN 1 ELSE 0 END) AS q2_total,
-    SUM(CASE WHEN quarter = 3 THEN 1 ELSE 0 END) AS q3_total,
-    SUM(CASE WHEN quarter = 4 THEN 1 ELSE 0 END) AS q4_total,
-    SUM(CASE WHEN month = 1 THEN 1 ELSE 0 END) AS jan_total,
-    SUM(CASE WHEN month = 2 THEN 1 ELSE 0 END) AS feb_total,
-    SUM(CASE WHEN month = 3 THEN 1 ELSE 0 END) AS mar_total,
-    SUM(CASE WHEN month = 4 THEN 1 ELSE 0 END) AS apr_total,
-    SUM(CASE WHEN month = 5 THEN 1 ELSE 0 END) AS may_total,
-    SUM(CASE WHEN month = 6 THEN 1 ELSE 0 END) AS jun_total,
-    SUM(CASE WHEN month = 7 THEN 1 ELSE 0 END) AS jul_total,
-    SUM(CASE WHEN month = 8 THEN 1 ELSE 0 END) AS aug_total,
-    SUM(CASE WHEN month = 9 THEN 1 ELSE 0 END) AS sep_total,
-    SUM(CASE WHEN month = 10 THEN 1 ELSE 0 END) AS oct_total,
-    SUM(CASE WHEN month = 11 THEN 1 ELSE 0 END) AS nov_total,
-    SUM(CASE WHEN month = 12 THEN 1 ELSE 0 END) AS dec_total
-    """
+    # Normalized 311 category names, as stored in bos311_data.normalized_category
+    CATEGORY_NAMES = {
+        "living_conditions": "'Living Conditions'",
+        "trash": "'Trash, Recycling, And Waste'",
+        "streets": "'Streets, Sidewalks, And Parks'",
+        "parking": "'Parking'",
+    }
 
-    BOS311_TIME_BREAKDOWN = """
-    COUNT(*) AS total_by_year,
-    SUM(CASE WHEN QUARTER(open_dt) = 1 THEN 1 ELSE 0 END) AS q1_total,
-    SUM(CASE WHEN QUARTER(open_dt) = 2 THEN 1 ELSE 0 END) AS q2_total,
-    SUM(CASE WHEN QUARTER(open_dt) = 3 THEN 1 ELSE 0 END) AS q3_total,
-    SUM(CASE WHEN QUARTER(open_dt) = 4 THEN 1 ELSE 0 END) AS q4_total,
-    SUM(CASE WHEN MONTH(open_dt) = 1 THEN 1 ELSE 0 END) AS jan_total,
-    SUM(CASE WHEN MONTH(open_dt) = 2 THEN 1 ELSE 0 END) AS feb_total,
-    SUM(CASE WHEN MONTH(open_dt) = 3 THEN 1 ELSE 0 END) AS mar_total,
-    SUM(CASE WHEN MONTH(open_dt) = 4 THEN 1 ELSE 0 END) AS apr_total,
-    SUM(CASE WHEN MONTH(open_dt) = 5 THEN 1 ELSE 0 END) AS may_total,
-    SUM(CASE WHEN MONTH(open_dt) = 6 THEN 1 ELSE 0 END) AS jun_total,
-    SUM(CASE WHEN MONTH(open_dt) = 7 THEN 1 ELSE 0 END) AS jul_total,
-    SUM(CASE WHEN MONTH(open_dt) = 8 THEN 1 ELSE 0 END) AS aug_total,
-    SUM(CASE WHEN MONTH(open_dt) = 9 THEN 1 ELSE 0 END) AS sep_total,
-    SUM(CASE WHEN MONTH(open_dt) = 10 THEN 1 ELSE 0 END) AS oct_total,
-    SUM(CASE WHEN MONTH(open_dt) = 11 THEN 1 ELSE 0 END) AS nov_total,
-    SUM(CASE WHEN MONTH(open_dt) = 12 THEN 1 ELSE 0 END) AS dec_total
-    """
+    CATEGORY_NAMES["all"] = ", ".join(CATEGORY_NAMES.values())
+
+    # H3 resolutions with a precomputed h3_res<N> column on bos311_data
+    H3_RESOLUTIONS = (8, 9, 10, 11)
 
     ##### 311 specific constants #####
 
@@ -175,7 +238,11 @@ class SQLConstants:
         "police_district IN ('B2', 'B3', 'C11') AND neighborhood = 'Dorchester'"
     )
 
-    BOS311_SPATIAL_WHERE = f"""
+    # in_tnt_polygon is precomputed by setup/post_ingest.py; the ST_Contains() form is
+    # only used while the stored flags were computed for a different polygon
+    BOS311_SPATIAL_WHERE = "in_tnt_polygon = 1"
+
+    BOS311_POLYGON_WHERE = f"""
     ST_Contains(
         ST_GeomFromText('POLYGON(({DEFAULT_POLYGON_COORDINATES}))'),
         coordinates
@@ -186,7 +253,9 @@ class SQLConstants:
 
     BOS911_BASE_WHERE = "district IN ('B2', 'B3', 'C11') AND neighborhood = 'Dorchester' AND year >= 2018 AND year < 2025"
 
-    BOS911_SPATIAL_WHERE = f"""
+    BOS911_SPATIAL_WHERE = "year >= 2018 AND year < 2025 AND in_tnt_polygon = 1"
+
+    BOS911_POLYGON_WHERE = f"""
     year >= 2018 AND year < 2025
     AND ST_Contains(
         ST_GeomFromText('POLYGON(({DEFAULT_POLYGON_COORDINATES}))'),
@@ -194,173 +263,374 @@ class SQLConstants:
     ) = 1
     """
 
+    ##### Monthly rollup constants #####
+    # incident_monthly_rollup is maintained by setup/post_ingest.py; district holds
+    # police_district for 311 rows and district for 911 rows.
+
+    ROLLUP_BASE_WHERE = "district IN ('B2', 'B3', 'C11') AND neighborhood = 'Dorchester'"
+
+    ROLLUP_SPATIAL_WHERE = "in_tnt_polygon = 1"
+
+    # Stand-in for incident_monthly_rollup while in_tnt_polygon is stale: the rollup's 311
+    # and shots fired rows inside the polygon, counted from the raw tables with ST_Contains()
+    ROLLUP_POLYGON_TABLE = f"""(
+        SELECT
+            YEAR(open_dt) AS year,
+            MONTH(open_dt) AS month,
+            COALESCE(neighborhood, '') AS neighborhood,
+            COALESCE(police_district, '') AS district,
+            1 AS in_tnt_polygon,
+            normalized_category,
+            type,
+            COUNT(*) AS total
+        FROM bos311_data
+        WHERE normalized_category IS NOT NULL AND {BOS311_POLYGON_WHERE}
+        GROUP BY 1, 2, 3, 4, 5, 6, 7
+        UNION ALL
+        SELECT
+            year,
+            month,
+            COALESCE(neighborhood, ''),
+            COALESCE(district, ''),
+            1,
+            'Shots Fired',
+            CASE WHEN ballistics_evidence = 1 THEN 'Confirmed' ELSE 'Unconfirmed' END,
+            COUNT(*)
+        FROM shots_fired_data
+        WHERE ballistics_evidence IN (0, 1) AND {BOS311_POLYGON_WHERE}
+        GROUP BY 1, 2, 3, 4, 5, 6, 7
+    ) AS incident_monthly_rollup"""
+
+    ROLLUP_911_YEARS = "year >= 2018 AND year < 2025"
+
+    # Common aggregation columns for monthly/quarterly breakdowns
+    ROLLUP_TIME_BREAKDOWN = """
+    CAST(SUM(total) AS SIGNED) AS total_by_year,
+    CAST(SUM(CASE WHEN month BETWEEN 1 AND 3 THEN total ELSE 0 END) AS SIGNED) AS q1_total,
+    CAST(SUM(CASE WHEN month BETWEEN 4 AND 6 THEN total ELSE 0 END) AS SIGNED) AS q2_total,
+    CAST(SUM(CASE WHEN month BETWEEN 7 AND 9 THEN total ELSE 0 END) AS SIGNED) AS q3_total,
+    CAST(SUM(CASE WHEN month BETWEEN 10 AND 12 THEN total ELSE 0 END) AS SIGNED) AS q4_total,
+    CAST(SUM(CASE WHEN month = 1 THEN total ELSE 0 END) AS SIGNED) AS jan_total,
+    CAST(SUM(CASE WHEN month = 2 THEN total ELSE 0 END) AS SIGNED) AS feb_total,
+    CAST(SUM(CASE WHEN month = 3 THEN total ELSE 0 END) AS SIGNED) AS mar_total,
+    CAST(SUM(CASE WHEN month = 4 THEN total ELSE 0 END) AS SIGNED) AS apr_total,
+    CAST(SUM(CASE WHEN month = 5 THEN total ELSE 0 END) AS SIGNED) AS may_total,
+    CAST(SUM(CASE WHEN month = 6 THEN total ELSE 0 END) AS SIGNED) AS jun_total,
+    CAST(SUM(CASE WHEN month = 7 THEN total ELSE 0 END) AS SIGNED) AS jul_total,
+    CAST(SUM(CASE WHEN month = 8 THEN total ELSE 0 END) AS SIGNED) AS aug_total,
+    CAST(SUM(CASE WHEN month = 9 THEN total ELSE 0 END) AS SIGNED) AS sep_total,
+    CAST(SUM(CASE WHEN month = 10 THEN total ELSE 0 END) AS SIGNED) AS oct_total,
+    CAST(SUM(CASE WHEN month = 11 THEN total ELSE 0 END) AS SIGNED) AS nov_total,
+    CAST(SUM(CASE WHEN month = 12 THEN total ELSE 0 END) AS SIGNED) AS dec_total
+    """
+
+
+#
+# Metrics, served from /metrics. Per process: latency histograms per route and per stage
+# (query_build, db_execute, row_serialization, context_cache_lookup, context_cache_build,
+# context_sql, chat_answer_lookup, generation, log_write) and counters for cache hits and errors.
+#
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+metrics = {"route": {}, "stage": {}, "counters": {}}
+metrics_lock = threading.Lock()
+
+
+def observe(kind: str, name: str, seconds: float) -> None:
+    """Add a duration to the "route" or "stage" histogram for name."""
+    with metrics_lock:
+        histogram = metrics[kind].get(name)
+        if histogram is None:
+            histogram = metrics[kind][name] = {
+                "buckets": [0] * (len(METRIC_BUCKETS) + 1),
+                "sum": 0.0,
+                "count": 0,
+            }
+        histogram["buckets"][bisect.bisect_left(METRIC_BUCKETS, seconds)] += 1
+        histogram["sum"] += seconds
+        histogram["count"] += 1
+
+
+def count(event: str, route: str = "") -> None:
+    with metrics_lock:
+        metrics["counters"][(event, route)] = (
+            metrics["counters"].get((event, route), 0) + 1
+        )
+
+
+def timed(stage: str):
+    """Decorator recording each call's duration in the stage histogram."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe("stage", stage, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def metrics_snapshot() -> dict:
+    """Copy of the histograms and counters, plus pool and log writer gauges."""
+    with metrics_lock:
+        snapshot = {
+            kind: {
+                name: {
+                    "buckets": list(h["buckets"]),
+                    "sum": h["sum"],
+                    "count": h["count"],
+                }
+                for name, h in metrics[kind].items()
+            }
+            for kind in ("route", "stage")
+        }
+        snapshot["counters"] = [
+            {"event": event, "route": route, "value": value}
+            for (event, route), value in sorted(metrics["counters"].items())
+        ]
+    snapshot["bucket_bounds"] = list(METRIC_BUCKETS)
+    snapshot["db_pool"] = get_db_pool_stats()
+    snapshot["log_writer"] = {
+        "written": log_writer["written"],
+        "dropped": log_writer["dropped"],
+        "queued": log_writer["queue"].qsize() if log_writer["queue"] else 0,
+    }
+    return snapshot
+
+
+def prometheus_metrics(snapshot: dict) -> str:
+    """Render metrics_snapshot() in the Prometheus text exposition format."""
+
+    def label(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+    lines = []
+    for kind, metric in (("route", "rethinkai_route_seconds"), ("stage", "rethinkai_stage_seconds")):
+        lines.append(f"# TYPE {metric} histogram")
+        for name, h in sorted(snapshot[kind].items()):
+            cumulative = 0
+            for bound, hits in zip(METRIC_BUCKETS + ("+Inf",), h["buckets"]):
+                cumulative += hits
+                lines.append(f'{metric}_bucket{{{kind}="{label(name)}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{kind}="{label(name)}"}} {h["sum"]:.6f}')
+            lines.append(f'{metric}_count{{{kind}="{label(name)}"}} {h["count"]}')
+
+    lines.append("# TYPE rethinkai_events_total counter")
+    for counter in snapshot["counters"]:
+        route = f',route="{label(counter["route"])}"' if counter["route"] else ""
+        lines.append(f'rethinkai_events_total{{event="{counter["event"]}"{route}}} {counter["value"]}')
+
+    lines.append("# TYPE rethinkai_db_pool gauge")
+    for stat, value in snapshot["db_pool"].items():
+        lines.append(f'rethinkai_db_pool{{stat="{stat}"}} {value}')
+    lines.append("# TYPE rethinkai_log_writer gauge")
+    for stat, value in snapshot["log_writer"].items():
+        lines.append(f'rethinkai_log_writer{{stat="{stat}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+class Stage_Timer:
+    """Adds up time per stage across a streamed query's batches, recorded once at the end."""
+
+    def __init__(self):
+        self.totals = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.totals[name] = (
+                self.totals.get(name, 0.0) + time.perf_counter() - start
+            )
+
+    def record(self) -> None:
+        for name, seconds in self.totals.items():
+            observe("stage", name, seconds)
+
 
 #
 # Query Builders
 #
+@timed("query_build")
 def build_311_query(
     data_request: str,
     request_options: str = "",
     request_date: str = "",
     request_zipcode: str = "",
-    event_ids: str = "",
+    event_ids: Union[str, List] = "",
     is_spatial=False,
+    h3_resolution: int = 10,
+    page_limit: int = 0,
+    after_id: int = 0,
+    before_id: int = 0,
+    h3_cells: Union[str, List] = "",
+    ids_only: bool = False,
 ) -> str:
+    rollup_table = "incident_monthly_rollup"
     if is_spatial:
-        Bos311_where_clause = SQLConstants.BOS311_SPATIAL_WHERE
-        Bos911_where_clause = SQLConstants.BOS911_SPATIAL_WHERE
+        flags_current = polygon_flags_current()
+        Bos311_where_clause = (
+            SQLConstants.BOS311_SPATIAL_WHERE
+            if flags_current
+            else SQLConstants.BOS311_POLYGON_WHERE
+        )
+        rollup_where_clause = SQLConstants.ROLLUP_SPATIAL_WHERE
+        # The rollup's in_tnt_polygon is as stale as the raw tables' flags
+        if not flags_current:
+            rollup_table = SQLConstants.ROLLUP_POLYGON_TABLE
     else:
         Bos311_where_clause = SQLConstants.BOS311_BASE_WHERE
-        Bos911_where_clause = SQLConstants.BOS911_BASE_WHERE
+        rollup_where_clause = SQLConstants.ROLLUP_BASE_WHERE
+
+    # request_date is compared directly against open_month / the rollup's year and month
+    if request_date and not check_date_format(request_date):
+        print(
+            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error generating query:{Font_Colors.ENDC}: invalid date {request_date}"
+        )
+        return ""
 
     if data_request == "311_by_geo" and request_options:
-        query = f"""
-        SELECT
-            id,
+        # ids_only selects just the id, for the next page lookahead
+        columns = (
+            "id"
+            if ids_only
+            else """id,
             type,
             open_dt AS date,
             latitude,
             longitude,
-            CASE
-                WHEN type IN ({SQLConstants.CATEGORY_TYPES['living_conditions']}) THEN 'Living Conditions'
-                WHEN type IN ({SQLConstants.CATEGORY_TYPES['trash']}) THEN 'Trash, Recycling, And Waste'
-                WHEN type IN ({SQLConstants.CATEGORY_TYPES['streets']}) THEN 'Streets, Sidewalks, And Parks'
-                WHEN type IN ({SQLConstants.CATEGORY_TYPES['parking']}) THEN 'Parking'
-            END AS normalized_type
+            normalized_category AS normalized_type"""
+        )
+        query = f"""
+        SELECT
+            {columns}
         FROM
             bos311_data
         WHERE 
-            type IN ({SQLConstants.CATEGORY_TYPES[request_options]}) 
+            normalized_category IN ({SQLConstants.CATEGORY_NAMES[request_options]}) 
+            AND {Bos311_where_clause}
+        """
+
+        if request_date:
+            query += f"""AND open_month = '{request_date}'\n        """
+
+        # Keyset pagination on id, after_id / before_id are exclusive bounds
+        if after_id:
+            query += f"""AND id > {after_id}\n        """
+        if before_id:
+            query += f"""AND id < {before_id}\n        """
+        if page_limit:
+            query += f"""ORDER BY id\n        LIMIT {page_limit}"""
+
+        return query
+    elif data_request == "311_hexbins":
+        if h3_resolution not in SQLConstants.H3_RESOLUTIONS:
+            print(
+                f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error generating query:{Font_Colors.ENDC}: unsupported H3 resolution {h3_resolution}"
+            )
+            return ""
+
+        # One row per cell, with a count column per category
+        category_counts = ",\n            ".join(
+            f"CAST(SUM(normalized_category = {name}) AS SIGNED) AS {key}"
+            for key, name in SQLConstants.CATEGORY_NAMES.items()
+            if key != "all"
+        )
+        query = f"""
+        SELECT
+            h3_res{h3_resolution} AS cell,
+            COUNT(*) AS total,
+            {category_counts}
+        FROM
+            bos311_data
+        WHERE
+            normalized_category IN ({SQLConstants.CATEGORY_NAMES[request_options or 'all']})
+            AND h3_res{h3_resolution} IS NOT NULL
             AND {Bos311_where_clause}
         """
 
         if request_date:
-            query += f"""AND DATE_FORMAT(open_dt, '%Y-%m') = '{request_date}'"""
+            query += f"""AND open_month = '{request_date}'
+        """
 
+        query += "GROUP BY cell ORDER BY total DESC"
         return query
     elif data_request == "311_summary_context":
         query = f"""
-        WITH category_aggregates AS (
+        WITH bos311_rollup AS (
             SELECT
                 year,
-                '911 Shot Fired Confirmed - Annual Total' AS incident_type,
-                {SQLConstants.BOS911_TIME_BREAKDOWN},
-                'Category' AS level_type,
-                NULL AS category
-            FROM shots_fired_data
-            WHERE {Bos911_where_clause}
-            AND ballistics_evidence = 1
-            GROUP BY year, incident_type
-            UNION ALL
+                month,
+                CASE normalized_category
+                    WHEN 'Trash, Recycling, And Waste' THEN '311 Trash & Dumping Issues'
+                    WHEN 'Living Conditions' THEN '311 Living Condition Issues'
+                    WHEN 'Streets, Sidewalks, And Parks' THEN '311 Streets Issues'
+                    WHEN 'Parking' THEN '311 Parking Issues'
+                END AS category,
+                type,
+                total
+            FROM {rollup_table}
+            WHERE normalized_category IN ({SQLConstants.CATEGORY_NAMES['all']})
+            AND {rollup_where_clause}
+        ),
+        bos911_rollup AS (
             SELECT
                 year,
-                '911 Shot Fired Unconfirmed - Annual Total' AS incident_type,
-                {SQLConstants.BOS911_TIME_BREAKDOWN},
-                'Category' AS level_type,
-                NULL AS category
-            FROM shots_fired_data
-            WHERE {Bos911_where_clause}
-            AND ballistics_evidence = 0
-            GROUP BY year, incident_type
+                month,
+                CASE
+                    WHEN type = 'Confirmed' THEN '911 Shot Fired Confirmed'
+                    ELSE '911 Shot Fired Unconfirmed'
+                END AS category,
+                total
+            FROM {rollup_table}
+            WHERE normalized_category = 'Shots Fired'
+            AND {rollup_where_clause}
+            AND {SQLConstants.ROLLUP_911_YEARS}
             UNION ALL
             SELECT
                 year,
-                '911 Homicides - Annual Total' AS incident_type,
-                {SQLConstants.BOS911_TIME_BREAKDOWN},
-                'Category' AS level_type,
-                NULL AS category
-            FROM homicide_data
-            WHERE {SQLConstants.BOS911_BASE_WHERE} # Always uses base where clause because it's pulling from homicide_data, which doesn't have coordinates
-            GROUP BY year, incident_type
-            UNION ALL
-            SELECT
-                YEAR(open_dt) AS year,
-                '311 Trash & Dumping Issues - Annual Total' AS incident_type,
-                {SQLConstants.BOS311_TIME_BREAKDOWN},
-                'Category' AS level_type,
-                NULL AS category
-            FROM bos311_data
-            WHERE type IN ({SQLConstants.CATEGORY_TYPES['trash']})
-            AND {Bos311_where_clause}
-            GROUP BY year, incident_type
-            UNION ALL
-            SELECT
-                YEAR(open_dt) AS year,
-                '311 Living Condition Issues - Annual Total' AS incident_type,
-                {SQLConstants.BOS311_TIME_BREAKDOWN},
-                'Category' AS level_type,
-                NULL AS category
-            FROM bos311_data
-            WHERE type IN ({SQLConstants.CATEGORY_TYPES['living_conditions']})
-            AND {Bos311_where_clause}
-            GROUP BY year, incident_type
-            UNION ALL
+                month,
+                '911 Homicides' AS category,
+                total
+            FROM incident_monthly_rollup
+            WHERE normalized_category = 'Homicides'
+            AND {SQLConstants.ROLLUP_BASE_WHERE} # Always uses base where clause because homicide_data doesn't have coordinates
+            AND {SQLConstants.ROLLUP_911_YEARS}
+        ),
+        category_aggregates AS (
             SELECT
-                YEAR(open_dt) AS year,
-                '311 Streets Issues - Annual Total' AS incident_type,
-                {SQLConstants.BOS311_TIME_BREAKDOWN},
+                year,
+                CONCAT(category, ' - Annual Total') AS incident_type,
+                {SQLConstants.ROLLUP_TIME_BREAKDOWN},
                 'Category' AS level_type,
                 NULL AS category
-            FROM bos311_data
-            WHERE type IN ({SQLConstants.CATEGORY_TYPES['streets']})
-            AND {Bos311_where_clause}
-            GROUP BY year, incident_type
+            FROM bos911_rollup
+            GROUP BY year, bos911_rollup.category
             UNION ALL
             SELECT
-                YEAR(open_dt) AS year,
-                '311 Parking Issues - Annual Total' AS incident_type,
-                {SQLConstants.BOS311_TIME_BREAKDOWN},
+                year,
+                CONCAT(category, ' - Annual Total') AS incident_type,
+                {SQLConstants.ROLLUP_TIME_BREAKDOWN},
                 'Category' AS level_type,
                 NULL AS category
-            FROM bos311_data
-            WHERE type IN ({SQLConstants.CATEGORY_TYPES['parking']})
-            AND {Bos311_where_clause}
-            GROUP BY year, incident_type
+            FROM bos311_rollup
+            GROUP BY year, bos311_rollup.category
         ),
         type_details AS (
             SELECT
-                YEAR(open_dt) AS year,
-                '311 Trash & Dumping Issues' AS category,
-                type AS incident_type,
-                {SQLConstants.BOS311_TIME_BREAKDOWN},
-                'Type' AS level_type
-            FROM bos311_data
-            WHERE type IN ({SQLConstants.CATEGORY_TYPES['trash']})
-            AND {Bos311_where_clause}
-            GROUP BY year, type
-            UNION ALL
-            SELECT
-                YEAR(open_dt) AS year,
-                '311 Living Condition Issues' AS category,
-                type AS incident_type,
-                {SQLConstants.BOS311_TIME_BREAKDOWN},
-                'Type' AS level_type
-            FROM bos311_data
-            WHERE type IN ({SQLConstants.CATEGORY_TYPES['living_conditions']})
-            AND {Bos311_where_clause}
-            GROUP BY year, type
-            UNION ALL
-            SELECT
-                YEAR(open_dt) AS year,
-                '311 Streets Issues' AS category,
-                type AS incident_type,
-                {SQLConstants.BOS311_TIME_BREAKDOWN},
-                'Type' AS level_type
-            FROM bos311_data
-            WHERE type IN ({SQLConstants.CATEGORY_TYPES['streets']})
-            AND {Bos311_where_clause}
-            GROUP BY year, type
-            UNION ALL
-            SELECT
-                YEAR(open_dt) AS year,
-                '311 Parking Issues' AS category,
+                year,
+                category,
                 type AS incident_type,
-                {SQLConstants.BOS311_TIME_BREAKDOWN},
+                {SQLConstants.ROLLUP_TIME_BREAKDOWN},
                 'Type' AS level_type
-            FROM bos311_data
-            WHERE type IN ({SQLConstants.CATEGORY_TYPES['parking']})
-            AND {Bos311_where_clause}
-            GROUP BY year, type
+            FROM bos311_rollup
+            GROUP BY year, category, type
         )
         SELECT
             year,
@@ -402,80 +672,59 @@ def build_311_query(
             incident_type;
             """
         return query
-    elif data_request == "311_summary" and event_ids:
+    elif data_request == "311_summary" and (h3_cells or event_ids):
+        # The selection is sent as one JSON array literal and joined through JSON_TABLE,
+        # so parse and plan time doesn't grow with the number of selected cells or events
+        if h3_cells:
+            cells = split_selection(h3_cells)
+            if h3_resolution not in SQLConstants.H3_RESOLUTIONS or not all(
+                re.match(r"^[0-9a-f]{15}$", cell) for cell in cells
+            ):
+                print(
+                    f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error generating query:{Font_Colors.ENDC}: invalid H3 cells or resolution {h3_resolution}"
+                )
+                return ""
+
+            selection = f"""
+            FROM JSON_TABLE('{json.dumps(cells)}', '$[*]' COLUMNS (cell char(15) PATH '$')) AS selection
+            JOIN bos311_data ON bos311_data.h3_res{h3_resolution} = selection.cell
+            WHERE
+                normalized_category IN ({SQLConstants.CATEGORY_NAMES[request_options or 'all']})
+                AND {Bos311_where_clause}
+            """
+            if request_date:
+                selection += f"""AND open_month = '{request_date}'
+            """
+        else:
+            ids = split_selection(event_ids)
+            if not all(x.isdigit() for x in ids):
+                print(
+                    f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error generating query:{Font_Colors.ENDC}: invalid event_ids"
+                )
+                return ""
 
-        # Quote each event_id if not already quoted
-        id_list = [f"'{x.strip()}'" for x in event_ids.split(",") if x.strip()]
-        id_str = ",".join(id_list)
+            selection = f"""
+            FROM JSON_TABLE('[{",".join(str(int(x)) for x in ids)}]', '$[*]' COLUMNS (id int PATH '$')) AS selection
+            JOIN bos311_data ON bos311_data.id = selection.id
+            """
 
         query = f"""
+        WITH selected AS (
+            SELECT normalized_category, type
+            {selection}
+        )
         SELECT
-        CASE
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['living_conditions']}) THEN 'Living Conditions'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['trash']}) THEN 'Trash, Recycling, And Waste'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['streets']}) THEN 'Streets, Sidewalks, And Parks'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['parking']}) THEN 'Parking'
-        END AS category,
-        type AS subcategory,
-        COUNT(*) AS total
-        FROM bos311_data
-        WHERE id IN ({id_str})
-        GROUP BY category, subcategory
-        UNION ALL
-        SELECT
-        CASE
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['living_conditions']}) THEN 'Living Conditions'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['trash']}) THEN 'Trash, Recycling, And Waste'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['streets']}) THEN 'Streets, Sidewalks, And Parks'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['parking']}) THEN 'Parking'
-        END AS category,
-        'TOTAL' AS subcategory,
-        COUNT(*) AS total
-        FROM bos311_data
-        WHERE id IN ({id_str})
-        GROUP BY
-        category
-        ORDER BY
-        category,
-        CASE
-            WHEN subcategory = 'TOTAL' THEN 2
-            ELSE 1
-        END,
-        total DESC;
-        """
-        return query
-    elif data_request == "311_summary" and request_date and request_options:
-        query = f"""
-        SELECT
-        CASE
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['living_conditions']}) THEN 'Living Conditions'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['trash']}) THEN 'Trash, Recycling, And Waste'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['streets']}) THEN 'Streets, Sidewalks, And Parks'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['parking']}) THEN 'Parking'
-        END AS category,
+        normalized_category AS category,
         type AS subcategory,
         COUNT(*) AS total
-        FROM bos311_data
-        WHERE
-            DATE_FORMAT(open_dt, '%Y-%m') = '{request_date}'
-            AND type IN ({SQLConstants.CATEGORY_TYPES[request_options]})
-            AND {Bos311_where_clause}
+        FROM selected
         GROUP BY category, subcategory
         UNION ALL
         SELECT
-        CASE
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['living_conditions']}) THEN 'Living Conditions'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['trash']}) THEN 'Trash, Recycling, And Waste'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['streets']}) THEN 'Streets, Sidewalks, And Parks'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['parking']}) THEN 'Parking'
-        END AS category,
+        normalized_category AS category,
         'TOTAL' AS subcategory,
         COUNT(*) AS total
-        FROM bos311_data
-        WHERE
-            DATE_FORMAT(open_dt, '%Y-%m') = '{request_date}'
-            AND type IN ({SQLConstants.CATEGORY_TYPES[request_options]})
-            AND {Bos311_where_clause}
+        FROM selected
         GROUP BY
         category
         ORDER BY
@@ -487,41 +736,31 @@ def build_311_query(
         total DESC;
         """
         return query
-    elif (
-        data_request == "311_summary"
-        and not request_date
-        and not event_ids
-        and request_options
-    ):
+    elif data_request == "311_summary" and request_options:
+        # Summaries with or without a date are served from the monthly rollup
+        if request_date:
+            year, month = map(int, request_date.split("-"))
+            rollup_where_clause += f" AND year = {year} AND month = {month}"
+
         query = f"""
         SELECT
-        CASE
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['living_conditions']}) THEN 'Living Conditions'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['trash']}) THEN 'Trash, Recycling, And Waste'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['streets']}) THEN 'Streets, Sidewalks, And Parks'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['parking']}) THEN 'Parking'
-        END AS category,
+        normalized_category AS category,
         type AS subcategory,
-        COUNT(*) AS total
-        FROM bos311_data
+        CAST(SUM(total) AS SIGNED) AS total
+        FROM {rollup_table}
         WHERE
-            type IN ({SQLConstants.CATEGORY_TYPES[request_options]})
-            AND {Bos311_where_clause}
+            normalized_category IN ({SQLConstants.CATEGORY_NAMES[request_options]})
+            AND {rollup_where_clause}
         GROUP BY category, subcategory
         UNION ALL
         SELECT
-        CASE
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['living_conditions']}) THEN 'Living Conditions'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['trash']}) THEN 'Trash, Recycling, And Waste'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['streets']}) THEN 'Streets, Sidewalks, And Parks'
-            WHEN type IN ({SQLConstants.CATEGORY_TYPES['parking']}) THEN 'Parking'
-        END AS category,
+        normalized_category AS category,
         'TOTAL' AS subcategory,
-        COUNT(*) AS total
-        FROM bos311_data
+        CAST(SUM(total) AS SIGNED) AS total
+        FROM {rollup_table}
         WHERE
-            type IN ({SQLConstants.CATEGORY_TYPES[request_options]})
-            AND {Bos311_where_clause}
+            normalized_category IN ({SQLConstants.CATEGORY_NAMES[request_options]})
+            AND {rollup_where_clause}
         GROUP BY
         category
         ORDER BY
@@ -540,12 +779,16 @@ def build_311_query(
         return ""
 
 
+@timed("query_build")
 def build_911_query(data_request: str, is_spatial=False) -> str:
-    Bos911_where_clause = (
-        SQLConstants.BOS911_SPATIAL_WHERE
-        if is_spatial
-        else SQLConstants.BOS911_BASE_WHERE
-    )
+    if is_spatial:
+        Bos911_where_clause = (
+            SQLConstants.BOS911_SPATIAL_WHERE
+            if polygon_flags_current()
+            else SQLConstants.BOS911_POLYGON_WHERE
+        )
+    else:
+        Bos911_where_clause = SQLConstants.BOS911_BASE_WHERE
 
     if data_request == "911_shots_fired":
         query = f"""
@@ -602,6 +845,13 @@ def check_date_format(date_string: str) -> bool:
     return 1 <= month <= 12
 
 
+# Splits a comma separated (or list) selection into sorted unique values; order and duplicates don't change a summary
+def split_selection(values: Union[str, List]) -> List[str]:
+    if isinstance(values, list):
+        values = ",".join(str(x) for x in values)
+    return sorted({x.strip().strip("'") for x in values.split(",") if x.strip()})
+
+
 def check_filetype(filename: str) -> bool:
     return (
         "." in filename
@@ -609,41 +859,79 @@ def check_filetype(filename: str) -> bool:
     )
 
 
+#
+# Asset registry. Datastore and prompt files are read once and kept in memory. Each directory
+# is rescanned at most every ASSET_CHECK_INTERVAL seconds, rereading only files whose mtime
+# or size changed, so edits are picked up without a restart.
+#
+asset_registry = {
+    "datastore": {"files": {}, "checked_at": None},
+    "prompts": {"files": {}, "checked_at": None},
+}
+asset_registry_lock = threading.Lock()
+
+
+def load_assets(kind: str) -> dict:
+    """Files in the "datastore" or "prompts" directory, name -> {"text", "sha1", "mtime_ns", "size"}."""
+    with asset_registry_lock:
+        assets = asset_registry[kind]
+        if (
+            assets["checked_at"] is not None
+            and time.monotonic() - assets["checked_at"] < Config.ASSET_CHECK_INTERVAL
+        ):
+            return assets["files"]
+
+        directory = Config.DATASTORE_PATH if kind == "datastore" else Config.PROMPTS_PATH
+        files = {}
+        if directory.is_dir():
+            for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                known = assets["files"].get(entry.name)
+                if known and (known["mtime_ns"], known["size"]) == (
+                    stat.st_mtime_ns,
+                    stat.st_size,
+                ):
+                    files[entry.name] = known
+                    continue
+                try:
+                    text = Path(entry.path).read_text(encoding="utf-8")
+                except (OSError, UnicodeDecodeError) as e:
+                    print(
+                        f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error reading file {entry.name}:{Font_Colors.ENDC} {e}"
+                    )
+                    continue
+                files[entry.name] = {
+                    "text": text,
+                    "sha1": hashlib.sha1(text.encode("utf-8")).hexdigest(),
+                    "mtime_ns": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                }
+
+        assets["files"] = files
+        assets["checked_at"] = time.monotonic()
+        return files
+
+
 def get_files(
     file_type: Optional[str] = None, specific_files: Optional[List[str]] = None
 ) -> List[str]:
     """Get a list of files from the datastore directory."""
     # changing get_files as it was only getting the .txt files, to ensured it would also get community assets csv
     try:
-        if not Config.DATASTORE_PATH.exists():
-            return []
-
-        files = []
+        names = list(load_assets("datastore"))
 
         if specific_files:
-            files = [
-                f.name
-                for f in Config.DATASTORE_PATH.iterdir()
-                if f.is_file()
-                and f.name in specific_files
-                and not f.name.startswith(".")
-            ]
+            files = [name for name in names if name in specific_files]
 
         elif file_type:
             files = [
-                f.name
-                for f in Config.DATASTORE_PATH.iterdir()
-                if f.is_file()
-                and f.suffix.lower() == f".{file_type}"
-                and not f.name.startswith(".")
+                name for name in names if Path(name).suffix.lower() == f".{file_type}"
             ]
 
         else:
-            files = [
-                f.name
-                for f in Config.DATASTORE_PATH.iterdir()
-                if f.is_file() and not f.name.startswith(".")
-            ]
+            files = names
 
         # Ensure geocoding-community-assets.csv is always included
         if "geocoding-community-assets.csv" not in files:
@@ -660,119 +948,717 @@ def get_files(
 
 def get_file_content(filename: str) -> Optional[str]:
     """Read content from a file in the datastore."""
+    asset = load_assets("datastore").get(filename)
+    return asset["text"] if asset else None
+
+
+def get_prompt(filename: str) -> str:
+    """Read a prompt file, raising FileNotFoundError when it doesn't exist."""
+    asset = load_assets("prompts").get(filename)
+    if asset is None:
+        raise FileNotFoundError(
+            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error: File not found:{Font_Colors.ENDC} {Config.PROMPTS_PATH / filename}"
+        )
+    return asset["text"]
+
+
+#
+# Retrieval index. Datastore documents are split into passages of about RETRIEVAL_CHUNK_WORDS
+# words and indexed for BM25, so context_request=retrieval can send Gemini only the passages
+# that match a question instead of every document. The index is persisted to
+# RETRIEVAL_INDEX_PATH and rebuilt, reusing passages of unchanged files, when the datastore changes.
+#
+RETRIEVAL_TERM = re.compile(r"[a-z0-9]+")
+RETRIEVAL_STOPWORDS = frozenset(
+    "a about after all also an and any are as at be been but by can could do does for from had "
+    "has have how i if in into is it its more most my no not of on or our so than that the their "
+    "them then there these they this those to up was we were what when where which who why will "
+    "with would you your".split()
+)
+# BM25 term frequency saturation and length normalization
+RETRIEVAL_K1 = 1.5
+RETRIEVAL_B = 0.75
+
+retrieval_state = {"index": None}
+retrieval_lock = threading.Lock()
+
+
+def retrieval_terms(text: str) -> List[str]:
+    return [
+        term
+        for term in RETRIEVAL_TERM.findall(text.lower())
+        if term not in RETRIEVAL_STOPWORDS
+    ]
+
+
+def chunk_document(filename: str, text: str) -> List[str]:
+    """Split a document into passages at blank lines, or at rows for csv files (each passage repeats the header)."""
+    limit = Config.RETRIEVAL_CHUNK_WORDS
+    header = ""
+    if Path(filename).suffix.lower() == ".csv":
+        lines = text.splitlines()
+        header, blocks = (lines[0] + "\n" if lines else ""), lines[1:]
+    else:
+        blocks = []
+        for paragraph in re.split(r"\n\s*\n", text):
+            words = paragraph.split()
+            # Paragraphs longer than a passage are cut into passage-sized pieces
+            for start in range(0, len(words), limit):
+                blocks.append(" ".join(words[start : start + limit]))
+
+    chunks, current, size = [], [], 0
+    for block in blocks:
+        words = len(block.split())
+        if not words:
+            continue
+        if current and size + words > limit:
+            chunks.append(header + "\n".join(current))
+            current, size = [], 0
+        current.append(block)
+        size += words
+    if current:
+        chunks.append(header + "\n".join(current))
+    return chunks
+
+
+def index_document(filename: str, text: str) -> List[dict]:
+    chunks = []
+    for chunk in chunk_document(filename, text):
+        terms = retrieval_terms(chunk)
+        frequencies = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+        chunks.append(
+            {"file": filename, "text": chunk, "tf": frequencies, "length": len(terms)}
+        )
+    return chunks
+
+
+def prepare_retrieval_index(index: dict) -> dict:
+    """Add the postings (term -> [(chunk, tf)]) and average passage length used for scoring."""
+    postings = {}
+    for i, chunk in enumerate(index["chunks"]):
+        for term, tf in chunk["tf"].items():
+            postings.setdefault(term, []).append((i, tf))
+    index["postings"] = postings
+    index["avg_length"] = (
+        sum(chunk["length"] for chunk in index["chunks"]) / len(index["chunks"])
+        if index["chunks"]
+        else 0.0
+    )
+    return index
+
+
+def read_retrieval_index() -> Optional[dict]:
     try:
-        file_path = Config.DATASTORE_PATH / filename
-        if not file_path.exists():
-            return None
+        with open(Config.RETRIEVAL_INDEX_PATH, encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if isinstance(index, dict) and "chunks" in index else None
 
-        return file_path.read_text(encoding="utf-8")
 
-    except Exception as e:
+def write_retrieval_index(index: dict) -> None:
+    """Write the index atomically, workers may rebuild it at the same time."""
+    path = Config.RETRIEVAL_INDEX_PATH
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    stored = {key: index[key] for key in ("files", "chunk_words", "chunks")}
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(stored, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
         print(
-            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error reading file {filename}:{Font_Colors.ENDC} {e}"
+            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error writing retrieval index:{Font_Colors.ENDC} {e}"
         )
-        return None
 
 
-# DB Connection
+def get_retrieval_index() -> dict:
+    """The BM25 index for the current datastore, loaded from disk or rebuilt as needed."""
+    datastore = load_assets("datastore")
+    files = {name: asset["sha1"] for name, asset in datastore.items()}
+    with retrieval_lock:
+        index = retrieval_state["index"]
+        if index and index["files"] == files:
+            return index
+
+        stored = index or read_retrieval_index()
+        if stored and stored.get("chunk_words") != Config.RETRIEVAL_CHUNK_WORDS:
+            stored = None
+        if stored and stored["files"] == files:
+            index = stored
+        else:
+            # Reuse the passages of files whose content hasn't changed
+            count("retrieval_index_build")
+            known = stored["files"] if stored else {}
+            chunks = []
+            for name in sorted(files):
+                if known.get(name) == files[name]:
+                    chunks.extend(c for c in stored["chunks"] if c["file"] == name)
+                else:
+                    chunks.extend(index_document(name, datastore[name]["text"]))
+            index = {
+                "files": files,
+                "chunk_words": Config.RETRIEVAL_CHUNK_WORDS,
+                "chunks": chunks,
+            }
+            write_retrieval_index(index)
+
+        retrieval_state["index"] = prepare_retrieval_index(index)
+        return index
+
+
+@timed("retrieval")
+def retrieve_passages(question: str, top_k: Optional[int] = None) -> List[dict]:
+    """Best matching passages for a question by BM25 score, as {"file", "text", "score"}."""
+    index = get_retrieval_index()
+    chunks = index["chunks"]
+    scores = {}
+    for term in set(retrieval_terms(question)):
+        postings = index["postings"].get(term)
+        if not postings:
+            continue
+        idf = math.log(1 + (len(chunks) - len(postings) + 0.5) / (len(postings) + 0.5))
+        for i, tf in postings:
+            norm = 1 - RETRIEVAL_B + RETRIEVAL_B * chunks[i]["length"] / index["avg_length"]
+            scores[i] = scores.get(i, 0.0) + idf * tf * (RETRIEVAL_K1 + 1) / (
+                tf + RETRIEVAL_K1 * norm
+            )
+
+    best = heapq.nlargest(
+        top_k or Config.RETRIEVAL_TOP_K, scores.items(), key=lambda item: item[1]
+    )
+    return [
+        {"file": chunks[i]["file"], "text": chunks[i]["text"], "score": round(score, 3)}
+        for i, score in best
+    ]
+
+
+def retrieval_prompt(question: str) -> str:
+    """The passages for a question, to go ahead of it in the prompt."""
+    passages = retrieve_passages(question)
+    if not passages:
+        return "No passages from the documents matched this question."
+    return "Passages from the documents:\n\n" + "\n\n".join(
+        f"[{passage['file']}]\n{passage['text']}" for passage in passages
+    )
+
+
+#
+# DB Connection. MySQLConnectionPool.get_connection() fails at once when the pool is empty,
+# so checkouts first take one of DB_POOL_SIZE slots, waiting up to DB_POOL_TIMEOUT seconds.
+# The pool itself pings each connection on checkout and reconnects dead ones.
+#
+db_pool_slots = threading.BoundedSemaphore(Config.DB_POOL_SIZE)
+db_pool_stats = {
+    "in_use": 0,
+    "waiters": 0,
+    "checkouts": 0,
+    "timeouts": 0,
+    "recycled": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+}
+db_pool_stats_lock = threading.Lock()
+
+
+class Pooled_Connection:
+    """Pooled connection that gives its slot back when closed."""
+
+    def __init__(self, cnx):
+        self.cnx = cnx
+        self.closed = False
+
+    def __getattr__(self, name):
+        return getattr(self.cnx, name)
+
+    def __del__(self):
+        # A connection dropped without close() must not keep its slot
+        self.close()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.cnx.close()
+        finally:
+            with db_pool_stats_lock:
+                db_pool_stats["in_use"] -= 1
+            db_pool_slots.release()
+
+
 def get_db_connection():
     # return mysql.connector.connect(**Config.DB_CONFIG)
-    return db_pool.get_connection()
+    start = time.monotonic()
+    with db_pool_stats_lock:
+        db_pool_stats["waiters"] += 1
+    acquired = db_pool_slots.acquire(timeout=Config.DB_POOL_TIMEOUT)
+    waited = time.monotonic() - start
+    with db_pool_stats_lock:
+        db_pool_stats["waiters"] -= 1
+        if not acquired:
+            db_pool_stats["timeouts"] += 1
+        else:
+            db_pool_stats["in_use"] += 1
+            db_pool_stats["checkouts"] += 1
+            db_pool_stats["wait_seconds_total"] += waited
+            db_pool_stats["wait_seconds_max"] = max(
+                db_pool_stats["wait_seconds_max"], waited
+            )
+    if not acquired:
+        raise mysql.connector.errors.PoolError(
+            f"No database connection free after {Config.DB_POOL_TIMEOUT}s"
+        )
 
+    try:
+        cnx = db_pool.get_connection()
+        # Reopen connections older than DB_POOL_RECYCLE (server timeouts, failovers)
+        raw = cnx._cnx
+        connected_at = getattr(raw, "rethinkai_connected_at", None)
+        if connected_at is None:
+            raw.rethinkai_connected_at = time.monotonic()
+        elif time.monotonic() - connected_at > Config.DB_POOL_RECYCLE:
+            raw.reconnect()
+            raw.rethinkai_connected_at = time.monotonic()
+            with db_pool_stats_lock:
+                db_pool_stats["recycled"] += 1
+    except Exception:
+        with db_pool_stats_lock:
+            db_pool_stats["in_use"] -= 1
+        db_pool_slots.release()
+        raise
+    return Pooled_Connection(cnx)
+
+
+def get_db_pool_stats() -> dict:
+    with db_pool_stats_lock:
+        stats = dict(db_pool_stats)
+    stats["size"] = Config.DB_POOL_SIZE
+    stats["wait_seconds_avg"] = (
+        stats["wait_seconds_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+    )
+    return stats
 
-def json_query_results(query: str) -> Optional[Response]:
-    """Execute a database query and return results as JSON."""
+
+# Last result of the in_tnt_polygon check, see polygon_flags_current()
+polygon_flags_state = {"current": False, "checked_at": 0.0}
+
+
+def polygon_flags_current() -> bool:
+    """Check that in_tnt_polygon was computed for DEFAULT_POLYGON_COORDINATES."""
+    now = time.monotonic()
+    if now - polygon_flags_state["checked_at"] < Config.POLYGON_CHECK_INTERVAL:
+        return polygon_flags_state["current"]
+
+    current = False
     try:
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(query)
-        result = cursor.fetchall()
-        return jsonify(result) if result else None
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT value FROM derived_data_state WHERE name = 'tnt_polygon'"
+        )
+        row = cursor.fetchone()
+        current = bool(row) and row[0] == SQLConstants.DEFAULT_POLYGON_COORDINATES
+        if not current:
+            print(
+                f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ in_tnt_polygon is stale:{Font_Colors.ENDC} run setup/post_ingest.py, using ST_Contains() until then"
+            )
     except mysql.connector.Error as err:
         print(
-            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error in database connection (json_query_results):{Font_Colors.ENDC} {str(err)}"
+            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error in database connection (polygon_flags_current):{Font_Colors.ENDC} {str(err)}"
         )
-        return None
     finally:
         if "cursor" in locals() and cursor:
             cursor.close()
         if "conn" in locals() and conn:
             conn.close()
 
+    polygon_flags_state.update(current=current, checked_at=now)
+    return current
 
-def stream_query_results(query: str) -> Generator[str, None, None]:
-    """Execute a database query and stream results as JSON."""
-    conn = None
-    cursor = None
+
+def next_page_cursor(query_params: dict, page_limit: int) -> str:
+    """Return the after_id of the page following a keyset-paginated query, "" on the last page.
+
+    Looks ahead one row past the page with the same filters, selecting only ids, which the
+    311_by_geo indexes cover, so the page rows themselves are read once.
+    """
+    lookahead_query = build_311_query(
+        **{**query_params, "page_limit": page_limit + 1, "ids_only": True}
+    )
     try:
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(query)
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT id FROM ({lookahead_query}) AS page ORDER BY id LIMIT 2 OFFSET {page_limit - 1}"
+        )
+        ids = [row[0] for row in cursor.fetchall()]
+        return str(ids[0]) if len(ids) == 2 else ""
+    except mysql.connector.Error as err:
+        print(
+            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error in database connection (next_page_cursor):{Font_Colors.ENDC} {str(err)}"
+        )
+        return ""
+    finally:
+        if "cursor" in locals() and cursor:
+            cursor.close()
+        if "conn" in locals() and conn:
+            conn.close()
 
-        yield "[\n"
-        first_row = True
-        for row in cursor:
-            if not first_row:
-                yield ",\n"
-            else:
-                first_row = False
-
-            # Convert mysql objects to something json-friendly
-            processed_row = {}
-            for key, value in row.items():
-                if hasattr(value, "isoformat"):
-                    processed_row[key] = value.isoformat()
-                elif isinstance(value, decimal.Decimal):
-                    processed_row[key] = float(value)
-                else:
-                    processed_row[key] = value
-            yield json.dumps(processed_row)
 
-        # Close the JSON structure
-        yield "\n]"
+def json_query_results(query: str) -> Optional[Response]:
+    """Execute a database query and return results as JSON."""
+    timer = Stage_Timer()
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        with timer.stage("db_execute"):
+            cursor.execute(query)
+            result = cursor.fetchall()
+        with timer.stage("row_serialization"):
+            return jsonify(result) if result else None
+    except mysql.connector.Error as err:
+        count("db_error")
+        print(
+            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error in database connection (json_query_results):{Font_Colors.ENDC} {str(err)}"
+        )
+        return None
+    finally:
+        timer.record()
+        if "cursor" in locals() and cursor:
+            cursor.close()
+        if "conn" in locals() and conn:
+            conn.close()
+
+
+def json_value(value) -> str:
+    """Encode any value as JSON, converting mysql objects to something json-friendly."""
+    if hasattr(value, "isoformat"):
+        return '"' + value.isoformat() + '"'
+    elif isinstance(value, decimal.Decimal):
+        return float.__repr__(float(value))
+    return json.dumps(value)
+
+
+# MySQL column types -> JSON encoders for non-NULL values; anything else uses json_value
+JSON_FIELD_ENCODERS = {
+    FieldType.TINY: int.__repr__,
+    FieldType.SHORT: int.__repr__,
+    FieldType.INT24: int.__repr__,
+    FieldType.LONG: int.__repr__,
+    FieldType.LONGLONG: int.__repr__,
+    FieldType.FLOAT: float.__repr__,
+    FieldType.DOUBLE: float.__repr__,
+    FieldType.DECIMAL: lambda value: float.__repr__(float(value)),
+    FieldType.NEWDECIMAL: lambda value: float.__repr__(float(value)),
+    FieldType.DATE: lambda value: '"' + value.isoformat() + '"',
+    FieldType.DATETIME: lambda value: '"' + value.isoformat() + '"',
+    FieldType.TIMESTAMP: lambda value: '"' + value.isoformat() + '"',
+    FieldType.VAR_STRING: lambda value: (
+        encode_basestring_ascii(value) if type(value) is str else json_value(value)
+    ),
+    FieldType.STRING: lambda value: (
+        encode_basestring_ascii(value) if type(value) is str else json_value(value)
+    ),
+}
+
+
+def json_row_encoder(description) -> Callable[[tuple], str]:
+    """Build a row -> JSON object encoder from a cursor description.
+
+    Produces the same text as json.dumps() on the equivalent dict.
+    """
+    columns = [
+        (
+            encode_basestring_ascii(desc[0]) + ": ",
+            JSON_FIELD_ENCODERS.get(desc[1], json_value),
+        )
+        for desc in description
+    ]
+
+    def encode(row: tuple) -> str:
+        return (
+            "{"
+            + ", ".join(
+                [
+                    key + ("null" if value is None else encoder(value))
+                    for (key, encoder), value in zip(columns, row)
+                ]
+            )
+            + "}"
+        )
+
+    return encode
+
+
+# Last chunk stream_query_results yields when the query fails
+STREAM_ERROR_CHUNK = "[]\n"
+
+
+def stream_query_results(
+    query: str, framing: str = "json"
+) -> Generator[str, None, None]:
+    """Execute a database query and stream results as a JSON array or as NDJSON.
+
+    Rows are fetched in blocks and sent in ~STREAM_CHUNK_BYTES chunks. The JSON array
+    keeps one object per line ("[\\n", ",\\n" and "\\n]") as clients split on it.
+    """
+    conn = None
+    cursor = None
+    timer = Stage_Timer()
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        with timer.stage("db_execute"):
+            cursor.execute(query)
+        encode = json_row_encoder(cursor.description)
+
+        if framing == "ndjson":
+            opening, separator, closing = "", "\n", "\n"
+        else:
+            opening, separator, closing = "[\n", ",\n", "\n]"
+
+        chunk = [opening]
+        chunk_size = 0
+        first_row = True
+        while True:
+            with timer.stage("db_execute"):
+                rows = cursor.fetchmany(Config.STREAM_FETCH_ROWS)
+            if not rows:
+                break
+
+            with timer.stage("row_serialization"):
+                for row in rows:
+                    text = encode(row)
+                    if first_row:
+                        first_row = False
+                    else:
+                        chunk.append(separator)
+                    chunk.append(text)
+                    chunk_size += len(text)
+
+            if chunk_size >= Config.STREAM_CHUNK_BYTES:
+                yield "".join(chunk)
+                chunk = []
+                chunk_size = 0
+
+        # NDJSON has no closing for an empty result
+        if framing != "ndjson" or not first_row:
+            chunk.append(closing)
+        yield "".join(chunk)
     except mysql.connector.Error as err:
+        count("db_error")
         print(
             f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error in database connection (stream_query_results):{Font_Colors.ENDC} {str(err)}"
         )
-        yield "[]\n"  # Return empty array on error
+        if framing == "ndjson":
+            raise  # no in-band error value, a truncated stream is the error
+        yield STREAM_ERROR_CHUNK  # Return empty array on error
     finally:
+        timer.record()
         if cursor:
             cursor.close()
         if conn:
             conn.close()
 
 
-def csv_query_results(query: str) -> Optional[io.StringIO]:
-    """Execute a database query and return results as CSV in a StringIO object."""
+def csv_query_results(query: str) -> Generator[str, None, None]:
+    """Execute a database query and stream results as CSV.
+
+    Rows are written from fetchmany() blocks into a small buffer that is sent every
+    ~STREAM_CHUNK_BYTES, so memory stays flat regardless of result size.
+    """
+    conn = None
+    cursor = None
+    timer = Stage_Timer()
     try:
         conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        cursor.execute(query)
-
-        fieldnames = [desc[0] for desc in cursor.description]
-        result = io.StringIO()
-        writer = csv.DictWriter(result, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in cursor:
-            writer.writerow(row)
-        return result
+        cursor = conn.cursor()
+        with timer.stage("db_execute"):
+            cursor.execute(query)
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([desc[0] for desc in cursor.description])
+        while True:
+            with timer.stage("db_execute"):
+                rows = cursor.fetchmany(Config.STREAM_FETCH_ROWS)
+            if not rows:
+                break
+
+            with timer.stage("row_serialization"):
+                writer.writerows(rows)
+            if buffer.tell() >= Config.STREAM_CHUNK_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        yield buffer.getvalue()
     except mysql.connector.Error as err:
+        # CSV has no in-band error value; a truncated stream is the error
+        count("db_error")
         print(
             f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error in database connection (csv_query_results):{Font_Colors.ENDC} {str(err)}"
         )
-        return None
+        raise
     finally:
-        if "cursor" in locals() and cursor:
+        timer.record()
+        if cursor:
             cursor.close()
-        if "conn" in locals() and conn:
+        if conn:
+            conn.close()
+
+
+# Content-Encoding -> zlib wbits (gzip header, or the zlib wrapper HTTP calls deflate)
+STREAM_ENCODINGS = {"gzip": 31, "deflate": 15}
+
+
+def compress_stream(
+    chunks: Generator[Union[str, bytes], None, None], encoding: str
+) -> Generator[bytes, None, None]:
+    """Compress a streamed response on the fly with gzip or deflate."""
+    compressor = zlib.compressobj(wbits=STREAM_ENCODINGS[encoding])
+    for chunk in chunks:
+        data = compressor.compress(
+            chunk if isinstance(chunk, bytes) else chunk.encode("utf-8")
+        )
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class Stream_Sink(io.RawIOBase):
+    """Write-only file for pyarrow writers that hands back what was written since the last drain."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # Writers record offsets from tell(), so it has to count everything written
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+# MySQL column types -> arrow types; anything else is sent as a dictionary-encoded string
+ARROW_FIELD_TYPES = {
+    FieldType.TINY: pa.int64(),
+    FieldType.SHORT: pa.int64(),
+    FieldType.INT24: pa.int64(),
+    FieldType.LONG: pa.int64(),
+    FieldType.LONGLONG: pa.int64(),
+    FieldType.YEAR: pa.int64(),
+    FieldType.FLOAT: pa.float64(),
+    FieldType.DOUBLE: pa.float64(),
+    FieldType.DECIMAL: pa.float64(),
+    FieldType.NEWDECIMAL: pa.float64(),
+    FieldType.DATE: pa.date32(),
+    FieldType.DATETIME: pa.timestamp("us"),
+    FieldType.TIMESTAMP: pa.timestamp("us"),
+}
+
+
+def arrow_schema(description) -> pa.Schema:
+    """Build an arrow schema from a cursor description."""
+    return pa.schema(
+        [
+            pa.field(
+                desc[0],
+                ARROW_FIELD_TYPES.get(desc[1], pa.dictionary(pa.int32(), pa.string())),
+            )
+            for desc in description
+        ]
+    )
+
+
+def arrow_record_batch(rows: list, schema: pa.Schema) -> pa.RecordBatch:
+    """Convert a block of tuple rows into a typed record batch."""
+    arrays = []
+    for field, values in zip(schema, zip(*rows)):
+        if pa.types.is_floating(field.type):
+            values = [float(v) if v is not None else None for v in values]
+            arrays.append(pa.array(values, type=field.type))
+        elif pa.types.is_dictionary(field.type):
+            values = [str(v) if v is not None else None for v in values]
+            arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def arrow_query_results(
+    query: str, output_type: str = "arrow"
+) -> Generator[bytes, None, None]:
+    """Execute a database query and stream results as arrow IPC record batches or parquet row groups."""
+    conn = None
+    cursor = None
+    timer = Stage_Timer()
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        with timer.stage("db_execute"):
+            cursor.execute(query)
+
+        schema = arrow_schema(cursor.description)
+        sink = Stream_Sink()
+        if output_type == "parquet":
+            writer = pq.ParquetWriter(sink, schema)
+        else:
+            writer = pa.ipc.new_stream(sink, schema)
+
+        while True:
+            with timer.stage("db_execute"):
+                rows = cursor.fetchmany(Config.ARROW_BATCH_ROWS)
+            if not rows:
+                break
+            with timer.stage("row_serialization"):
+                if output_type == "parquet":
+                    writer.write_table(
+                        pa.Table.from_batches([arrow_record_batch(rows, schema)])
+                    )
+                else:
+                    writer.write_batch(arrow_record_batch(rows, schema))
+            yield sink.drain()
+
+        writer.close()
+        yield sink.drain()
+    except mysql.connector.Error as err:
+        # Binary formats have no in-band error value; a truncated stream is the error
+        count("db_error")
+        print(
+            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error in database connection (arrow_query_results):{Font_Colors.ENDC} {str(err)}"
+        )
+        raise
+    finally:
+        timer.record()
+        if cursor:
+            cursor.close()
+        if conn:
             conn.close()
 
 
 def get_query_results(query: str, output_type: str = ""):
     if output_type == "stream":
         return stream_query_results(query)
+    elif output_type == "ndjson":
+        return stream_query_results(query, framing="ndjson")
     elif output_type == "csv":
         return csv_query_results(query)
+    elif output_type == "arrow" or output_type == "parquet":
+        return arrow_query_results(query, output_type)
     elif output_type == "json" or output_type == "":
         return json_query_results(query)
     else:
@@ -781,37 +1667,542 @@ def get_query_results(query: str, output_type: str = ""):
         )
 
 
+# Output types returned as a generator, and the mimetype they are sent with
+STREAMED_MIMETYPES = {
+    "stream": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+#
+# Response cache for /data/query. Data only changes when ingest runs, so repeated
+# requests with the same parameters are served from memory until the data version changes.
+#
+response_cache = TTLCache(
+    maxsize=Config.RESPONSE_CACHE_MAX_BYTES,
+    ttl=Config.RESPONSE_CACHE_TTL,
+    getsizeof=lambda entry: len(entry["body"]),
+)
+response_cache_lock = threading.Lock()
+response_cache_stats = {"hits": 0, "misses": 0, "not_modified": 0}
+
+
+def response_cache_key(**params) -> str:
+    """Build a cache key from normalized /data/query parameters and the data version."""
+    for name in ("event_ids", "cells"):
+        if params.get(name):
+            # Selections can be long, key on a hash of the normalized list
+            selection = ",".join(split_selection(params[name]))
+            params[name] = hashlib.sha1(selection.encode()).hexdigest()
+    # Each worker has its own cache, a new post_ingest run makes all of them miss
+    params["data_version"] = get_data_version()
+    return json.dumps(params, sort_keys=True)
+
+
+def get_cached_response(key: str) -> Optional[dict]:
+    """Look up a cached response, counting the hit or miss."""
+    with response_cache_lock:
+        entry = response_cache.get(key)
+        response_cache_stats["hits" if entry else "misses"] += 1
+    count("response_cache_hit" if entry else "response_cache_miss")
+    return entry
+
+
+def set_cached_response(
+    key: str, body: bytes, mimetype: str, headers: Optional[dict] = None
+) -> dict:
+    """Store a response body, skipping bodies too large to cache. Returns the entry."""
+    entry = {
+        "body": body,
+        "mimetype": mimetype,
+        "headers": headers or {},
+        "etag": hashlib.sha1(body).hexdigest(),
+    }
+    if len(body) <= Config.RESPONSE_CACHE_MAX_ENTRY_BYTES:
+        with response_cache_lock:
+            try:
+                response_cache[key] = entry
+            except ValueError:  # larger than the whole cache
+                pass
+    return entry
+
+
+def make_cached_response(entry: dict, cache_status: str) -> Response:
+    """Build a response for a cache entry, answering If-None-Match with 304."""
+    response = Response(
+        entry["body"], mimetype=entry["mimetype"], headers=entry["headers"]
+    )
+    response.set_etag(entry["etag"])
+    response.headers["Cache-Control"] = f"private, max-age={Config.RESPONSE_CACHE_TTL}"
+    response.headers["X-Cache"] = cache_status
+    response.make_conditional(request)
+    if response.status_code == 304:
+        with response_cache_lock:
+            response_cache_stats["not_modified"] += 1
+    return response
+
+
+def cache_stream(
+    key: str,
+    chunks: Generator[str, None, None],
+    mimetype: str,
+    headers: Optional[dict] = None,
+) -> Generator[str, None, None]:
+    """Pass a streamed response through, caching it once it completes successfully."""
+    body = []
+    size = 0
+    for chunk in chunks:
+        yield chunk
+        if body is not None:
+            data = chunk if isinstance(chunk, bytes) else chunk.encode("utf-8")
+            size += len(data)
+            body.append(data)
+            if size > Config.RESPONSE_CACHE_MAX_ENTRY_BYTES:
+                body = None
+
+    if body and body[-1] != STREAM_ERROR_CHUNK.encode("utf-8"):
+        set_cached_response(key, b"".join(body), mimetype, headers)
+
+
+#
+# Gemini calls run on one background event loop per process through the SDK's async client.
+# At most GEMINI_MAX_CONCURRENT are in flight and GEMINI_MAX_QUEUED more may wait; past that
+# requests are turned away. The request thread still waits for its call, so admission is
+# also capped at WORKER_THREADS - DATA_RESERVED_THREADS: slow generations can't tie up the
+# threads /data/query needs. Meant for gunicorn's gthread worker with --threads WORKER_THREADS.
+#
+class Gemini_Busy(Exception):
+    """Raised when the Gemini call queue is full or a call doesn't finish in time."""
+
+
+gemini_executor = {"loop": None, "pid": None, "semaphore": None, "pending": 0}
+gemini_executor_lock = threading.Lock()
+
+
+def get_gemini_loop() -> asyncio.AbstractEventLoop:
+    """Start the Gemini event loop thread, again after a fork (the thread doesn't survive it)."""
+    with gemini_executor_lock:
+        if gemini_executor["pid"] != os.getpid():
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="gemini-loop", daemon=True
+            ).start()
+            gemini_executor.update(
+                loop=loop,
+                pid=os.getpid(),
+                semaphore=asyncio.Semaphore(Config.GEMINI_MAX_CONCURRENT),
+                pending=0,
+            )
+        return gemini_executor["loop"]
+
+
+async def gemini_generate(**kwargs):
+    async with gemini_executor["semaphore"]:
+        return await genai_client.aio.models.generate_content(**kwargs)
+
+
+async def gemini_generate_stream(chunks: queue.Queue, **kwargs) -> None:
+    """Relay streamed chunks to a waiting request thread through a queue."""
+    try:
+        async with gemini_executor["semaphore"]:
+            async for chunk in await genai_client.aio.models.generate_content_stream(
+                **kwargs
+            ):
+                chunks.put(("chunk", chunk))
+        chunks.put(("done", None))
+    except Exception as e:
+        chunks.put(("error", e))
+
+
+def gemini_admission_limit() -> int:
+    """Gemini calls admitted per process, in flight or queued."""
+    return max(
+        1,
+        min(
+            Config.GEMINI_MAX_CONCURRENT + Config.GEMINI_MAX_QUEUED,
+            Config.WORKER_THREADS - Config.DATA_RESERVED_THREADS,
+        ),
+    )
+
+
+def admit_gemini_call() -> asyncio.AbstractEventLoop:
+    """Take a place in the Gemini queue, or raise Gemini_Busy. Returns the loop to run on."""
+    loop = get_gemini_loop()
+    with gemini_executor_lock:
+        if gemini_executor["pending"] >= gemini_admission_limit():
+            raise Gemini_Busy("Too many chat requests in progress, try again shortly")
+        gemini_executor["pending"] += 1
+    return loop
+
+
+def release_gemini_call() -> None:
+    with gemini_executor_lock:
+        gemini_executor["pending"] -= 1
+
+
+def run_gemini_call(**kwargs):
+    """Run generate_content on the Gemini loop and wait for it, within the concurrency cap."""
+    loop = admit_gemini_call()
+    future = asyncio.run_coroutine_threadsafe(gemini_generate(**kwargs), loop)
+    try:
+        return future.result(timeout=Config.GEMINI_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise Gemini_Busy(f"Gemini call timed out after {Config.GEMINI_TIMEOUT}s")
+    finally:
+        release_gemini_call()
+
+
+def run_gemini_stream(**kwargs) -> Generator:
+    """Run generate_content_stream on the Gemini loop, yielding chunks as they arrive."""
+    loop = admit_gemini_call()
+    chunks = queue.Queue()
+    future = asyncio.run_coroutine_threadsafe(
+        gemini_generate_stream(chunks, **kwargs), loop
+    )
+    deadline = time.monotonic() + Config.GEMINI_TIMEOUT
+    try:
+        while True:
+            try:
+                kind, value = chunks.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise Gemini_Busy(
+                    f"Gemini call timed out after {Config.GEMINI_TIMEOUT}s"
+                )
+            if kind == "chunk":
+                yield value
+            elif kind == "error":
+                raise value
+            else:
+                return
+    finally:
+        # Stops generation if the client went away
+        future.cancel()
+        release_gemini_call()
+
+
+class Context_Cache_Missing(Exception):
+    """Raised when a generation references a context cache that no longer exists."""
+
+
+def gemini_config(
+    cache_name: str, structured_response: bool = False, system_instruction: str = ""
+) -> types.GenerateContentConfig:
+    if structured_response is True:
+        return types.GenerateContentConfig(
+            cached_content=cache_name if cache_name else None,
+            system_instruction=system_instruction or None,
+            response_schema=list[Structured_Data],
+            response_mime_type="application/json",
+        )
+    return types.GenerateContentConfig(
+        cached_content=cache_name if cache_name else None,
+        system_instruction=system_instruction or None,
+    )
+
+
+@timed("generation")
 def get_gemini_response(
-    prompt: str, cache_name: str, structured_response: bool = False
+    prompt: str,
+    cache_name: str,
+    structured_response: bool = False,
+    system_instruction: str = "",
 ) -> str:
     try:
-        model = Config.GEMINI_MODEL
-        if structured_response is True:
-            config = types.GenerateContentConfig(
-                cached_content=cache_name if cache_name else None,
-                response_schema=list[Structured_Data],
-                response_mime_type="application/json",
-            )
-        else:
-            config = types.GenerateContentConfig(
-                cached_content=cache_name if cache_name else None
-            )
-
-        # Direct synchronous call instead of asyncio.to_thread
-        response = genai_client.models.generate_content(
-            model=model,
+        response = run_gemini_call(
+            model=Config.GEMINI_MODEL,
             contents=prompt,
-            config=config,
+            config=gemini_config(cache_name, structured_response, system_instruction),
         )
         return response.text
 
+    except Gemini_Busy:
+        count("gemini_busy")
+        raise
+    except genai_errors.ClientError as e:
+        count("gemini_error")
+        # Caches expire or get deleted by other workers between lookup and use
+        if cache_name and (e.code == 404 or "not found" in str(e).lower()):
+            raise Context_Cache_Missing(cache_name) from e
+        print(
+            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error generating response:{Font_Colors.ENDC} {e}"
+        )
+        return f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error generating response:{Font_Colors.ENDC} {e}"
     except Exception as e:
+        count("gemini_error")
         print(
             f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error generating response:{Font_Colors.ENDC} {e}"
         )
         return f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error generating response:{Font_Colors.ENDC} {e}"
 
 
+def stream_gemini_response(
+    prompt: str,
+    cache_name: str,
+    structured_response: bool = False,
+    system_instruction: str = "",
+) -> Generator[str, None, None]:
+    """Yield response text as Gemini generates it. Errors are raised, not returned as text."""
+    start = time.perf_counter()
+    try:
+        for chunk in run_gemini_stream(
+            model=Config.GEMINI_MODEL,
+            contents=prompt,
+            config=gemini_config(cache_name, structured_response, system_instruction),
+        ):
+            if chunk.text:
+                yield chunk.text
+    except Gemini_Busy:
+        count("gemini_busy")
+        raise
+    except genai_errors.ClientError as e:
+        count("gemini_error")
+        if cache_name and (e.code == 404 or "not found" in str(e).lower()):
+            raise Context_Cache_Missing(cache_name) from e
+        raise
+    finally:
+        observe("stage", "generation", time.perf_counter() - start)
+
+
+def sse_event(data: dict, event: str = "") -> str:
+    """Format one Server-Sent Event."""
+    lines = f"event: {event}\n" if event else ""
+    return lines + f"data: {json.dumps(data)}\n\n"
+
+
+#
+# Registry of Gemini context caches, (app_version, context_request, is_spatial, model) ->
+# {"name", "expire_time", "last_used"}. Filled from one caches.list() and kept current on create/delete,
+# so a chat turn doesn't list every cache to find its own.
+#
+context_cache_registry = {}
+context_cache_registry_lock = threading.Lock()
+# Caches this close to expiring are treated as gone
+CONTEXT_CACHE_EXPIRY_MARGIN = datetime.timedelta(seconds=60)
+
+
+# Context requests built from the 311 / 911 summary plus the datastore text files
+SUMMARY_CONTEXTS = ("experiment_5", "experiment_6", "experiment_7", "experiment_pit")
+
+
+def context_files(context_request: str) -> Optional[List[str]]:
+    """Datastore files a context request is built from, None for unknown requests."""
+    if context_request == "structured":
+        # adding community assets to context (ignoring potential other csv in datastore)
+        return get_files("csv", ["geocoding-community-assets.csv"])
+    elif context_request == "unstructured" or context_request in SUMMARY_CONTEXTS:
+        return get_files("txt")
+    elif context_request == "all":
+        return get_files()
+    return None
+
+
+def context_bundle_hash(context_request: str) -> str:
+    """Short content hash of the datastore files and system prompt a context is built from."""
+    datastore = load_assets("datastore")
+    prompts = load_assets("prompts")
+    digest = hashlib.sha1()
+    for name in sorted(context_files(context_request) or []):
+        digest.update(f"{name}:{datastore.get(name, {}).get('sha1', '')}\n".encode())
+    preamble_file = context_request + ".txt"
+    digest.update(f"{preamble_file}:{prompts.get(preamble_file, {}).get('sha1', '')}".encode())
+    return digest.hexdigest()[:12]
+
+
+def context_cache_key(app_version: str, context_request: str, is_spatial: bool) -> tuple:
+    """Registry key; a new bundle hash after documents change means a new cache."""
+    return (
+        app_version,
+        context_request,
+        is_spatial,
+        # listed caches report the model as "models/<name>"
+        Config.GEMINI_MODEL.split("/")[-1],
+        context_bundle_hash(context_request),
+    )
+
+
+def context_cache_display_name(
+    app_version: str, context_request: str, is_spatial: bool = False, assets_hash: str = ""
+) -> str:
+    display_name = "APP_VERSION_" + app_version + "_REQUEST_" + context_request
+    if is_spatial:
+        display_name += "_SPATIAL"
+    return display_name + "_ASSETS_" + assets_hash if assets_hash else display_name
+
+
+@timed("context_cache_lookup")
+def load_context_cache_registry() -> None:
+    """Rebuild the registry from the caches that exist on the Gemini side."""
+    entries = {}
+    for cache in genai_client.caches.list():
+        match = re.match(
+            r"^APP_VERSION_(.*)_REQUEST_(.*?)(_SPATIAL)?(?:_ASSETS_([0-9a-f]+))?$",
+            cache.display_name or "",
+        )
+        if match:
+            key = (
+                match.group(1),
+                match.group(2),
+                bool(match.group(3)),
+                (cache.model or "").split("/")[-1],
+                match.group(4) or "",
+            )
+            entries[key] = {
+                "name": cache.name,
+                "expire_time": cache.expire_time,
+                "last_used": None,
+            }
+
+    with context_cache_registry_lock:
+        # Keep usage of caches this process already knew about
+        for key, entry in entries.items():
+            known = context_cache_registry.get(key)
+            if known and known["name"] == entry["name"]:
+                entry["last_used"] = known["last_used"]
+        context_cache_registry.clear()
+        context_cache_registry.update(entries)
+
+
+def register_context_cache(key: tuple, cache) -> None:
+    with context_cache_registry_lock:
+        known = context_cache_registry.get(key)
+        context_cache_registry[key] = {
+            "name": cache.name,
+            "expire_time": cache.expire_time,
+            "last_used": known["last_used"] if known else None,
+        }
+
+
+def forget_context_cache(cache_name: str) -> None:
+    with context_cache_registry_lock:
+        for key in [
+            key
+            for key, entry in context_cache_registry.items()
+            if entry["name"] == cache_name
+        ]:
+            del context_cache_registry[key]
+
+
+def retire_context_caches(key: tuple) -> None:
+    """Delete caches for the same context built from older documents (another bundle hash)."""
+    with context_cache_registry_lock:
+        retired = [
+            entry["name"]
+            for other, entry in context_cache_registry.items()
+            if other[:4] == key[:4] and other[4] != key[4]
+        ]
+    for cache_name in retired:
+        try:
+            genai_client.caches.delete(name=cache_name)
+        except genai_errors.APIError:
+            pass  # already gone
+        forget_context_cache(cache_name)
+
+
+def find_context_cache(key: tuple, touch: bool = True) -> Optional[str]:
+    """Return the cache name for a key if it is registered and not about to expire.
+
+    touch marks the cache as in use, so the refresher keeps extending it.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    with context_cache_registry_lock:
+        entry = context_cache_registry.get(key)
+        if not entry or (
+            entry["expire_time"]
+            and entry["expire_time"] - CONTEXT_CACHE_EXPIRY_MARGIN <= now
+        ):
+            return None
+        if touch:
+            entry["last_used"] = now
+        return entry["name"]
+
+
+def context_cache_expire_time() -> str:
+    """Expiry for a cache created or extended now."""
+    return (
+        (
+            datetime.datetime.now(datetime.timezone.utc)
+            + datetime.timedelta(days=Config.GEMINI_CACHE_TTL)
+        )
+        .isoformat()
+        .replace("+00:00", "Z")
+    )
+
+
+# Per-key locks so one thread per process builds a given cache
+context_cache_build_locks = {}
+
+
+def try_context_cache_lock(lock_name: str):
+    """Take a MySQL named lock without waiting. Returns the connection holding it, or None."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (lock_name,))
+        acquired = cursor.fetchone()[0] == 1
+        cursor.close()
+    except mysql.connector.Error:
+        conn.close()
+        raise
+    if acquired:
+        return conn
+    conn.close()
+    return None
+
+
+@contextlib.contextmanager
+def context_cache_single_flight(cache_key: tuple):
+    """Hold the build lock for a context cache, within this process and across workers.
+
+    Yields whether the lock was taken. Across processes the lock is a MySQL named lock, released
+    if the holder's connection drops. While another worker builds, the lock is polled every
+    GEMINI_CACHE_LOCK_POLL seconds so no pooled connection is held for the wait; after
+    GEMINI_CACHE_BUILD_TIMEOUT this yields False and the caller must not build.
+    """
+    with context_cache_registry_lock:
+        thread_lock = context_cache_build_locks.setdefault(cache_key, threading.Lock())
+
+    if not thread_lock.acquire(timeout=Config.GEMINI_CACHE_BUILD_TIMEOUT):
+        yield False
+        return
+
+    lock_name = "gemini_cache_" + hashlib.sha1(repr(cache_key).encode()).hexdigest()
+    conn = None
+    try:
+        deadline = time.monotonic() + Config.GEMINI_CACHE_BUILD_TIMEOUT
+        while True:
+            try:
+                conn = try_context_cache_lock(lock_name)
+            except mysql.connector.Error as err:
+                print(
+                    f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error in database connection (context_cache_single_flight):{Font_Colors.ENDC} {str(err)}"
+                )
+                break
+            if conn or time.monotonic() >= deadline:
+                break
+            time.sleep(Config.GEMINI_CACHE_LOCK_POLL)
+
+        if not conn:
+            print(
+                f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Timed out waiting for context cache build:{Font_Colors.ENDC} {cache_key}"
+            )
+        yield conn is not None
+    finally:
+        if conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (lock_name,))
+                cursor.fetchone()
+                cursor.close()
+            except mysql.connector.Error:
+                pass
+            conn.close()
+        thread_lock.release()
+
+
 def create_gemini_context(
     context_request: str,
     preamble: str = "",
@@ -819,106 +2210,704 @@ def create_gemini_context(
     app_version: str = "",
     is_spatial: bool = False,
 ) -> Union[str, int, bool]:
-    # test if cache exists
-    if generate_cache:
-        for cache in genai_client.caches.list():
-            if (
-                cache.display_name
-                == "APP_VERSION_" + app_version + "_REQUEST_" + context_request
-                and cache.model == Config.GEMINI_MODEL
-            ):
+    cache_key = context_cache_key(app_version, context_request, is_spatial)
+
+    if not generate_cache:
+        return build_gemini_context(cache_key, generate_cache=False)
+
+    # test if cache exists, listing caches only when this process hasn't seen it
+    cache_name = find_context_cache(cache_key)
+    if cache_name:
+        count("context_cache_hit")
+        return cache_name
+
+    # One request builds the cache, the others wait here and reuse its name
+    with context_cache_single_flight(cache_key) as acquired:
+        load_context_cache_registry()
+        cache_name = find_context_cache(cache_key)
+        if cache_name:
+            count("context_cache_listed")
+            return cache_name
+
+        # Never build without the lock, that is how duplicate caches get made
+        if not acquired:
+            count("context_cache_wait_timeout")
+            raise Gemini_Busy("Context cache is still being built, try again shortly")
+
+        count("context_cache_build")
+        return build_gemini_context(cache_key, generate_cache=True)
+
+
+@timed("context_cache_build")
+def build_gemini_context(cache_key: tuple, generate_cache: bool = True) -> Union[str, int]:
+    """Build the context for a request and create its cache, or return its token count."""
+    app_version, context_request, is_spatial, _, assets_hash = cache_key
+    try:
+        content = {"parts": []}
+
+        files_list = context_files(context_request)
+        if files_list is None:
+            raise ValueError(f"Unknown context_request: {context_request}")
+
+        if context_request in SUMMARY_CONTEXTS:
+            content["parts"].append({"text": context_summary_csv(is_spatial)})
+
+        # Read contents of found files
+        for file in files_list:
+            print("specific file", file)
+            file_content = get_file_content(file)
+            if file_content is not None:
+                content["parts"].append({"text": file_content})
+
+        system_prompt = get_prompt(context_request + ".txt")
+
+        display_name = context_cache_display_name(
+            app_version, context_request, is_spatial, assets_hash
+        )
+
+        # Generate cache or return token count
+        if generate_cache:
+            # Create the cache
+            cache = genai_client.caches.create(
+                model=Config.GEMINI_MODEL,
+                config=types.CreateCachedContentConfig(
+                    display_name=display_name,
+                    system_instruction=system_prompt,
+                    expire_time=context_cache_expire_time(),
+                    contents=content["parts"],
+                ),
+            )
+            register_context_cache(cache_key, cache)
+            retire_context_caches(cache_key)
+
+            return cache.name
+        else:
+            # Return token count for testing
+            content["parts"].append({"text": system_prompt})
+            total_tokens = genai_client.models.count_tokens(
+                model=Config.GEMINI_MODEL, contents=content["parts"]
+            )
+            return total_tokens.total_tokens
+
+    except Exception as e:
+        print(
+            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error generating context:{Font_Colors.ENDC} {e}"
+        )
+        return f"✖ Error generating context: {e}"
+
+
+def context_summary_csv(is_spatial: bool) -> str:
+    """The 311 / 911 summary part of the experiment contexts, as csv."""
+    query = build_311_query(data_request="311_summary_context", is_spatial=is_spatial)
+    start = time.perf_counter()
+    text = "".join(get_query_results(query=query, output_type="csv"))
+    observe("stage", "context_sql", time.perf_counter() - start)
+    # Cache builds keep the token estimate for the summary current at no extra cost
+    key, tokens = (is_spatial, get_data_version()), estimate_tokens(text, "csv")
+    with token_estimate_lock:
+        token_estimates["summary"][key] = tokens
+    return text
+
+
+#
+# Local token estimates for GET /chat/context, so dashboards polling it cost neither Gemini
+# calls nor context SQL. Tokens are estimated from characters per token, per kind of text,
+# measured against Gemini's count_tokens on our own documents (option=calibrate). Estimates
+# are kept by content hash for datastore and prompt files, and by data version for the summary.
+#
+TOKEN_KINDS = ("text", "csv")
+# Used until a calibration has been run; csv digits and separators take more tokens per character
+DEFAULT_CHARS_PER_TOKEN = {"text": 4.0, "csv": 3.0}
+
+token_calibration = {"mtime_ns": None, "kinds": {}}
+token_estimates = {"assets": {}, "summary": {}}
+token_estimate_lock = threading.Lock()
+
+
+def token_kind(filename: str) -> str:
+    return "csv" if Path(filename).suffix.lower() == ".csv" else "text"
+
+
+def chars_per_token(kind: str) -> float:
+    """Calibrated characters per token, rereading the calibration file when another worker wrote it."""
+    try:
+        mtime_ns = os.stat(Config.TOKEN_CALIBRATION_PATH).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    with token_estimate_lock:
+        if mtime_ns != token_calibration["mtime_ns"]:
+            kinds = {}
+            if mtime_ns is not None:
+                try:
+                    with open(Config.TOKEN_CALIBRATION_PATH, encoding="utf-8") as f:
+                        kinds = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(
+                        f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error reading token calibration:{Font_Colors.ENDC} {e}"
+                    )
+            token_calibration.update(mtime_ns=mtime_ns, kinds=kinds)
+            token_estimates["assets"].clear()
+            token_estimates["summary"].clear()
+        measured = token_calibration["kinds"].get(kind)
+    if measured and measured.get("tokens"):
+        return measured["chars"] / measured["tokens"]
+    return DEFAULT_CHARS_PER_TOKEN[kind]
+
+
+def estimate_tokens(text: str, kind: str = "text") -> int:
+    return math.ceil(len(text) / chars_per_token(kind)) if text else 0
+
+
+def asset_tokens(name: str, asset: dict) -> int:
+    kind = token_kind(name)
+    ratio = chars_per_token(kind)
+    with token_estimate_lock:
+        tokens = token_estimates["assets"].get(asset["sha1"])
+    if tokens is None:
+        tokens = math.ceil(len(asset["text"]) / ratio) if asset["text"] else 0
+        with token_estimate_lock:
+            token_estimates["assets"][asset["sha1"]] = tokens
+    return tokens
+
+
+def summary_tokens(is_spatial: bool) -> int:
+    with token_estimate_lock:
+        tokens = token_estimates["summary"].get((is_spatial, get_data_version()))
+    if tokens is None:
+        # Not seen since the data last changed: run the context SQL once
+        context_summary_csv(is_spatial)
+        with token_estimate_lock:
+            tokens = token_estimates["summary"].get((is_spatial, get_data_version()), 0)
+    return tokens
+
+
+@timed("token_estimate")
+def estimate_context_tokens(context_request: str, is_spatial: bool) -> dict:
+    """Estimated tokens of a context, in total and per part, in the order the cache is built."""
+    files_list = context_files(context_request)
+    if files_list is None:
+        raise ValueError(f"Unknown context_request: {context_request}")
+
+    parts = []
+    if context_request in SUMMARY_CONTEXTS:
+        parts.append({"name": "311_summary_context", "tokens": summary_tokens(is_spatial)})
+
+    datastore = load_assets("datastore")
+    for name in files_list:
+        if name in datastore:
+            parts.append({"name": name, "tokens": asset_tokens(name, datastore[name])})
+
+    prompt_file = context_request + ".txt"
+    prompt = load_assets("prompts").get(prompt_file)
+    if prompt is None:
+        raise FileNotFoundError(f"Prompt file not found: {prompt_file}")
+    parts.append({"name": prompt_file, "tokens": asset_tokens(prompt_file, prompt)})
+
+    return {"token_count": sum(part["tokens"] for part in parts), "parts": parts}
+
+
+def calibrate_token_estimate(context_request: str, is_spatial: bool) -> dict:
+    """Count every part of a context with Gemini, and fold the counts into the calibration file."""
+    files_list = context_files(context_request)
+    if files_list is None:
+        raise ValueError(f"Unknown context_request: {context_request}")
+
+    texts = []
+    if context_request in SUMMARY_CONTEXTS:
+        texts.append(("311_summary_context", "csv", context_summary_csv(is_spatial)))
+    for name in files_list:
+        text = get_file_content(name)
+        if text:
+            texts.append((name, token_kind(name), text))
+    prompt_file = context_request + ".txt"
+    texts.append((prompt_file, "text", get_prompt(prompt_file)))
+
+    parts = []
+    measured = {kind: {"chars": 0, "tokens": 0} for kind in TOKEN_KINDS}
+    for name, kind, text in texts:
+        counted = genai_client.models.count_tokens(
+            model=Config.GEMINI_MODEL, contents=text
+        ).total_tokens
+        parts.append(
+            {"name": name, "tokens": counted, "estimated": estimate_tokens(text, kind)}
+        )
+        measured[kind]["chars"] += len(text)
+        measured[kind]["tokens"] += counted
+
+    # Keep totals, so calibrating more contexts refines the same ratios. chars_per_token()
+    # first picks up a calibration another worker may have written.
+    chars_per_token("text")
+    with token_estimate_lock:
+        kinds = json.loads(json.dumps(token_calibration["kinds"]))
+    for kind, totals in measured.items():
+        if totals["tokens"]:
+            known = kinds.setdefault(kind, {"chars": 0, "tokens": 0})
+            known["chars"] += totals["chars"]
+            known["tokens"] += totals["tokens"]
+
+    path = Config.TOKEN_CALIBRATION_PATH
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(kinds, f, indent=2)
+    os.replace(tmp_path, path)
+
+    return {
+        "token_count": sum(part["tokens"] for part in parts),
+        "parts": parts,
+        "chars_per_token": {kind: round(chars_per_token(kind), 3) for kind in TOKEN_KINDS},
+    }
+
+
+#
+# Refresh-ahead for context caches. Every GEMINI_CACHE_REFRESH_INTERVAL seconds, caches used
+# within GEMINI_CACHE_IDLE_TIMEOUT that expire within GEMINI_CACHE_REFRESH_AHEAD get their
+# expiry pushed out again; idle caches lapse. GEMINI_WARM_CONTEXTS are built ahead of the
+# first request and always kept alive.
+#
+# Each worker process runs a refresher thread, but only the one holding the
+# CONTEXT_CACHE_LEADER_LOCK MySQL named lock builds and extends caches. The lock is held on a
+# connection of its own, outside the pool, and is released when that worker exits, so another
+# takes over on its next pass. The others only report which caches their requests used
+# (context_cache_usage table), so the leader keeps alive caches it never served itself.
+#
+CONTEXT_CACHE_LEADER_LOCK = "rethinkai_context_cache_refresher"
+context_cache_refresher = {
+    "pid": None,
+    "leader_conn": None,
+    "reported_at": datetime.datetime.min.replace(tzinfo=datetime.timezone.utc),
+}
+
+
+def warm_context_keys() -> List[tuple]:
+    """Registry keys for GEMINI_WARM_CONTEXTS ("app_version:context_request[:spatial]")."""
+    keys = []
+    for item in Config.GEMINI_WARM_CONTEXTS:
+        parts = item.split(":")
+        if len(parts) >= 2:
+            is_spatial = len(parts) > 2 and parts[2] == "spatial"
+            keys.append(context_cache_key(parts[0], parts[1], is_spatial))
+    return keys
+
+
+def is_context_cache_leader() -> bool:
+    """Whether this process runs the refresher, taking the leader lock if no one holds it."""
+    conn = context_cache_refresher["leader_conn"]
+    if conn:
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT IS_USED_LOCK(%s) = CONNECTION_ID()", (CONTEXT_CACHE_LEADER_LOCK,)
+            )
+            still_leader = cursor.fetchone()[0] == 1
+            cursor.close()
+            if still_leader:
+                return True
+        except mysql.connector.Error:
+            pass
+        # Connection dropped, so the lock went with it
+        try:
+            conn.close()
+        except mysql.connector.Error:
+            pass
+        context_cache_refresher["leader_conn"] = None
+
+    conn = mysql.connector.connect(**Config.DB_CONFIG)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (CONTEXT_CACHE_LEADER_LOCK,))
+        acquired = cursor.fetchone()[0] == 1
+        cursor.close()
+    except mysql.connector.Error:
+        conn.close()
+        raise
+    if not acquired:
+        conn.close()
+        return False
+    context_cache_refresher["leader_conn"] = conn
+    return True
+
+
+def report_context_cache_use() -> None:
+    """Record the caches this process used since its last report in context_cache_usage."""
+    reported_at = context_cache_refresher["reported_at"]
+    with context_cache_registry_lock:
+        used = [
+            (entry["name"], entry["last_used"])
+            for entry in context_cache_registry.values()
+            if entry["last_used"] and entry["last_used"] > reported_at
+        ]
+    if not used:
+        return
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.executemany(
+            """
+            INSERT INTO context_cache_usage (cache_name, last_used) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE last_used = GREATEST(last_used, VALUES(last_used))
+            """,
+            [
+                (name, last_used.astimezone(datetime.timezone.utc).replace(tzinfo=None))
+                for name, last_used in used
+            ],
+        )
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+    context_cache_refresher["reported_at"] = max(last_used for _, last_used in used)
+
+
+def shared_context_cache_use(since: datetime.datetime) -> dict:
+    """Cache name -> last use by any worker, for caches used after since (UTC)."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM context_cache_usage WHERE last_used < %s",
+            (since.replace(tzinfo=None),),
+        )
+        cursor.execute("SELECT cache_name, last_used FROM context_cache_usage")
+        used = {
+            name: last_used.replace(tzinfo=datetime.timezone.utc)
+            for name, last_used in cursor.fetchall()
+        }
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+    return used
+
+
+def refresh_context_caches() -> None:
+    # Pick up caches other workers built since this one last listed them
+    load_context_cache_registry()
+
+    warm_keys = warm_context_keys()
+    for key in warm_keys:
+        app_version, context_request, is_spatial = key[:3]
+        if not find_context_cache(key, touch=False):
+            try:
+                create_gemini_context(
+                    context_request=context_request,
+                    app_version=app_version,
+                    is_spatial=is_spatial,
+                )
+            except Gemini_Busy as e:
+                # Another worker is still building it, the next refresh picks it up
+                print(
+                    f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Context cache warm-up skipped:{Font_Colors.ENDC} {e}"
+                )
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    idle_timeout = datetime.timedelta(seconds=Config.GEMINI_CACHE_IDLE_TIMEOUT)
+    refresh_ahead = datetime.timedelta(seconds=Config.GEMINI_CACHE_REFRESH_AHEAD)
+    used = shared_context_cache_use(now - idle_timeout)
+    with context_cache_registry_lock:
+        entries = list(context_cache_registry.items())
+
+    for key, entry in entries:
+        in_use = (
+            key in warm_keys
+            or entry["name"] in used
+            or (entry["last_used"] and now - entry["last_used"] < idle_timeout)
+        )
+        if in_use and entry["expire_time"] and entry["expire_time"] - now < refresh_ahead:
+            try:
+                cache = genai_client.caches.update(
+                    name=entry["name"],
+                    config=types.UpdateCachedContentConfig(
+                        expire_time=context_cache_expire_time()
+                    ),
+                )
+                register_context_cache(key, cache)
+            except genai_errors.ClientError:
+                # Deleted or already expired, the next request rebuilds it
+                forget_context_cache(entry["name"])
+
+
+def run_context_cache_refresher() -> None:
+    while True:
+        try:
+            report_context_cache_use()
+            if is_context_cache_leader():
+                refresh_context_caches()
+        except Exception as e:
+            print(
+                f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error refreshing context caches:{Font_Colors.ENDC} {e}"
+            )
+        time.sleep(Config.GEMINI_CACHE_REFRESH_INTERVAL)
+
+
+def start_context_cache_refresher() -> None:
+    """Start the refresher thread once per process (again after a fork)."""
+    with context_cache_registry_lock:
+        if context_cache_refresher["pid"] == os.getpid():
+            return
+        context_cache_refresher["pid"] = os.getpid()
+        # A forked worker doesn't inherit the parent's leadership
+        context_cache_refresher["leader_conn"] = None
+    threading.Thread(
+        target=run_context_cache_refresher, name="context-cache-refresher", daemon=True
+    ).start()
+
+
+#
+# Memoized /chat answers. Auto-generated prompts repeat for every visitor, so their answers
+# are stored in MySQL (shared by all workers) and reused until CHAT_ANSWER_CACHE_TTL passes
+# or the context data changes.
+#
+data_version_state = {"version": "", "checked_at": 0.0}
+
+
+def get_data_version() -> str:
+    """Signature of the ingested data, changes whenever setup/post_ingest.py completes a run."""
+    now = time.monotonic()
+    if now - data_version_state["checked_at"] < Config.DATA_VERSION_CHECK_INTERVAL:
+        return data_version_state["version"]
+
+    version = data_version_state["version"]
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT CONCAT_WS(
+                '|',
+                (SELECT GROUP_CONCAT(source_table, ':', last_id ORDER BY source_table) FROM rollup_watermark),
+                (SELECT value FROM derived_data_state WHERE name = 'post_ingest_run')
+            )
+            """
+        )
+        version = cursor.fetchone()[0] or ""
+    except mysql.connector.Error as err:
+        print(
+            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error in database connection (get_data_version):{Font_Colors.ENDC} {str(err)}"
+        )
+    finally:
+        if "cursor" in locals() and cursor:
+            cursor.close()
+        if "conn" in locals() and conn:
+            conn.close()
+
+    data_version_state.update(version=version, checked_at=now)
+    return version
+
+
+def chat_answer_key(cache_name: str, prompt: str, structured_response) -> str:
+    normalized_prompt = " ".join(prompt.split()).casefold()
+    key = json.dumps(
+        [cache_name, get_data_version(), normalized_prompt, str(structured_response)]
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+@timed("chat_answer_lookup")
+def get_chat_answer(answer_key: str) -> Optional[str]:
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT answer FROM chat_answer_cache WHERE cache_key = %s AND expires_at > NOW()",
+            (answer_key,),
+        )
+        row = cursor.fetchone()
+        count("chat_answer_hit" if row else "chat_answer_miss")
+        return row[0] if row else None
+    except mysql.connector.Error as err:
+        print(
+            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error in database connection (get_chat_answer):{Font_Colors.ENDC} {str(err)}"
+        )
+        return None
+    finally:
+        if "cursor" in locals() and cursor:
+            cursor.close()
+        if "conn" in locals() and conn:
+            conn.close()
 
-                return cache.name
 
+def save_chat_answer(answer_key: str, answer: str) -> None:
+    """Store an answer, dropping expired rows and the oldest past CHAT_ANSWER_CACHE_MAX_ROWS."""
     try:
-        files_list = []
-        content = {"parts": []}
-
-        # adding community assets to context (ignoring potential other csv in datastore)
-        if context_request == "structured":
-            files_list = get_files("csv", ["geocoding-community-assets.csv"])
-            preamble_file = context_request + ".txt"
-
-        elif context_request == "unstructured":
-            files_list = get_files("txt")
-            preamble_file = context_request + ".txt"
-
-        elif context_request == "all":
-            files_list = get_files()
-            preamble_file = context_request + ".txt"
-        elif (
-            context_request == "experiment_5"
-            or context_request == "experiment_6"
-            or context_request == "experiment_7"
-            or context_request == "experiment_pit"
-        ):
-
-            files_list = get_files("txt")
-            query = build_311_query(
-                data_request="311_summary_context", is_spatial=is_spatial
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO chat_answer_cache (cache_key, answer, expires_at)
+            VALUES (%s, %s, NOW() + INTERVAL %s SECOND)
+            ON DUPLICATE KEY UPDATE
+                answer = VALUES(answer),
+                created_at = NOW(),
+                expires_at = VALUES(expires_at)
+            """,
+            (answer_key, answer, Config.CHAT_ANSWER_CACHE_TTL),
+        )
+        cursor.execute("DELETE FROM chat_answer_cache WHERE expires_at <= NOW()")
+        cursor.execute("SELECT COUNT(*) FROM chat_answer_cache")
+        excess = cursor.fetchone()[0] - Config.CHAT_ANSWER_CACHE_MAX_ROWS
+        if excess > 0:
+            cursor.execute(
+                "DELETE FROM chat_answer_cache ORDER BY created_at LIMIT %s", (excess,)
             )
-            response = get_query_results(query=query, output_type="csv")
-
-            content["parts"].append({"text": response.getvalue()})
-
-            preamble_file = context_request + ".txt"
+        conn.commit()
+    except mysql.connector.Error as err:
+        print(
+            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error in database connection (save_chat_answer):{Font_Colors.ENDC} {str(err)}"
+        )
+    finally:
+        if "cursor" in locals() and cursor:
+            cursor.close()
+        if "conn" in locals() and conn:
+            conn.close()
 
-        # Read contents of found files
-        for file in files_list:
-            print("specific file", file)
-            file_content = get_file_content(file)
-            if file_content is not None:
-                content["parts"].append({"text": file_content})
 
-        path = Config.PROMPTS_PATH / preamble_file
-        if not path.is_file():
-            raise FileNotFoundError(
-                f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error: File not found:{Font_Colors.ENDC} {path}"
+#
+# Background interaction_log writer. Request logging is queued and written by one thread per
+# process with executemany() inserts / batched updates, every LOG_BATCH_SIZE events or
+# LOG_FLUSH_INTERVAL seconds. The queue is bounded (events past LOG_QUEUE_MAX are dropped)
+# and drained at exit: the writer is told to stop, finishes its batch and the queue, and is
+# joined for up to LOG_SHUTDOWN_TIMEOUT seconds.
+#
+# created_at is set when the event happens, not when the batch is written
+LOG_COLUMNS = (
+    "created_at",
+    "session_id",
+    "app_version",
+    "data_selected",
+    "data_attributes",
+    "prompt_preamble",
+    "client_query",
+    "app_response",
+    "client_response_rating",
+)
+log_writer = {"queue": None, "thread": None, "pid": None, "dropped": 0, "written": 0}
+# Queued after everything else at exit, the writer stops when it reaches it
+LOG_WRITER_STOP = None
+log_writer_lock = threading.Lock()
+
+
+def get_log_queue() -> queue.Queue:
+    """Start the writer thread once per process (again after a fork)."""
+    with log_writer_lock:
+        if log_writer["pid"] != os.getpid():
+            log_queue = queue.Queue(maxsize=Config.LOG_QUEUE_MAX)
+            thread = threading.Thread(
+                target=run_log_writer,
+                args=(log_queue,),
+                name="log-writer",
+                daemon=True,
             )
-        system_prompt = path.read_text(encoding="utf-8")
+            log_writer.update(queue=log_queue, thread=thread, pid=os.getpid())
+            thread.start()
+        return log_writer["queue"]
 
-        display_name = "APP_VERSION_" + app_version + "_REQUEST_" + context_request
 
-        # Generate cache or return token count
-        if generate_cache:
-            # Set cache expiration time
-            cache_ttl = (
-                (
-                    datetime.datetime.now(datetime.timezone.utc)
-                    + datetime.timedelta(days=Config.GEMINI_CACHE_TTL)
-                )
-                .isoformat()
-                .replace("+00:00", "Z")
+def queue_log_event(kind: str, fields: dict, log_id: Union[int, str] = "") -> None:
+    """Queue an interaction_log insert or update (kind "insert" / "update")."""
+    try:
+        get_log_queue().put_nowait((kind, fields, log_id))
+    except queue.Full:
+        with log_writer_lock:
+            log_writer["dropped"] += 1
+
+
+@timed("log_write")
+def write_log_events(events: list) -> None:
+    """Write a batch of queued events: one executemany() insert, updates in one transaction."""
+    inserts = [
+        tuple(fields.get(column, "") for column in LOG_COLUMNS)
+        for kind, fields, _ in events
+        if kind == "insert"
+    ]
+    updates = [(fields, log_id) for kind, fields, log_id in events if kind == "update"]
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        if inserts:
+            cursor.executemany(
+                f"""
+                INSERT INTO interaction_log ({", ".join(LOG_COLUMNS)})
+                VALUES ({", ".join(["%s"] * len(LOG_COLUMNS))})
+                """,
+                inserts,
             )
 
-            # Create the cache
-            cache = genai_client.caches.create(
-                model=Config.GEMINI_MODEL,
-                config=types.CreateCachedContentConfig(
-                    display_name=display_name,
-                    system_instruction=system_prompt,
-                    expire_time=cache_ttl,
-                    contents=content["parts"],
-                ),
+        # Updates touching the same columns share one statement
+        grouped = {}
+        for fields, log_id in updates:
+            grouped.setdefault(tuple(fields), []).append(
+                list(fields.values()) + [log_id]
             )
-
-            return cache.name
-        else:
-            # Return token count for testing
-            content["parts"].append({"text": system_prompt})
-            total_tokens = genai_client.models.count_tokens(
-                model=Config.GEMINI_MODEL, contents=content["parts"]
+        for columns, params in grouped.items():
+            update_parts = [f"{field} = %s" for field in columns]
+            cursor.executemany(
+                f"UPDATE interaction_log SET {', '.join(update_parts)} WHERE id = %s",
+                params,
             )
-            return total_tokens.total_tokens
 
-    except Exception as e:
+        conn.commit()
+        with log_writer_lock:
+            log_writer["written"] += len(events)
+    except mysql.connector.Error as err:
         print(
-            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error generating context:{Font_Colors.ENDC} {e}"
+            f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error in database connection (write_log_events):{Font_Colors.ENDC} {str(err)}"
         )
-        return f"✖ Error generating context: {e}"
+    finally:
+        if "cursor" in locals() and cursor:
+            cursor.close()
+        if "conn" in locals() and conn:
+            conn.close()
+
+
+def run_log_writer(log_queue: queue.Queue) -> None:
+    stopping = False
+    while not stopping:
+        # Block for the first event, then gather more until the batch or interval fills
+        event = log_queue.get()
+        stopping = event is LOG_WRITER_STOP
+        events = [] if stopping else [event]
+        deadline = time.monotonic() + Config.LOG_FLUSH_INTERVAL
+        while not stopping and len(events) < Config.LOG_BATCH_SIZE:
+            try:
+                event = log_queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if event is LOG_WRITER_STOP:
+                stopping = True
+            else:
+                events.append(event)
+        if events:
+            write_log_events(events)
+
+
+@atexit.register
+def drain_log_queue() -> None:
+    """Stop the writer once it has written everything queued, including a batch in progress."""
+    if log_writer["pid"] != os.getpid():
+        return
+    deadline = time.monotonic() + Config.LOG_SHUTDOWN_TIMEOUT
+    try:
+        log_writer["queue"].put(LOG_WRITER_STOP, timeout=Config.LOG_SHUTDOWN_TIMEOUT)
+    except queue.Full:
+        pass
+    log_writer["thread"].join(timeout=max(0, deadline - time.monotonic()))
+
+    # Events the writer didn't get to, if it was stuck or the queue stayed full
+    events = []
+    while True:
+        try:
+            event = log_writer["queue"].get_nowait()
+        except queue.Empty:
+            break
+        if event is not LOG_WRITER_STOP:
+            events.append(event)
+    if events:
+        write_log_events(events)
 
 
 # Log events
+@timed("log_write")
 def log_event(
     session_id: str,
     app_version: str,
@@ -928,71 +2917,65 @@ def log_event(
     client_query: str = "",
     app_response: str = "",
     client_response_rating: str = "",
-    log_id: str = "",
-) -> Union[int, bool]:
-    """Log an event to the database."""
+    log_id: Union[str, int, dict] = "",
+) -> Union[int, bool, dict]:
+    """Log an event to the database.
+
+    Inserts run immediately and return the new id, since callers hand it to clients. Updates
+    are queued; updates to a pending request entry (see start_request_log) are merged into it.
+    """
     if not session_id or not app_version:
         print("Missing session_id or app_version")
         return False
 
+    # Filter out empty fields, only set fields are updated
+    fields = {
+        "app_version": app_version,
+        "data_selected": data_selected,
+        "data_attributes": data_attributes,
+        "prompt_preamble": prompt_preamble,
+        "client_query": client_query,
+        "app_response": app_response,
+        "client_response_rating": client_response_rating,
+    }
+    fields = {k: v for k, v in fields.items() if v}
+
+    if isinstance(log_id, dict):
+        log_id.update(fields)
+        return log_id
+    if log_id:
+        if fields:
+            queue_log_event("update", fields, log_id)
+        return log_id
+
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        # Insert new entry if no log_id provided
-        if not log_id:
-            query = """
-                INSERT INTO interaction_log (
-                    session_id, app_version, data_selected, data_attributes,
-                    prompt_preamble, client_query, app_response, client_response_rating
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                """
-
-            cursor.execute(
-                query,
-                (
-                    session_id,
-                    app_version,
-                    data_selected,
-                    data_attributes,
-                    prompt_preamble,
-                    client_query,
-                    app_response,
-                    client_response_rating,
-                ),
-            )
-
-            app_response_id = cursor.lastrowid
-        else:
-            # Create a dictionary of non-empty fields to update
-            update_fields = {
-                "app_version": app_version,
-                "data_selected": data_selected,
-                "data_attributes": data_attributes,
-                "prompt_preamble": prompt_preamble,
-                "client_query": client_query,
-                "app_response": app_response,
-                "client_response_rating": client_response_rating,
-            }
-
-            # Filter out empty fields
-            update_fields = {k: v for k, v in update_fields.items() if v}
-
-            if update_fields:
-                # Build the query dynamically
-                update_parts = [f"{field} = %s" for field in update_fields]
-                query = f"UPDATE interaction_log SET {', '.join(update_parts)} WHERE id = %s"
-
-                # Add values in the correct order
-                params = list(update_fields.values())
-                params.append(log_id)
-
-                cursor.execute(query, params)
+        query = """
+            INSERT INTO interaction_log (
+                created_at, session_id, app_version, data_selected, data_attributes,
+                prompt_preamble, client_query, app_response, client_response_rating
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """
 
-            app_response_id = log_id
+        cursor.execute(
+            query,
+            (
+                datetime.datetime.now(),
+                session_id,
+                app_version,
+                data_selected,
+                data_attributes,
+                prompt_preamble,
+                client_query,
+                app_response,
+                client_response_rating,
+            ),
+        )
 
         conn.commit()
-        return app_response_id
+        return cursor.lastrowid
 
     except mysql.connector.Error as err:
         print(
@@ -1006,11 +2989,50 @@ def log_event(
             conn.close()
 
 
+def start_request_log(session_id: str, app_version: str, **fields) -> dict:
+    """Pending interaction_log entry for the current request, written once the request ends.
+
+    log_event(log_id=<entry>) updates it in memory, so the route's status update costs nothing.
+    created_at is the request's arrival time, as the entry is written after it finishes.
+    """
+    return {
+        "created_at": datetime.datetime.now(),
+        "session_id": session_id,
+        "app_version": app_version,
+        **fields,
+    }
+
+
 #
 # Middleware to check session and create if needed
 #
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def count_request_errors(response):
+    if response.status_code >= 500:
+        count("http_5xx", request.url_rule.rule if request.url_rule else "")
+    return response
+
+
+@app.teardown_request
+def record_request_time(exc=None):
+    # Runs after streamed responses finish, so the whole body is timed
+    if "request_start" in g:
+        observe(
+            "route",
+            request.url_rule.rule if request.url_rule else "unmatched",
+            time.perf_counter() - g.request_start,
+        )
+
+
 @app.before_request
 def check_session():
+    start_context_cache_refresher()
+
     if request.method == "OPTIONS":
         # Preflight CORS request – skip auth
         return None
@@ -1027,22 +3049,38 @@ def check_session():
     if "session_id" not in session:
         session.permanent = True  # Make the session persistent
         session["session_id"] = str(uuid.uuid4())
-        log_event(
-            session_id=session["session_id"],
-            app_version=app_version,
+        if app_version:
+            queue_log_event(
+                "insert",
+                start_request_log(
+                    session["session_id"],
+                    app_version,
+                    data_attributes=Config.API_VERSION,
+                    app_response="New session created",
+                ),
+            )
+
+    # Log the request, written by the log writer when the request ends
+    g.log_entry = (
+        start_request_log(
+            session["session_id"],
+            app_version,
             data_attributes=Config.API_VERSION,
-            app_response="New session created",
+            client_query=f"Request: [{request.method}] {request.url}",
         )
-
-    # Log the request
-    g.log_entry = log_event(
-        session_id=session["session_id"],
-        app_version=app_version,
-        data_attributes=Config.API_VERSION,
-        client_query=f"Request: [{request.method}] {request.url}",
+        if app_version
+        else False
     )
 
 
+@app.teardown_request
+def write_request_log(exc=None):
+    # Runs after streamed responses finish too, so their final status is included
+    log_entry = g.pop("log_entry", None)
+    if isinstance(log_entry, dict):
+        queue_log_event("insert", log_entry)
+
+
 #
 # Endpoint Definitions
 #
@@ -1054,6 +3092,7 @@ def route_data_query():
     stream_result = request.args.get("stream", "False")
     request_zipcode = request.args.get("zipcode", "")
     event_ids = request.args.get("event_ids", "")
+    h3_cells = request.args.get("cells", "")
     request_date = request.args.get("date", "")
     data_request = request.args.get("request", "")
     output_type = request.args.get("output_type", "")
@@ -1063,12 +3102,26 @@ def route_data_query():
         return jsonify({"✖ Error": "Missing data_request parameter"}), 400
 
     if request.method == "POST":
-        # Handles case for requesting many event_ids
+        # Handles case for requesting many event_ids or cells
         data = request.get_json()
         event_ids = data.get("event_ids", "")
+        h3_cells = data.get("cells", "")
 
     try:  # Get and validate request parameters
         request_options = request.args.get("category", "")
+        h3_resolution = request.args.get("resolution", "10")
+        if (data_request == "311_hexbins" or h3_cells) and (
+            not h3_resolution.isdigit()
+            or int(h3_resolution) not in SQLConstants.H3_RESOLUTIONS
+        ):
+            return (
+                jsonify(
+                    {
+                        "✖ Error": f"Invalid resolution. Expects one of {list(SQLConstants.H3_RESOLUTIONS)}"
+                    }
+                ),
+                400,
+            )
         if data_request.startswith("311_by") and not request_options:
             return (
                 jsonify(
@@ -1085,22 +3138,76 @@ def route_data_query():
                 400,
             )
 
+        # Keyset pagination, only 311_by_geo returns rows ordered by id
+        page_limit = request.args.get("limit", "")
+        after_id = request.args.get("after_id", "")
+        before_id = request.args.get("before_id", "")
+        if page_limit or after_id or before_id:
+            if data_request != "311_by_geo":
+                return (
+                    jsonify({"✖ Error": "Pagination is only supported for 311_by_geo"}),
+                    400,
+                )
+            values = (page_limit or "1", after_id or "0", before_id or "0")
+            if not all(value.isdigit() for value in values) or not (
+                0 < int(values[0]) <= Config.PAGE_MAX_ROWS
+            ):
+                return (
+                    jsonify(
+                        {
+                            "✖ Error": f"Invalid limit, after_id or before_id. limit expects 1-{Config.PAGE_MAX_ROWS}"
+                        }
+                    ),
+                    400,
+                )
+
         # Validate date format for date-specific queries
         if data_request.startswith("311_on_date") and not check_date_format(
             request_date
         ):
             return jsonify({"✖ Error": 'Incorrect date format. Expects "YYYY-MM"'}), 400
 
+        # Serve repeated requests from the response cache
+        cache_key = response_cache_key(
+            request=data_request,
+            category=request_options,
+            date=request_date,
+            zipcode=request_zipcode,
+            event_ids=event_ids,
+            is_spatial=is_spatial,
+            cells=h3_cells,
+            resolution=h3_resolution if data_request == "311_hexbins" or h3_cells else "",
+            limit=page_limit,
+            after_id=after_id,
+            before_id=before_id,
+            output_type="stream" if stream_result == "True" else output_type,
+        )
+        cached = get_cached_response(cache_key)
+        if cached:
+            log_event(
+                session_id=session_id,
+                app_version=app_version,
+                log_id=g.log_entry,
+                app_response="SUCCESS",
+            )
+            return make_cached_response(cached, "HIT")
+
         # Build query using the appropriate query builder
         if data_request.startswith("311"):
-            query = build_311_query(
+            query_params = dict(
                 data_request=data_request,
                 request_options=request_options,
                 request_date=request_date,
                 request_zipcode=request_zipcode,
                 event_ids=event_ids,
                 is_spatial=is_spatial,
+                h3_resolution=int(h3_resolution) if h3_resolution.isdigit() else 10,
+                page_limit=int(page_limit or "0"),
+                after_id=int(after_id or "0"),
+                before_id=int(before_id or "0"),
+                h3_cells=h3_cells,
             )
+            query = build_311_query(**query_params)
 
         elif data_request.startswith("911"):
             query = build_911_query(data_request=data_request, is_spatial=is_spatial)
@@ -1125,14 +3232,31 @@ def route_data_query():
         if not query:
             return jsonify({"✖ Error": "Failed to build query"}), 500
 
+        # Paginated responses carry the after_id of the next page, absent on the last page
+        page_headers = {}
+        if page_limit:
+            next_cursor = next_page_cursor(query_params, int(page_limit))
+            if next_cursor:
+                next_args = {**request.args.to_dict(), "after_id": next_cursor}
+                page_headers["X-Next-Cursor"] = next_cursor
+                page_headers["Link"] = (
+                    f'<{request.base_url}?{urlencode(next_args)}>; rel="next"'
+                )
+
         # Return w/ streaming
         if stream_result == "True":
             # return Response(stream_with_context(stream_query_results(query=query)), mimetype="application/json")
             return Response(
                 stream_with_context(
-                    get_query_results(query=query, output_type="stream")
+                    cache_stream(
+                        cache_key,
+                        get_query_results(query=query, output_type="stream"),
+                        "application/json",
+                        page_headers,
+                    )
                 ),
                 mimetype="application/json",
+                headers={**page_headers, "X-Cache": "MISS"},
             )
         # Return non-streaming
         else:
@@ -1143,13 +3267,29 @@ def route_data_query():
                 app_response="SUCCESS",
             )
             result = get_query_results(query=query, output_type=output_type)
-            if output_type == "csv" and result:
-                output = result.getvalue()
-                response = Response(output, mimetype="text/csv")
-                response.headers["Content-Disposition"] = (
-                    "attachment; filename=export.csv"
+            if output_type in STREAMED_MIMETYPES:
+                mimetype = STREAMED_MIMETYPES[output_type]
+                headers = dict(page_headers)
+                if output_type == "csv":
+                    headers["Content-Disposition"] = "attachment; filename=export.csv"
+                    headers["Vary"] = "Accept-Encoding"
+                result = cache_stream(cache_key, result, mimetype, dict(headers))
+
+                # CSV is compressed on the fly when the client accepts it
+                encoding = request.accept_encodings.best_match(list(STREAM_ENCODINGS))
+                if output_type == "csv" and encoding:
+                    result = compress_stream(result, encoding)
+                    headers["Content-Encoding"] = encoding
+
+                headers["X-Cache"] = "MISS"
+                return Response(
+                    stream_with_context(result), mimetype=mimetype, headers=headers
                 )
-                return response
+            if result:
+                entry = set_cached_response(
+                    cache_key, result.get_data(), result.mimetype, page_headers
+                )
+                return make_cached_response(entry, "MISS")
             return result
 
     except Exception as e:
@@ -1162,6 +3302,145 @@ def route_data_query():
         return jsonify({"✖ Error": str(e)}), 500
 
 
+@app.route("/data/cache", methods=["GET", "POST"])
+def route_data_cache():
+    session_id = session.get("session_id")
+    app_version = request.args.get("app_version", "0")
+
+    # clear the response cache, e.g. after an ingest run
+    if request.method == "POST" and request.args.get("option", "") == "clear":
+        with response_cache_lock:
+            response_cache.clear()
+
+    with response_cache_lock:
+        stats = {
+            **response_cache_stats,
+            "entries": len(response_cache),
+            "size_bytes": response_cache.currsize,
+            "max_bytes": response_cache.maxsize,
+        }
+
+    log_event(
+        session_id=session_id,
+        app_version=app_version,
+        log_id=g.log_entry,
+        app_response="SUCCESS",
+    )
+    return jsonify(stats)
+
+
+def stream_chat_events(
+    session_id: str,
+    app_version: str,
+    context_request: str,
+    is_spatial: bool,
+    cache_name: str,
+    full_prompt: str,
+    structured_response,
+    memoize: bool,
+    data_attributes: str,
+    prompt_preamble: str,
+    gemini_prompt: str,
+    system_instruction: str = "",
+) -> Generator[str, None, None]:
+    """SSE events for a /chat answer: "text" chunks, then a "done" event with the log_id.
+
+    The interaction is logged once the whole answer has been sent.
+    """
+    answer_key = (
+        chat_answer_key(cache_name, gemini_prompt, structured_response)
+        if memoize and isinstance(cache_name, str)
+        else ""
+    )
+    parts = []
+    try:
+        answer = get_chat_answer(answer_key) if answer_key else None
+        if answer is not None:
+            parts.append(answer)
+            yield sse_event({"text": answer})
+        else:
+            try:
+                for text in stream_gemini_response(
+                    gemini_prompt, cache_name, structured_response, system_instruction
+                ):
+                    parts.append(text)
+                    yield sse_event({"text": text})
+            except Context_Cache_Missing:
+                if parts:
+                    raise
+                # The registered cache is gone, rebuild it and try once more
+                forget_context_cache(cache_name)
+                cache_name = create_gemini_context(
+                    context_request=context_request,
+                    generate_cache=True,
+                    app_version=app_version,
+                    is_spatial=is_spatial,
+                )
+                if answer_key:
+                    answer_key = chat_answer_key(
+                        cache_name, gemini_prompt, structured_response
+                    )
+                for text in stream_gemini_response(
+                    gemini_prompt, cache_name, structured_response, system_instruction
+                ):
+                    parts.append(text)
+                    yield sse_event({"text": text})
+            if answer_key:
+                save_chat_answer(answer_key, "".join(parts))
+
+        log_id = log_event(
+            session_id=session_id,
+            app_version=app_version,
+            data_selected=context_request,
+            data_attributes=data_attributes,
+            prompt_preamble=prompt_preamble,
+            client_query=full_prompt,
+            app_response="".join(parts),
+        )
+        log_event(
+            session_id=session_id,
+            app_version=app_version,
+            log_id=g.log_entry,
+            app_response="SUCCESS",
+        )
+        yield sse_event({"session_id": session_id, "log_id": log_id}, event="done")
+
+    except Exception as e:
+        log_event(
+            session_id=session_id,
+            app_version=app_version,
+            log_id=g.log_entry,
+            app_response=f"ERROR: {str(e)}",
+        )
+        print(f"✖ Exception in /chat stream: {e}")
+        yield sse_event({"Error": str(e)}, event="error")
+
+
+@app.route("/data/pool", methods=["GET"])
+def route_data_pool():
+    session_id = session.get("session_id")
+    app_version = request.args.get("app_version", "0")
+
+    log_event(
+        session_id=session_id,
+        app_version=app_version,
+        log_id=g.log_entry,
+        app_response="SUCCESS",
+    )
+    return jsonify(get_db_pool_stats())
+
+
+@app.route("/metrics", methods=["GET"])
+def route_metrics():
+    """Per-process latency histograms and counters, Prometheus text unless format=json."""
+    snapshot = metrics_snapshot()
+    if request.args.get("format") == "json":
+        return jsonify(snapshot)
+    return Response(
+        prometheus_metrics(snapshot), mimetype="text/plain; version=0.0.4"
+    )
+
+
 @app.route("/chat", methods=["POST"])
 def route_chat():
     session_id = session.get("session_id")
@@ -1179,25 +3458,95 @@ def route_chat():
     data_attributes = data.get("data_attributes", "")
     client_query = data.get("client_query", "")
     prompt_preamble = data.get("prompt_preamble", "")
-
-    # data_selected, optional, list of files used when context_request==s
-    cache_name = create_gemini_context(
-        context_request=context_request,
-        preamble=prompt_preamble,
-        generate_cache=True,
-        app_version=app_version,
-        is_spatial=is_spatial,
+    # Free-form questions opt out of answer memoization
+    memoize = (
+        request.args.get("memoize", "true").lower() not in ("false", "0", "no")
+        and data.get("memoize", True) is not False
     )
 
     full_prompt = f"User question: {client_query}"
+    gemini_prompt = full_prompt
+    system_instruction = ""
 
     # Process chat
     try:
-        app_response = get_gemini_response(
-            prompt=full_prompt,
-            cache_name=cache_name,
-            structured_response=structured_response,
+        if context_request == "retrieval":
+            # No context cache, the passages matching the question go in the prompt
+            cache_name = ""
+            system_instruction = get_prompt("retrieval.txt")
+            gemini_prompt = retrieval_prompt(client_query) + "\n\n" + full_prompt
+        else:
+            # data_selected, optional, list of files used when context_request==s
+            cache_name = create_gemini_context(
+                context_request=context_request,
+                preamble=prompt_preamble,
+                generate_cache=True,
+                app_version=app_version,
+                is_spatial=is_spatial,
+            )
+
+        # Relay the answer as Server-Sent Events while it is generated
+        if request.args.get("stream", "false").lower() in ("true", "1", "yes"):
+            return Response(
+                stream_with_context(
+                    stream_chat_events(
+                        session_id=session_id,
+                        app_version=app_version,
+                        context_request=context_request,
+                        is_spatial=is_spatial,
+                        cache_name=cache_name,
+                        full_prompt=full_prompt,
+                        structured_response=structured_response,
+                        memoize=memoize,
+                        data_attributes=data_attributes,
+                        prompt_preamble=prompt_preamble,
+                        gemini_prompt=gemini_prompt,
+                        system_instruction=system_instruction,
+                    )
+                ),
+                mimetype="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
+
+        answer_key = (
+            chat_answer_key(cache_name, gemini_prompt, structured_response)
+            if memoize and isinstance(cache_name, str)
+            else ""
         )
+        try:
+            app_response = get_chat_answer(answer_key) if answer_key else None
+            if app_response is None:
+                app_response = get_gemini_response(
+                    prompt=gemini_prompt,
+                    cache_name=cache_name,
+                    structured_response=structured_response,
+                    system_instruction=system_instruction,
+                )
+                if answer_key and "Error" not in app_response:
+                    save_chat_answer(answer_key, app_response)
+        except Context_Cache_Missing:
+            # The registered cache is gone, rebuild it and try once more
+            forget_context_cache(cache_name)
+            cache_name = create_gemini_context(
+                context_request=context_request,
+                preamble=prompt_preamble,
+                generate_cache=True,
+                app_version=app_version,
+                is_spatial=is_spatial,
+            )
+            answer_key = (
+                chat_answer_key(cache_name, gemini_prompt, structured_response)
+                if memoize and isinstance(cache_name, str)
+                else ""
+            )
+            app_response = get_gemini_response(
+                prompt=gemini_prompt,
+                cache_name=cache_name,
+                structured_response=structured_response,
+                system_instruction=system_instruction,
+            )
+            if answer_key and "Error" not in app_response:
+                save_chat_answer(answer_key, app_response)
         if "Error" in app_response:
             print(
                 f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ ERROR from Gemini API:{Font_Colors.ENDC} {app_response}"
@@ -1228,6 +3577,14 @@ def route_chat():
         )
         return jsonify(response)
 
+    except Gemini_Busy as e:
+        log_event(
+            session_id=session_id,
+            app_version=app_version,
+            log_id=g.log_entry,
+            app_response=f"ERROR: {str(e)}",
+        )
+        return jsonify({"Error": str(e)}), 503
     except Exception as e:
         log_event(
             session_id=session_id,
@@ -1258,31 +3615,40 @@ def route_chat_context():
             response = {cache.name: str(cache) for cache in genai_client.caches.list()}
             return jsonify(response)
 
-        else:
-            # test token count for context cache of <request>
-            token_count = create_gemini_context(
-                context_request=context_request,
-                preamble="",
-                generate_cache=False,
-                app_version=app_version,
-                is_spatial=is_spatial,
+        elif context_request == "retrieval":
+            # passages the retrieval context would send for <question>, with estimated tokens
+            question = request.args.get("question", "")
+            passages = retrieve_passages(question)
+            for passage in passages:
+                passage["tokens"] = estimate_tokens(
+                    passage["text"], token_kind(passage["file"])
+                )
+            token_count = estimate_tokens(get_prompt("retrieval.txt")) + sum(
+                passage["tokens"] for passage in passages
             )
+            return jsonify({"token_count": token_count, "passages": passages})
 
-            if isinstance(token_count, int):
-                return jsonify({"token_count": token_count})
-            elif hasattr(token_count, "total_tokens") and isinstance(
-                token_count.total_tokens, int
-            ):
-                return jsonify({"token_count": token_count.total_tokens})
-            else:
-                # Handle the error appropriately, e.g., log the error and return an error response
+        else:
+            # token count of the context cache for <request>, estimated locally unless
+            # option=calibrate asks Gemini to count it
+            try:
+                if request.args.get("option", "") == "calibrate":
+                    token_count = calibrate_token_estimate(context_request, is_spatial)
+                else:
+                    token_count = estimate_context_tokens(context_request, is_spatial)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            except Exception as e:
                 print(
-                    f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error getting token count:{Font_Colors.ENDC} {token_count}"
-                )  # Log the error
+                    f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error getting token count:{Font_Colors.ENDC} {e}"
+                )
                 return (
                     jsonify({"error": "Failed to get token count"}),
                     500,
-                )  # Return an error response
+                )
+
+            token_count["assets_hash"] = context_bundle_hash(context_request)
+            return jsonify(token_count)
     if request.method == "POST":
         # TODO: implement 'specific' context_request with list of files from datastore
         # FOR NOW: assumes 'structured', 'unstructured', 'all', 'experiment_5', 'experiment_6', 'experiment_7' context_request
@@ -1294,8 +3660,13 @@ def route_chat_context():
         if context_option == "clear":
             # clear the cache, either by name or all existing caches
             for cache in genai_client.caches.list():
-                if context_request == cache.display_name or context_request == "all":
+                if (
+                    context_request == "all"
+                    or context_request == cache.display_name
+                    or (cache.display_name or "").startswith(context_request + "_ASSETS_")
+                ):
                     genai_client.caches.delete(name=cache.name)
+                    forget_context_cache(cache.name)
 
             log_event(
                 session_id=session_id,
@@ -1309,13 +3680,23 @@ def route_chat_context():
             # Extract chat data parameters
             prompt_preamble = data.get("prompt_preamble", "")
 
-            response = create_gemini_context(
-                context_request=context_request,
-                preamble=prompt_preamble,
-                generate_cache=True,
-                app_version=app_version,
-                is_spatial=is_spatial,
-            )
+            try:
+                response = create_gemini_context(
+                    context_request=context_request,
+                    preamble=prompt_preamble,
+                    generate_cache=True,
+                    app_version=app_version,
+                    is_spatial=is_spatial,
+                )
+            except Gemini_Busy as e:
+                # Another worker is still building this cache
+                log_event(
+                    session_id=session_id,
+                    app_version=app_version,
+                    log_id=g.log_entry,
+                    app_response=f"ERROR: {str(e)}",
+                )
+                return jsonify({"Error": str(e)}), 503
 
             log_event(
                 session_id=session_id,
@@ -1340,12 +3721,9 @@ def chat_summary():
         for msg in messages
     )
 
-    summary_file_path = "./prompts/get_summary.txt"
-
     # Read the content from the get_summary.txt file
     try:
-        with open(summary_file_path, "r") as file:
-            file_content = file.read()
+        file_content = get_prompt("get_summary.txt")
 
         # Combine the file content with the chat transcript to form the full prompt
         full_prompt = f"{file_content}\n{chat_transcript}"
@@ -1361,6 +3739,8 @@ def chat_summary():
         summary = get_gemini_response(prompt=full_prompt, cache_name=None)
         return jsonify({"summary": summary})
 
+    except Gemini_Busy as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         print(f"✖ Error summarizing chat: {e}")
         return jsonify({"error": str(e)}), 500
@@ -1374,12 +3754,9 @@ def identify_places():
     if not message:
         return jsonify({"error": "No message provided."}), 400
 
-    prompt_file_path = "./prompts/identify_places.txt"
-
     # Read the content from identify_places.txt
     try:
-        with open(prompt_file_path, "r") as file:
-            file_content = file.read()
+        file_content = get_prompt("identify_places.txt")
 
         # Combine the file content with the message to form the full prompt
         full_prompt = f"{file_content}\n{message}"
@@ -1395,6 +3772,8 @@ def identify_places():
         places = get_gemini_response(prompt=full_prompt, cache_name=None)
         return jsonify(places)
 
+    except Gemini_Busy as e:
+        return jsonify({"error": str(e)}), 503
     except Exception as e:
         print(f"✖ Error identifying places: {e}")
         return jsonify({"error": str(e)}), 500
@@ -1565,5 +3944,21 @@ def route_all_llm_summaries():
             conn.close()
 
 
+# Warm-up runs as soon as the app is loaded, before the first request: fill the context cache
+# registry with one caches.list(), so first requests for existing caches go straight to them
+try:
+    load_context_cache_registry()
+except Exception as e:
+    print(
+        f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error loading context caches:{Font_Colors.ENDC} {e}"
+    )
+start_context_cache_refresher()
+try:
+    get_retrieval_index()
+except Exception as e:
+    print(
+        f"{Font_Colors.FAIL}{Font_Colors.BOLD}✖ Error building retrieval index:{Font_Colors.ENDC} {e}"
+    )
+
 if __name__ == "__main__":
     app.run(host=Config.HOST, port=Config.PORT, debug=True)
@@ -0,0 +1,187 @@
+import os
+import resource
+import sys
+from pathlib import Path
+from unittest import mock
+
+import mysql.connector
+import pytest
+from dotenv import load_dotenv
+
+#
+# Fixtures for the data path benchmarks. They run against the database in .env (DB_*),
+# filled with setup/generate_synthetic_data.py and setup/post_ingest.py --full, and are
+# skipped when it can't be reached.
+#
+# The behaviour tests (test_data_query.py, test_chat_context.py, test_log_writer.py) cover
+# functions that don't need the database and run without one; fake_db hands them rows.
+#
+
+API_DIR = Path(__file__).parent.parent
+
+load_dotenv()
+
+# api.py reads these at import; the benchmarks never call Gemini
+os.environ.setdefault("RETHINKAI_API_KEYS", "benchmark")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("GEMINI_MODEL", "benchmark")
+# Every request has to reach the database, never the response cache
+os.environ["RESPONSE_CACHE_MAX_ENTRY_BYTES"] = "0"
+
+
+class Unreachable_Pool:
+    """Stands in for MySQLConnectionPool when there is no database: every checkout fails."""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def get_connection(self):
+        raise mysql.connector.errors.PoolError("No database for the behaviour tests")
+
+
+@pytest.fixture(scope="session")
+def api_module():
+    """The api module, imported without a database when none can be reached."""
+    sys.path.insert(0, str(API_DIR))
+    try:
+        import api
+    except mysql.connector.Error:  # the pool connects at import
+        with mock.patch("mysql.connector.pooling.MySQLConnectionPool", Unreachable_Pool):
+            import api
+    return api
+
+
+@pytest.fixture(scope="session")
+def api(api_module):
+    try:
+        conn = api_module.get_db_connection()
+    except mysql.connector.Error as e:
+        pytest.skip(f"API not connected to the benchmark database: {e}")
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM bos311_data")
+        rows = cursor.fetchone()[0]
+        cursor.close()
+    except mysql.connector.Error as e:
+        pytest.skip(f"Benchmark database not ready: {e}")
+    finally:
+        conn.close()
+    if not rows:
+        pytest.skip("bos311_data is empty, run setup/generate_synthetic_data.py first")
+    return api_module
+
+
+@pytest.fixture(scope="session")
+def client(api):
+    return api.app.test_client()
+
+
+@pytest.fixture(scope="session")
+def headers(api):
+    return {"RethinkAI-API-Key": api.Config.RETHINKAI_API_KEYS[0]}
+
+
+@pytest.fixture(scope="session")
+def sample(api):
+    """Event ids and H3 cells to select, as a client would after a map selection."""
+    conn = api.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT id FROM bos311_data WHERE {api.SQLConstants.BOS311_BASE_WHERE} ORDER BY id LIMIT 1000"
+        )
+        event_ids = [str(row[0]) for row in cursor.fetchall()]
+        cursor.execute(
+            f"SELECT DISTINCT h3_res10 FROM bos311_data WHERE h3_res10 IS NOT NULL AND {api.SQLConstants.BOS311_BASE_WHERE} LIMIT 200"
+        )
+        cells = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+    finally:
+        conn.close()
+    return {"event_ids": event_ids, "cells": cells}
+
+
+class Fake_Cursor:
+    def __init__(self, db):
+        self.db = db
+        self.rows = []
+        self.description = None
+
+    def execute(self, query, params=None):
+        self.db.queries.append((query, params))
+        if self.db.error:
+            raise self.db.error
+        self.description = [(name, type_code) + (None,) * 5 for name, type_code in self.db.columns]
+        self.rows = list(self.db.rows)
+
+    def executemany(self, query, params):
+        self.db.queries.append((query, list(params)))
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class Fake_Connection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self, **kwargs):
+        return Fake_Cursor(self.db)
+
+    def commit(self):
+        self.db.commits += 1
+
+    def close(self):
+        pass
+
+
+class Fake_Database:
+    """Rows every query returns (columns are (name, FieldType) pairs) and the queries run."""
+
+    def __init__(self):
+        self.columns = []
+        self.rows = []
+        self.queries = []
+        self.commits = 0
+        self.error = None
+
+
+@pytest.fixture
+def fake_db(api_module, monkeypatch):
+    db = Fake_Database()
+    monkeypatch.setattr(api_module, "get_db_connection", lambda: Fake_Connection(db))
+    return db
+
+
+def reset_peak_rss() -> bool:
+    """Reset the kernel's peak RSS counter (Linux only), so the next reading covers one benchmark."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Process lifetime peak; kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, jsonify, request, stream_with_context
+
+#
+# Offline stand-in for the Gemini REST API, for load and latency testing /chat, /chat/context,
+# /chat/summary and /chat/identify_places without quota limits, cost or network access.
+#
+# Serves the endpoints behind the genai calls api.py makes: models.generate_content (and
+# generate_content_stream), models.count_tokens and caches.list/create/get/update/delete.
+# Point the API at it with GEMINI_BASE_URL, any GEMINI_API_KEY / GEMINI_MODEL will do:
+#
+#   python3 test/fake_gemini_server.py --port 8999 --latency 0.8 --tokens-per-second 80
+#   GEMINI_BASE_URL=http://127.0.0.1:8999 gunicorn --bind=127.0.0.1:8888 api:app
+#
+# Tokens are estimated at CHARS_PER_TOKEN characters each. Answers are filler text, or JSON
+# shaped like the request's responseSchema for structured responses. GET /stats returns
+# request and injected failure counts.
+#
+
+CHARS_PER_TOKEN = 4
+FILLER = (
+    "Residents in the area reported a steady number of issues this month, with street "
+    "cleaning and parking requests leading and living condition complaints close behind. "
+)
+
+app = Flask(__name__)
+
+# Set from the command line in main()
+settings = {
+    "latency": 0.5,
+    "jitter": 0.2,
+    "tokens_per_second": 100.0,
+    "output_tokens": 300,
+    "chunk_tokens": 20,
+    "cache_latency": 2.0,
+    "error_rate": 0.0,
+    "rate_limit_rate": 0.0,
+}
+
+# name -> cached content resource, as returned by the API
+caches = {}
+caches_lock = threading.Lock()
+
+stats = {"requests": {}, "errors_injected": 0, "rate_limits_injected": 0}
+stats_lock = threading.Lock()
+
+
+def count_request(kind: str) -> None:
+    with stats_lock:
+        stats["requests"][kind] = stats["requests"].get(kind, 0) + 1
+
+
+def timestamp(at: float) -> str:
+    return datetime.datetime.fromtimestamp(at, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def parse_timestamp(value: str) -> float:
+    value = re.sub(r"(\.\d{6})\d*", r"\1", value.replace("Z", "+00:00"))
+    return datetime.datetime.fromisoformat(value).timestamp()
+
+
+def estimate_tokens(value) -> int:
+    """Tokens in a request body fragment, from the length of its text parts."""
+    if isinstance(value, dict):
+        return sum(estimate_tokens(v) for k, v in value.items() if k != "role")
+    if isinstance(value, list):
+        return sum(estimate_tokens(v) for v in value)
+    if isinstance(value, str):
+        return max(1, len(value) // CHARS_PER_TOKEN)
+    return 0
+
+
+def api_error(code: int, status: str, message: str):
+    return jsonify({"error": {"code": code, "message": message, "status": status}}), code
+
+
+def injected_failure():
+    """An error response for this call, at the configured rates, or None."""
+    roll = random.random()
+    if roll < settings["rate_limit_rate"]:
+        with stats_lock:
+            stats["rate_limits_injected"] += 1
+        return api_error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (fake).")
+    if roll < settings["rate_limit_rate"] + settings["error_rate"]:
+        with stats_lock:
+            stats["errors_injected"] += 1
+        return api_error(500, "INTERNAL", "An internal error has occurred (fake).")
+    return None
+
+
+def wait(seconds: float) -> None:
+    time.sleep(max(0.0, seconds + random.uniform(-settings["jitter"], settings["jitter"])))
+
+
+def live_cache(name: str):
+    with caches_lock:
+        cache = caches.get(name)
+        if cache and parse_timestamp(cache["expireTime"]) <= time.time():
+            del caches[name]
+            cache = None
+        return cache
+
+
+def fake_json(schema: dict, depth: int = 0):
+    """A value matching a responseSchema, with placeholder strings and numbers."""
+    kind = (schema.get("type") or "STRING").upper()
+    if kind == "ARRAY":
+        return [fake_json(schema.get("items", {}), depth + 1) for _ in range(2 if depth < 2 else 1)]
+    if kind == "OBJECT":
+        return {key: fake_json(value, depth + 1) for key, value in schema.get("properties", {}).items()}
+    if kind in ("NUMBER", "INTEGER"):
+        return random.randint(1, 100)
+    if kind == "BOOLEAN":
+        return random.random() < 0.5
+    return "fake"
+
+
+def answer_text(body: dict) -> str:
+    config = body.get("generationConfig", {})
+    if config.get("responseMimeType") == "application/json":
+        return json.dumps(fake_json(config.get("responseSchema", {"type": "STRING"})))
+    length = settings["output_tokens"] * CHARS_PER_TOKEN
+    return (FILLER * (length // len(FILLER) + 1))[:length]
+
+
+def usage(body: dict, text: str) -> dict:
+    prompt_tokens = estimate_tokens(body.get("contents", []))
+    cached_tokens = 0
+    cache = live_cache(body["cachedContent"]) if body.get("cachedContent") else None
+    if cache:
+        cached_tokens = cache["usageMetadata"]["totalTokenCount"]
+    output_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+    result = {
+        "promptTokenCount": prompt_tokens + cached_tokens,
+        "candidatesTokenCount": output_tokens,
+        "totalTokenCount": prompt_tokens + cached_tokens + output_tokens,
+    }
+    if cached_tokens:
+        result["cachedContentTokenCount"] = cached_tokens
+    return result
+
+
+def candidate(text: str, finished: bool) -> dict:
+    result = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finished:
+        result["finishReason"] = "STOP"
+    return result
+
+
+@app.route("/<version>/models/<path:model_action>", methods=["POST"])
+def route_model(version, model_action):
+    model, _, action = model_action.rpartition(":")
+    body = request.get_json(silent=True) or {}
+    count_request(action)
+
+    if action not in ("generateContent", "streamGenerateContent", "countTokens"):
+        return api_error(404, "NOT_FOUND", f"Unknown method {action}.")
+
+    failure = injected_failure()
+    if failure:
+        return failure
+
+    if action == "countTokens":
+        return jsonify({"totalTokens": estimate_tokens(body.get("contents", []))})
+
+    if body.get("cachedContent") and not live_cache(body["cachedContent"]):
+        return api_error(404, "NOT_FOUND", f"CachedContent not found: {body['cachedContent']}")
+
+    text = answer_text(body)
+    if action == "generateContent":
+        wait(settings["latency"] + len(text) / CHARS_PER_TOKEN / settings["tokens_per_second"])
+        return jsonify(
+            {
+                "candidates": [candidate(text, finished=True)],
+                "usageMetadata": usage(body, text),
+                "modelVersion": model.rsplit("/", 1)[-1],
+            }
+        )
+
+    # Server-sent events, one chunk per chunk_tokens tokens paced at tokens_per_second
+    def events():
+        wait(settings["latency"])
+        step = settings["chunk_tokens"] * CHARS_PER_TOKEN
+        for start in range(0, len(text), step):
+            piece = text[start : start + step]
+            if start:
+                time.sleep(len(piece) / CHARS_PER_TOKEN / settings["tokens_per_second"])
+            finished = start + step >= len(text)
+            chunk = {"candidates": [candidate(piece, finished)], "modelVersion": model.rsplit("/", 1)[-1]}
+            if finished:
+                chunk["usageMetadata"] = usage(body, text)
+            yield f"data: {json.dumps(chunk)}\r\n\r\n"
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream")
+
+
+@app.route("/<version>/cachedContents", methods=["GET", "POST"])
+def route_caches(version):
+    if request.method == "GET":
+        count_request("caches.list")
+        with caches_lock:
+            names = list(caches)
+        listed = [cache for cache in (live_cache(name) for name in names) if cache]
+        return jsonify({"cachedContents": listed})
+
+    count_request("caches.create")
+    failure = injected_failure()
+    if failure:
+        return failure
+
+    body = request.get_json(silent=True) or {}
+    wait(settings["cache_latency"])
+    now = time.time()
+    if body.get("expireTime"):
+        expires = parse_timestamp(body["expireTime"])
+    else:
+        expires = now + float(str(body.get("ttl", "3600s")).rstrip("s"))
+    cache = {
+        "name": f"cachedContents/{uuid.uuid4().hex[:12]}",
+        "displayName": body.get("displayName", ""),
+        "model": body.get("model", ""),
+        "createTime": timestamp(now),
+        "updateTime": timestamp(now),
+        "expireTime": timestamp(expires),
+        "usageMetadata": {
+            "totalTokenCount": estimate_tokens(body.get("contents", []))
+            + estimate_tokens(body.get("systemInstruction", {}))
+        },
+    }
+    with caches_lock:
+        caches[cache["name"]] = cache
+    return jsonify(cache)
+
+
+CACHE_METHODS = {"GET": "caches.get", "PATCH": "caches.update", "DELETE": "caches.delete"}
+
+
+@app.route("/<version>/cachedContents/<cache_id>", methods=["GET", "PATCH", "DELETE"])
+def route_cache(version, cache_id):
+    name = f"cachedContents/{cache_id}"
+    count_request(CACHE_METHODS[request.method])
+    cache = live_cache(name)
+    if not cache:
+        return api_error(404, "NOT_FOUND", f"CachedContent not found: {name}")
+
+    if request.method == "DELETE":
+        with caches_lock:
+            caches.pop(name, None)
+        return jsonify({})
+
+    if request.method == "PATCH":
+        body = request.get_json(silent=True) or {}
+        now = time.time()
+        with caches_lock:
+            if body.get("expireTime"):
+                cache["expireTime"] = timestamp(parse_timestamp(body["expireTime"]))
+            elif body.get("ttl"):
+                cache["expireTime"] = timestamp(now + float(str(body["ttl"]).rstrip("s")))
+            cache["updateTime"] = timestamp(now)
+    return jsonify(cache)
+
+
+@app.route("/stats", methods=["GET"])
+def route_stats():
+    with stats_lock:
+        result = json.loads(json.dumps(stats))
+    with caches_lock:
+        result["caches"] = len(caches)
+    result["settings"] = settings
+    return jsonify(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline stand-in for the Gemini API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8999)
+    parser.add_argument("--latency", type=float, default=settings["latency"], help="seconds before the first token (default: 0.5)")
+    parser.add_argument("--jitter", type=float, default=settings["jitter"], help="± seconds of random latency added to each wait (default: 0.2)")
+    parser.add_argument("--tokens-per-second", type=float, default=settings["tokens_per_second"], help="generation speed after the first token (default: 100)")
+    parser.add_argument("--output-tokens", type=int, default=settings["output_tokens"], help="length of text answers (default: 300)")
+    parser.add_argument("--chunk-tokens", type=int, default=settings["chunk_tokens"], help="tokens per streamed chunk (default: 20)")
+    parser.add_argument("--cache-latency", type=float, default=settings["cache_latency"], help="seconds to create a context cache (default: 2)")
+    parser.add_argument("--error-rate", type=float, default=settings["error_rate"], help="share of calls failing with 500 INTERNAL (default: 0)")
+    parser.add_argument("--rate-limit-rate", type=float, default=settings["rate_limit_rate"], help="share of calls failing with 429 RESOURCE_EXHAUSTED (default: 0)")
+    args = parser.parse_args()
+
+    if args.tokens_per_second <= 0 or args.chunk_tokens <= 0:
+        parser.error("--tokens-per-second and --chunk-tokens must be positive")
+
+    settings.update({key: getattr(args, key) for key in settings})
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+import argparse
+import concurrent.futures
+import csv
+import datetime
+import json
+import math
+import os
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from dotenv import load_dotenv
+
+#
+# Replays traffic recorded in interaction_log against a local API, keeping the recorded
+# request mix and inter-arrival times, sped up --speed times. Meant for a local API backed by
+# the synthetic database (setup/generate_synthetic_data.py) and test/fake_gemini_server.py.
+#
+# Every request is logged as client_query = "Request: [METHOD] url". Request bodies aren't,
+# so they are rebuilt: /chat questions come from the session's "User question: ..." row,
+# POST /data/query selects the first REPLAY_EVENT_IDS ids, PUT /log reuses the session's last
+# log_id, and the other POST routes get a fixed placeholder body. Each recorded session
+# replays with its own cookie jar.
+#
+# Reports count, error rate and p50/p95/p99 latency per route (and per data_request for
+# /data/query). Requests are sent on schedule from a --workers thread pool; "late" counts
+# requests that left more than a second behind schedule because the pool was busy.
+#
+#   python3 test/replay_traffic.py interaction_log.csv --speed 10 --target http://127.0.0.1:8888
+#   python3 test/replay_traffic.py --from-db --since 2025-05-01 --until 2025-05-08 --speed 50
+#
+
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "database": os.getenv("DB_NAME"),
+}
+
+REQUEST_LINE = re.compile(r"^Request: \[(\w+)\] (\S+)")
+QUESTION_PREFIX = "User question: "
+# A /chat request and its answer row are written within this many seconds of each other
+QUESTION_WINDOW = 300
+REPLAY_EVENT_IDS = 1000
+LATE_SECONDS = 1.0
+
+PLACEHOLDER_BODIES = {
+    "/chat": {"client_query": "What are the most common 311 requests this month?"},
+    "/chat/summary": {
+        "messages": [
+            {"sender": "user", "text": "What are the most common 311 requests this month?"},
+            {"sender": "chat", "text": "Street cleaning and parking enforcement requests lead this month."},
+        ]
+    },
+    "/chat/identify_places": {"message": "Is there a park near Talbot Avenue and Norfolk Street?"},
+    "/chat/context": {},
+    "/log": {"client_query": "replay", "app_response": "replay"},
+}
+
+
+def parse_time(value) -> datetime.datetime:
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(str(value).strip())
+
+
+def read_csv(path: str) -> list:
+    """Rows of an interaction_log export with a header row (comma or tab separated)."""
+    with open(path, newline="", encoding="utf-8") as f:
+        dialect = csv.Sniffer().sniff(f.read(4096), delimiters=",\t")
+        f.seek(0)
+        return list(csv.DictReader(f, dialect=dialect))
+
+
+def read_db(since: str, until: str) -> list:
+    import mysql.connector
+
+    connection = mysql.connector.connect(**DB_CONFIG)
+    try:
+        cursor = connection.cursor(dictionary=True)
+        query = "SELECT session_id, created_at, client_query, prompt_preamble, data_attributes FROM interaction_log WHERE created_at >= %s"
+        params = [since]
+        if until:
+            query += " AND created_at < %s"
+            params.append(until)
+        cursor.execute(query + " ORDER BY created_at, id", params)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+    finally:
+        connection.close()
+
+
+def build_schedule(rows: list, strip_prefix: str = "") -> list:
+    """Requests to replay, sorted by time, with the bodies rebuilt as well as the log allows."""
+    requests_out = []
+    questions = {}
+    for row in rows:
+        query = row.get("client_query") or ""
+        if not row.get("created_at"):
+            continue
+        at = parse_time(row["created_at"])
+        match = REQUEST_LINE.match(query)
+        if match:
+            method, url = match.groups()
+            parts = urlsplit(url)
+            path = parts.path
+            # Deployed behind a proxy, e.g. https://boston.ourcommunity.is/api/chat
+            if strip_prefix and path.startswith(strip_prefix + "/"):
+                path = path[len(strip_prefix):]
+            requests_out.append(
+                {
+                    "at": at,
+                    "session": row.get("session_id") or "",
+                    "method": method,
+                    "path": path,
+                    "query": parts.query,
+                }
+            )
+        elif query.startswith(QUESTION_PREFIX):
+            questions.setdefault(row.get("session_id") or "", []).append(
+                (
+                    at,
+                    {
+                        "client_query": query[len(QUESTION_PREFIX):],
+                        "prompt_preamble": row.get("prompt_preamble") or "",
+                        "data_attributes": row.get("data_attributes") or "",
+                    },
+                )
+            )
+
+    requests_out.sort(key=lambda r: r["at"])
+    for entries in questions.values():
+        entries.sort(key=lambda entry: entry[0])
+
+    for r in requests_out:
+        if r["method"] not in ("POST", "PUT"):
+            continue
+        if r["path"] == "/chat":
+            # The answer row is written after the request row, in the same session
+            entries = questions.get(r["session"], [])
+            while entries and entries[0][0] < r["at"]:
+                entries.pop(0)
+            if entries and (entries[0][0] - r["at"]).total_seconds() <= QUESTION_WINDOW:
+                r["body"] = entries.pop(0)[1]
+        elif r["path"] == "/data/query":
+            r["body"] = {"event_ids": list(range(1, REPLAY_EVENT_IDS + 1))}
+        r.setdefault("body", PLACEHOLDER_BODIES.get(r["path"], {}))
+    return requests_out
+
+
+def route_name(r: dict) -> str:
+    name = f"{r['method']} {r['path']}"
+    if r["path"] == "/data/query":
+        data_request = parse_qs(r["query"]).get("request", [""])[0]
+        name += f" {data_request}"
+    return name
+
+
+class Replay:
+    """Sends the schedule and collects (route, latency, ok) results."""
+
+    def __init__(self, target: str, api_key: str, speed: float, workers: int, timeout: float):
+        self.target = target.rstrip("/")
+        self.headers = {"RethinkAI-API-Key": api_key}
+        self.speed = speed
+        self.timeout = timeout
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+        self.sessions = {}
+        self.log_ids = {}
+        self.results = []
+        self.late = 0
+        self.lock = threading.Lock()
+
+    def session(self, name: str) -> requests.Session:
+        with self.lock:
+            if name not in self.sessions:
+                self.sessions[name] = requests.Session()
+            return self.sessions[name]
+
+    def send(self, r: dict, due: float) -> None:
+        started = time.perf_counter()
+        if started - due > LATE_SECONDS:
+            with self.lock:
+                self.late += 1
+
+        body = r.get("body")
+        if r["method"] == "PUT" and r["path"] == "/log":
+            body = dict(body, log_id=self.log_ids.get(r["session"], ""))
+        url = f"{self.target}{r['path']}" + (f"?{r['query']}" if r["query"] else "")
+        ok = False
+        # Only POST /log bodies are kept, for the log_id a later PUT /log updates
+        keep = r["method"] == "POST" and r["path"] == "/log"
+        try:
+            with self.session(r["session"]).request(
+                r["method"],
+                url,
+                json=body if r["method"] in ("POST", "PUT") else None,
+                headers=self.headers,
+                timeout=self.timeout,
+                stream=True,
+            ) as response:
+                chunks = [chunk for chunk in response.iter_content(chunk_size=65536) if keep]
+                ok = response.status_code < 400
+                if ok and keep:
+                    self.log_ids[r["session"]] = json.loads(b"".join(chunks)).get("log_id", "")
+        except (requests.RequestException, ValueError):
+            pass
+        finally:
+            with self.lock:
+                self.results.append((route_name(r), time.perf_counter() - started, ok))
+
+    def run(self, schedule: list) -> float:
+        start = time.perf_counter()
+        first = schedule[0]["at"]
+        futures = []
+        for r in schedule:
+            due = start + (r["at"] - first).total_seconds() / self.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(self.pool.submit(self.send, r, due))
+        concurrent.futures.wait(futures)
+        self.pool.shutdown()
+        return time.perf_counter() - start
+
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def summarize(results: list) -> dict:
+    routes = {}
+    for route, latency, ok in results:
+        routes.setdefault(route, []).append((latency, ok))
+    summary = {}
+    for route, entries in sorted(routes.items()):
+        latencies = sorted(latency for latency, _ in entries)
+        errors = sum(1 for _, ok in entries if not ok)
+        summary[route] = {
+            "count": len(entries),
+            "error_rate": errors / len(entries),
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay interaction_log traffic against a local API.")
+    parser.add_argument("export", nargs="?", help="CSV/TSV export of interaction_log with a header row")
+    parser.add_argument("--from-db", action="store_true", help="read interaction_log from the database in .env instead")
+    parser.add_argument("--since", default="1970-01-01", help="with --from-db, earliest created_at to replay")
+    parser.add_argument("--until", default="", help="with --from-db, created_at to stop before")
+    parser.add_argument("--target", default="http://127.0.0.1:8888", help="API base URL (default: http://127.0.0.1:8888)")
+    parser.add_argument("--api-key", default=(os.getenv("RETHINKAI_API_KEYS") or "").split(",")[0], help="RethinkAI-API-Key header (default: first of RETHINKAI_API_KEYS)")
+    parser.add_argument("--strip-prefix", default="/api", help="path prefix the deployed API is mounted under (default: /api)")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay N times faster than recorded (default: 1)")
+    parser.add_argument("--limit", type=int, default=0, help="replay only the first N requests")
+    parser.add_argument("--workers", type=int, default=64, help="concurrent requests in flight at most (default: 64)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds per request (default: 300)")
+    parser.add_argument("--json", dest="json_out", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    if bool(args.export) == args.from_db:
+        parser.error("give either an export file or --from-db")
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+
+    rows = read_db(args.since, args.until) if args.from_db else read_csv(args.export)
+    schedule = build_schedule(rows, args.strip_prefix.rstrip("/"))
+    if args.limit:
+        schedule = schedule[: args.limit]
+    if not schedule:
+        parser.error('no "Request: [METHOD] url" rows to replay')
+
+    recorded = (schedule[-1]["at"] - schedule[0]["at"]).total_seconds()
+    print(f"Replaying {len(schedule)} requests from {len(set(r['session'] for r in schedule))} sessions, "
+          f"{recorded:.0f}s recorded at {args.speed:g}x against {args.target}")
+
+    replay = Replay(args.target, args.api_key, args.speed, args.workers, args.timeout)
+    elapsed = replay.run(schedule)
+    summary = summarize(replay.results)
+
+    print(f"\n{'route':<44}{'count':>8}{'errors':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, s in summary.items():
+        print(f"{route:<44}{s['count']:>8}{s['error_rate']:>9.1%}{s['p50_ms']:>10.0f}{s['p95_ms']:>10.0f}{s['p99_ms']:>10.0f}")
+    total_errors = sum(1 for _, _, ok in replay.results if not ok)
+    print(f"\n{len(replay.results)} requests in {elapsed:.1f}s ({len(replay.results) / elapsed:.1f}/s), "
+          f"{total_errors / len(replay.results):.1%} errors, {replay.late} sent more than {LATE_SECONDS:g}s late")
+
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(
+                {"elapsed_s": elapsed, "speed": args.speed, "late": replay.late, "routes": summary},
+                f,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
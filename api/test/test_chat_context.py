@@ -0,0 +1,222 @@
+import json
+import math
+import os
+
+import pytest
+from mysql.connector import FieldType
+
+#
+# Behaviour tests for the /chat context helpers: the BM25 passage index used when no context
+# cache is built, the local token estimates behind GET /chat/context, and the 503 /chat and
+# POST /chat/context return while another worker builds the context cache.
+#
+#   pytest test/test_chat_context.py
+#
+
+DOCUMENTS = {
+    "rodents.txt": "Rodent activity rose in Dorchester this summer.\n\n"
+    "Residents reported rats near trash bins and rodent burrows in yards.",
+    "parking.txt": "Parking enforcement tickets cars on street cleaning days.\n\n"
+    "Space savers are removed after snow emergencies end.",
+    "meeting.txt": "The community meeting covered parking, trash pickup and a new park.",
+}
+
+
+#
+# BM25 retrieval
+#
+@pytest.fixture
+def chunk_words(api_module, monkeypatch):
+    monkeypatch.setattr(api_module.Config, "RETRIEVAL_CHUNK_WORDS", 10)
+    return 10
+
+
+@pytest.fixture
+def retrieval_index(api_module, monkeypatch):
+    monkeypatch.setattr(api_module.Config, "RETRIEVAL_CHUNK_WORDS", 12)
+    chunks = []
+    for name, text in sorted(DOCUMENTS.items()):
+        chunks.extend(api_module.index_document(name, text))
+    index = api_module.prepare_retrieval_index({"files": {}, "chunk_words": 12, "chunks": chunks})
+    monkeypatch.setattr(api_module, "get_retrieval_index", lambda: index)
+    return index
+
+
+def test_terms_are_lowercased_without_stopwords(api_module):
+    assert api_module.retrieval_terms("Where are the RATS in Dorchester?") == ["rats", "dorchester"]
+
+
+def test_paragraphs_are_packed_into_passages(api_module, chunk_words):
+    text = "one two three\n\nfour five six seven\n\neight nine ten eleven"
+    assert api_module.chunk_document("notes.txt", text) == [
+        "one two three\nfour five six seven",
+        "eight nine ten eleven",
+    ]
+
+
+def test_long_paragraph_is_cut_to_passage_size(api_module, chunk_words):
+    words = [f"w{i}" for i in range(25)]
+    chunks = api_module.chunk_document("notes.txt", " ".join(words))
+    assert [chunk.split() for chunk in chunks] == [words[0:10], words[10:20], words[20:25]]
+
+
+def test_csv_passages_repeat_the_header(api_module, chunk_words):
+    text = "month,category,count\n" + "\n".join(f"2019-{m:02d},Parking,{m}" for m in range(1, 13))
+    chunks = api_module.chunk_document("summary.csv", text)
+    assert len(chunks) > 1
+    assert all(chunk.startswith("month,category,count\n") for chunk in chunks)
+    rows = [line for chunk in chunks for line in chunk.splitlines()[1:]]
+    assert rows == text.splitlines()[1:]
+
+
+def test_empty_document_has_no_passages(api_module, chunk_words):
+    assert api_module.chunk_document("empty.txt", "\n\n  \n") == []
+    assert api_module.chunk_document("empty.csv", "") == []
+
+
+def test_best_passage_ranks_first(api_module, retrieval_index):
+    passages = api_module.retrieve_passages("rodent rats in yards")
+    assert passages[0]["file"] == "rodents.txt"
+    assert "rats" in passages[0]["text"]
+    assert [p["score"] for p in passages] == sorted((p["score"] for p in passages), reverse=True)
+
+
+def test_rare_terms_outweigh_common_ones(api_module, retrieval_index):
+    # "parking" appears in two documents, "snow" only in one
+    passages = api_module.retrieve_passages("parking snow")
+    assert "snow" in passages[0]["text"]
+
+
+def test_top_k_limits_passages(api_module, retrieval_index):
+    assert len(api_module.retrieve_passages("parking trash rodent", top_k=2)) == 2
+
+
+def test_unmatched_question_retrieves_nothing(api_module, retrieval_index):
+    assert api_module.retrieve_passages("what is the weather") == []
+    assert api_module.retrieve_passages("the and of") == []
+
+
+#
+# Token estimates
+#
+@pytest.fixture
+def calibration_path(api_module, monkeypatch, tmp_path):
+    path = tmp_path / "token_calibration.json"
+    monkeypatch.setattr(api_module.Config, "TOKEN_CALIBRATION_PATH", path)
+    return path
+
+
+def write_calibration(path, kinds: dict) -> None:
+    path.write_text(json.dumps(kinds), encoding="utf-8")
+    # Force a new mtime even on filesystems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_token_kind_by_extension(api_module):
+    assert api_module.token_kind("summary.CSV") == "csv"
+    assert api_module.token_kind("notes.txt") == "text"
+    assert api_module.token_kind("prompt") == "text"
+
+
+def test_default_ratios_without_calibration(api_module, calibration_path):
+    assert api_module.estimate_tokens("") == 0
+    assert api_module.estimate_tokens("a" * 10) == math.ceil(10 / 4.0)
+    assert api_module.estimate_tokens("1" * 10, "csv") == math.ceil(10 / 3.0)
+
+
+def test_calibration_file_sets_ratio(api_module, calibration_path):
+    write_calibration(calibration_path, {"text": {"chars": 500, "tokens": 100}})
+    assert api_module.chars_per_token("text") == 5.0
+    assert api_module.estimate_tokens("a" * 11) == 3
+    # Kinds without a measurement keep the default
+    assert api_module.chars_per_token("csv") == 3.0
+
+
+def test_unreadable_calibration_falls_back_to_defaults(api_module, calibration_path):
+    calibration_path.write_text("{not json", encoding="utf-8")
+    assert api_module.chars_per_token("text") == 4.0
+
+
+def test_asset_estimates_are_kept_until_calibration_changes(api_module, calibration_path):
+    asset = {"sha1": "feedface", "text": "a" * 100}
+    assert api_module.asset_tokens("notes.txt", asset) == 25
+
+    # Same content hash, so the kept estimate is used
+    assert api_module.asset_tokens("notes.txt", {"sha1": "feedface", "text": "a" * 400}) == 25
+
+    write_calibration(calibration_path, {"text": {"chars": 1000, "tokens": 100}})
+    assert api_module.asset_tokens("notes.txt", asset) == 10
+
+
+#
+# Context cache build lock
+#
+@pytest.fixture
+def cache_being_built(api_module, fake_db, monkeypatch):
+    """Another worker holds the build lock for every context cache. Returns the queued log events."""
+    fake_db.columns = [("GET_LOCK", FieldType.LONG)]
+    fake_db.rows = [(0,)]
+    monkeypatch.setattr(api_module.Config, "GEMINI_CACHE_BUILD_TIMEOUT", 0)
+    monkeypatch.setattr(api_module, "load_context_cache_registry", lambda: None)
+    monkeypatch.setattr(api_module, "find_context_cache", lambda key, touch=True: None)
+    monkeypatch.setattr(
+        api_module, "build_gemini_context", lambda *args, **kwargs: pytest.fail("built without the lock")
+    )
+    events = []
+    monkeypatch.setattr(api_module, "queue_log_event", lambda kind, fields, log_id="": events.append(fields))
+    return events
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "/chat?app_version=0.7.0&context_request=experiment_7",
+        "/chat?app_version=0.7.0&context_request=experiment_7&stream=true",
+        "/chat/context?app_version=0.7.0&context_request=experiment_7",
+    ],
+    ids=["chat", "chat stream", "chat context"],
+)
+def test_busy_cache_build_returns_503(api_module, cache_being_built, path):
+    client = api_module.app.test_client()
+    response = client.post(
+        path,
+        json={"client_query": "How many rodent reports?"},
+        headers={"RethinkAI-API-Key": api_module.Config.RETHINKAI_API_KEYS[0]},
+    )
+    assert response.status_code == 503
+    assert "still being built" in response.get_json()["Error"]
+    # The request's log entry records the error
+    assert cache_being_built[-1]["app_response"].startswith("ERROR: ")
+
+
+def test_chat_retry_after_missing_cache_keeps_instruction_and_memoizes(api_module, monkeypatch):
+    caches = iter(["cachedContents/gone", "cachedContents/rebuilt"])
+    monkeypatch.setattr(api_module, "create_gemini_context", lambda **kwargs: next(caches))
+    monkeypatch.setattr(api_module, "forget_context_cache", lambda name: None)
+    monkeypatch.setattr(api_module, "get_data_version", lambda: "v1")
+    monkeypatch.setattr(api_module, "get_chat_answer", lambda key: None)
+    monkeypatch.setattr(api_module, "log_event", lambda **kwargs: 1)
+    saved = {}
+    monkeypatch.setattr(api_module, "save_chat_answer", lambda key, answer: saved.update({key: answer}))
+    calls = []
+
+    def get_gemini_response(**kwargs):
+        calls.append(kwargs)
+        if kwargs["cache_name"] == "cachedContents/gone":
+            raise api_module.Context_Cache_Missing(kwargs["cache_name"])
+        return "Rodent reports rose in June."
+
+    monkeypatch.setattr(api_module, "get_gemini_response", get_gemini_response)
+
+    response = api_module.app.test_client().post(
+        "/chat?app_version=0.7.0&context_request=experiment_7",
+        json={"client_query": "How many rodent reports?"},
+        headers={"RethinkAI-API-Key": api_module.Config.RETHINKAI_API_KEYS[0]},
+    )
+    assert response.status_code == 200
+    assert [call["system_instruction"] for call in calls] == ["", ""]
+    key = api_module.chat_answer_key(
+        "cachedContents/rebuilt", "User question: How many rodent reports?", False
+    )
+    assert saved == {key: "Rodent reports rose in June."}
@@ -0,0 +1,143 @@
+import os
+from urllib.parse import urlencode
+
+import pytest
+
+from conftest import peak_rss_mb, reset_peak_rss
+
+pytest.importorskip("pytest_benchmark")
+
+#
+# /data/query benchmarks, one per data_request branch and output type, plus the query
+# builders and row streamers on their own. Each benchmark records latency (pytest-benchmark
+# stats) and, in extra_info, rows, bytes, rows/s, MB/s and peak RSS.
+#
+#   pip install -r test/requirements.txt
+#   pytest test/ --benchmark-json=benchmark.json
+#
+# BENCH_ROUNDS sets the timed rounds per benchmark (default 3).
+#
+
+ROUNDS = int(os.getenv("BENCH_ROUNDS", "3"))
+
+OUTPUT_TYPES = ["json", "stream", "ndjson", "csv", "arrow", "parquet"]
+
+# name -> /data/query arguments; "event_ids" / "cells" are POSTed from the sample fixture
+DATA_REQUESTS = {
+    "311_by_geo month": {"request": "311_by_geo", "category": "all", "date": "2019-06"},
+    "311_by_geo all months": {"request": "311_by_geo", "category": "all"},
+    "311_by_geo spatial": {"request": "311_by_geo", "category": "all", "is_spatial": "1"},
+    "311_by_geo page": {"request": "311_by_geo", "category": "all", "limit": "10000"},
+    "311_hexbins": {"request": "311_hexbins", "category": "all", "resolution": "10", "date": "2019-06"},
+    "311_summary": {"request": "311_summary", "category": "all", "date": "2019-06"},
+    "311_summary event_ids": {"request": "311_summary", "category": "all", "post": "event_ids"},
+    "311_summary cells": {"request": "311_summary", "category": "all", "resolution": "10", "post": "cells"},
+    "311_summary_context": {"request": "311_summary_context"},
+    "911_shots_fired": {"request": "911_shots_fired"},
+    "911_homicides_and_shots_fired": {"request": "911_homicides_and_shots_fired"},
+    "zip_geo": {"request": "zip_geo", "zipcode": "'02121','02122','02124','02125'"},
+}
+
+# build_311_query arguments per branch, timed without the database
+BUILD_311 = {
+    "311_by_geo": {"data_request": "311_by_geo", "request_options": "all", "request_date": "2019-06"},
+    "311_hexbins": {"data_request": "311_hexbins", "request_options": "all", "h3_resolution": 10},
+    "311_summary": {"data_request": "311_summary", "request_options": "all"},
+    "311_summary event_ids": {"data_request": "311_summary", "event_ids": ",".join(str(i) for i in range(1, 5001))},
+    "311_summary_context": {"data_request": "311_summary_context"},
+}
+
+
+def data_query(client, headers, sample, args: dict, output_type: str):
+    """Issue one /data/query request and consume the body. Returns its size in bytes."""
+    args = dict(args)
+    post = args.pop("post", None)
+    if output_type != "json":
+        args["output_type"] = output_type
+    path = f"/data/query?{urlencode(args)}"
+    if post:
+        response = client.post(path, json={post: sample[post]}, headers=headers, buffered=False)
+    else:
+        response = client.get(path, headers=headers, buffered=False)
+    try:
+        assert response.status_code == 200, response.get_data(as_text=True)[:500]
+        return sum(len(chunk) for chunk in response.iter_encoded())
+    finally:
+        response.close()
+
+
+def count_rows(client, headers, sample, args: dict) -> int:
+    """Row count from one untimed NDJSON request, one line per row."""
+    args = dict(args, output_type="ndjson")
+    post = args.pop("post", None)
+    path = f"/data/query?{urlencode(args)}"
+    if post:
+        response = client.post(path, json={post: sample[post]}, headers=headers)
+    else:
+        response = client.get(path, headers=headers)
+    return sum(1 for line in response.get_data().split(b"\n") if line)
+
+
+def record(benchmark, rows: int, size: int, peak: float) -> None:
+    benchmark.extra_info["rows"] = rows
+    benchmark.extra_info["bytes"] = size
+    benchmark.extra_info["peak_rss_mb"] = round(peak, 1)
+    if benchmark.stats:
+        median = benchmark.stats.stats.median
+        benchmark.extra_info["rows_per_s"] = round(rows / median) if median else None
+        benchmark.extra_info["mb_per_s"] = round(size / median / 1e6, 2) if median else None
+
+
+@pytest.mark.parametrize("output_type", OUTPUT_TYPES)
+@pytest.mark.parametrize("name", DATA_REQUESTS)
+def test_data_query(benchmark, client, headers, sample, name, output_type):
+    args = DATA_REQUESTS[name]
+    if args.get("post") and not sample[args["post"]]:
+        pytest.skip(f"no {args['post']} to select, run setup/post_ingest.py --full")
+
+    rows = count_rows(client, headers, sample, args)
+
+    reset_peak_rss()
+    size = benchmark.pedantic(
+        data_query,
+        args=(client, headers, sample, args, output_type),
+        rounds=ROUNDS,
+        warmup_rounds=1,
+    )
+    record(benchmark, rows, size, peak_rss_mb())
+
+
+@pytest.mark.parametrize("name", BUILD_311)
+def test_build_311_query(benchmark, api, name):
+    query = benchmark(api.build_311_query, **BUILD_311[name])
+    assert query
+
+
+def drain(chunks) -> int:
+    return sum(len(chunk) for chunk in chunks)
+
+
+@pytest.mark.parametrize("framing", ["json", "ndjson"])
+def test_stream_query_results(benchmark, api, framing):
+    query = api.build_311_query(data_request="311_by_geo", request_options="all")
+    reset_peak_rss()
+    size = benchmark.pedantic(
+        lambda: drain(api.stream_query_results(query, framing=framing)),
+        rounds=ROUNDS,
+        warmup_rounds=1,
+    )
+    body = "".join(api.stream_query_results(query, framing="ndjson"))
+    rows = sum(1 for line in body.split("\n") if line)
+    record(benchmark, rows, size, peak_rss_mb())
+
+
+def test_csv_query_results(benchmark, api):
+    query = api.build_311_query(data_request="311_by_geo", request_options="all")
+    reset_peak_rss()
+    size = benchmark.pedantic(
+        lambda: drain(api.csv_query_results(query)),
+        rounds=ROUNDS,
+        warmup_rounds=1,
+    )
+    rows = sum(chunk.count("\n") for chunk in api.csv_query_results(query)) - 1
+    record(benchmark, rows, size, peak_rss_mb())
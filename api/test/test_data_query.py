@@ -0,0 +1,294 @@
+import csv
+import datetime
+import decimal
+import gzip
+import io
+import json
+import zlib
+
+import pytest
+from mysql.connector import FieldType
+
+#
+# Behaviour tests for the /data/query path: keyset pagination, the spatial rollup fallback, the
+# response cache, the streamed JSON encoder and CSV compression. No database needed, see
+# fake_db in conftest.py.
+#
+#   pytest test/test_data_query.py
+#
+
+COLUMNS = [
+    ("id", FieldType.LONG),
+    ("type", FieldType.VAR_STRING),
+    ("date", FieldType.DATETIME),
+    ("latitude", FieldType.NEWDECIMAL),
+    ("score", FieldType.DOUBLE),
+    ("day", FieldType.DATE),
+    ("note", FieldType.BLOB),
+]
+
+ROWS = [
+    (1, "Illegal Dumping", datetime.datetime(2019, 2, 1, 8, 30), decimal.Decimal("42.31234567890123"), 0.1, datetime.date(2019, 2, 1), "plain"),
+    (2, 'Quote " and \\ slash', datetime.datetime(2019, 2, 2), decimal.Decimal("-71.5"), 1e-07, datetime.date(2019, 2, 2), None),
+    (3, "Ünïcödé — ✓ 😀", None, None, None, None, {"nested": [1, 2]}),
+    (4, "Tab\tnew\nline", datetime.datetime(2019, 2, 3, 0, 0, 0, 1500), decimal.Decimal("0"), -0.0, datetime.date(2019, 2, 3), 12),
+]
+
+
+def reference_json(value):
+    """What json.dumps() gives after the conversion jsonify used to do."""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+@pytest.fixture
+def client(api_module):
+    return api_module.app.test_client()
+
+
+@pytest.fixture
+def headers(api_module):
+    return {"RethinkAI-API-Key": api_module.Config.RETHINKAI_API_KEYS[0]}
+
+
+#
+# Keyset pagination
+#
+def test_page_query_orders_and_bounds_by_id(api_module):
+    query = api_module.build_311_query(
+        data_request="311_by_geo", request_options="all", page_limit=100, after_id=5, before_id=90
+    )
+    assert "AND id > 5" in query
+    assert "AND id < 90" in query
+    assert query.rstrip().endswith("ORDER BY id\n        LIMIT 100")
+
+
+def test_unpaged_query_has_no_order_or_limit(api_module):
+    query = api_module.build_311_query(data_request="311_by_geo", request_options="all")
+    assert "ORDER BY" not in query
+    assert "LIMIT" not in query
+    assert "id >" not in query
+
+
+def test_ids_only_selects_just_the_id(api_module):
+    query = api_module.build_311_query(data_request="311_by_geo", request_options="trash", ids_only=True)
+    assert query.split("FROM")[0].split() == ["SELECT", "id"]
+    assert "'Trash, Recycling, And Waste'" in query
+
+
+def test_next_page_cursor_is_last_id_of_page(api_module, fake_db):
+    fake_db.columns = [("id", FieldType.LONG)]
+    fake_db.rows = [(40,), (41,)]
+    params = dict(data_request="311_by_geo", request_options="all", page_limit=10, after_id=30)
+
+    assert api_module.next_page_cursor(params, 10) == "40"
+    query = fake_db.queries[-1][0]
+    assert query.startswith("SELECT id FROM (")
+    assert query.endswith("ORDER BY id LIMIT 2 OFFSET 9")
+    # The lookahead reads one row past the page and only the id
+    assert "LIMIT 11" in query
+    assert "normalized_category AS normalized_type" not in query
+
+
+@pytest.mark.parametrize("rows", [[(40,)], []], ids=["full last page", "short last page"])
+def test_next_page_cursor_is_empty_on_last_page(api_module, fake_db, rows):
+    fake_db.columns = [("id", FieldType.LONG)]
+    fake_db.rows = rows
+    params = dict(data_request="311_by_geo", request_options="all", page_limit=10)
+    assert api_module.next_page_cursor(params, 10) == ""
+
+
+def test_next_page_cursor_is_empty_on_database_error(api_module, fake_db):
+    import mysql.connector
+
+    fake_db.error = mysql.connector.Error("gone")
+    params = dict(data_request="311_by_geo", request_options="all", page_limit=10)
+    assert api_module.next_page_cursor(params, 10) == ""
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        {"limit": "0"},
+        {"limit": "-1"},
+        {"limit": "100001"},
+        {"limit": "10", "after_id": "abc"},
+        {"after_id": "1.5"},
+        {"before_id": "-3"},
+    ],
+)
+def test_invalid_page_arguments_are_rejected(client, headers, args):
+    response = client.get(
+        "/data/query", query_string={"request": "311_by_geo", "category": "all", **args}, headers=headers
+    )
+    assert response.status_code == 400
+    assert "Invalid limit, after_id or before_id" in response.get_json()["✖ Error"]
+
+
+def test_pagination_is_only_for_311_by_geo(client, headers):
+    response = client.get(
+        "/data/query", query_string={"request": "311_hexbins", "category": "all", "limit": "10"}, headers=headers
+    )
+    assert response.status_code == 400
+    assert response.get_json()["✖ Error"] == "Pagination is only supported for 311_by_geo"
+
+
+#
+# Spatial rollups
+#
+@pytest.mark.parametrize("data_request", ["311_summary", "311_summary_context"])
+def test_spatial_rollup_queries_follow_polygon_flags(api_module, monkeypatch, data_request):
+    monkeypatch.setattr(api_module, "polygon_flags_current", lambda: True)
+    query = api_module.build_311_query(data_request=data_request, request_options="all", is_spatial=True)
+    assert "ST_Contains" not in query
+    assert "in_tnt_polygon = 1" in query
+
+    # Flags computed for another polygon: the rollup is stale too, count from the raw tables
+    monkeypatch.setattr(api_module, "polygon_flags_current", lambda: False)
+    query = api_module.build_311_query(data_request=data_request, request_options="all", is_spatial=True)
+    assert "ST_Contains" in query
+    assert "FROM bos311_data" in query
+
+
+#
+# Response cache
+#
+@pytest.fixture
+def response_cache(api_module, monkeypatch):
+    monkeypatch.setattr(api_module.Config, "RESPONSE_CACHE_MAX_ENTRY_BYTES", 1024)
+    monkeypatch.setattr(api_module, "get_data_version", lambda: "v1")
+    api_module.response_cache.clear()
+    yield api_module.response_cache
+    api_module.response_cache.clear()
+
+
+def test_cache_key_ignores_selection_order_and_spacing(api_module, response_cache):
+    first = api_module.response_cache_key(request="311_summary", event_ids="3, 1,2")
+    second = api_module.response_cache_key(request="311_summary", event_ids="3,1,2")
+    assert first == second
+    assert "3,1,2" not in first
+
+
+def test_cache_key_changes_with_data_version(api_module, response_cache, monkeypatch):
+    before = api_module.response_cache_key(request="311_by_geo", category="all")
+    monkeypatch.setattr(api_module, "get_data_version", lambda: "v2")
+    assert api_module.response_cache_key(request="311_by_geo", category="all") != before
+
+
+def test_cache_hit_returns_stored_entry(api_module, response_cache):
+    key = api_module.response_cache_key(request="311_by_geo", category="all")
+    assert api_module.get_cached_response(key) is None
+
+    entry = api_module.set_cached_response(key, b'[{"id": 1}]', "application/json", {"X-Next-Cursor": "1"})
+    assert api_module.get_cached_response(key) is entry
+
+
+def test_oversized_body_is_not_cached(api_module, response_cache):
+    key = api_module.response_cache_key(request="311_by_geo", category="all")
+    entry = api_module.set_cached_response(key, b"x" * 2048, "application/json")
+    assert entry["etag"]
+    assert api_module.get_cached_response(key) is None
+
+
+def test_cached_response_carries_etag_and_headers(api_module, response_cache):
+    entry = api_module.set_cached_response("key", b'[{"id": 1}]', "application/json", {"X-Next-Cursor": "7"})
+    with api_module.app.test_request_context("/data/query"):
+        response = api_module.make_cached_response(entry, "HIT")
+    assert response.status_code == 200
+    assert response.get_data() == b'[{"id": 1}]'
+    assert response.headers["ETag"] == f'"{entry["etag"]}"'
+    assert response.headers["X-Cache"] == "HIT"
+    assert response.headers["X-Next-Cursor"] == "7"
+
+
+def test_matching_if_none_match_gets_304(api_module, response_cache):
+    entry = api_module.set_cached_response("key", b'[{"id": 1}]', "application/json")
+    with api_module.app.test_request_context("/data/query", headers={"If-None-Match": f'"{entry["etag"]}"'}):
+        response = api_module.make_cached_response(entry, "HIT")
+    assert response.status_code == 304
+
+    with api_module.app.test_request_context("/data/query", headers={"If-None-Match": '"stale"'}):
+        assert api_module.make_cached_response(entry, "HIT").status_code == 200
+
+
+#
+# Streamed JSON
+#
+def test_row_encoder_matches_json_dumps(api_module):
+    encode = api_module.json_row_encoder([(name, type_code) + (None,) * 5 for name, type_code in COLUMNS])
+    names = [name for name, _ in COLUMNS]
+    for row in ROWS:
+        expected = json.dumps({name: reference_json(value) for name, value in zip(names, row)})
+        assert encode(row) == expected
+
+
+@pytest.mark.parametrize("chunk_bytes", [1, 64 * 1024], ids=["chunk per row", "one chunk"])
+def test_stream_is_one_object_per_line(api_module, fake_db, monkeypatch, chunk_bytes):
+    monkeypatch.setattr(api_module.Config, "STREAM_CHUNK_BYTES", chunk_bytes)
+    monkeypatch.setattr(api_module.Config, "STREAM_FETCH_ROWS", 3)
+    fake_db.columns = COLUMNS
+    fake_db.rows = ROWS
+
+    body = "".join(api_module.stream_query_results("SELECT"))
+    names = [name for name, _ in COLUMNS]
+    expected = [json.dumps({n: reference_json(v) for n, v in zip(names, row)}) for row in ROWS]
+    assert body == "[\n" + ",\n".join(expected) + "\n]"
+    assert json.loads(body)[2]["type"] == ROWS[2][1]
+
+
+def test_ndjson_stream(api_module, fake_db):
+    fake_db.columns = COLUMNS
+    fake_db.rows = ROWS
+    lines = "".join(api_module.stream_query_results("SELECT", framing="ndjson")).split("\n")
+    assert lines[-1] == ""
+    assert [json.loads(line)["id"] for line in lines[:-1]] == [1, 2, 3, 4]
+
+
+def test_empty_results(api_module, fake_db):
+    fake_db.columns = COLUMNS
+    assert "".join(api_module.stream_query_results("SELECT")) == "[\n\n]"
+    assert "".join(api_module.stream_query_results("SELECT", framing="ndjson")) == ""
+
+
+def test_stream_error_ends_with_empty_array(api_module, fake_db):
+    import mysql.connector
+
+    fake_db.error = mysql.connector.Error("gone")
+    assert "".join(api_module.stream_query_results("SELECT")) == api_module.STREAM_ERROR_CHUNK
+    with pytest.raises(mysql.connector.Error):
+        "".join(api_module.stream_query_results("SELECT", framing="ndjson"))
+
+
+#
+# CSV and its compression
+#
+def test_csv_stream_round_trips(api_module, fake_db, monkeypatch):
+    monkeypatch.setattr(api_module.Config, "STREAM_CHUNK_BYTES", 16)
+    monkeypatch.setattr(api_module.Config, "STREAM_FETCH_ROWS", 1)
+    fake_db.columns = COLUMNS[:2]
+    fake_db.rows = [(row[0], row[1]) for row in ROWS]
+
+    chunks = list(api_module.csv_query_results("SELECT"))
+    assert len(chunks) > 1
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+    assert rows[0] == ["id", "type"]
+    assert rows[1:] == [[str(row[0]), row[1]] for row in ROWS]
+
+
+@pytest.mark.parametrize(
+    "encoding, decompress",
+    [("gzip", gzip.decompress), ("deflate", zlib.decompress)],
+)
+def test_compressed_stream_decompresses_to_the_original(api_module, encoding, decompress):
+    chunks = ["id,type\n"] + [f"{i},Illegal Dumping\n" for i in range(5000)] + [b"5000,bytes\n"]
+    compressed = list(api_module.compress_stream(iter(chunks), encoding))
+    original = "".join(c if isinstance(c, str) else c.decode() for c in chunks).encode()
+    assert decompress(b"".join(compressed)) == original
+    assert len(b"".join(compressed)) < len(original) / 4
+
+
+def test_compressed_empty_stream_is_valid(api_module):
+    assert gzip.decompress(b"".join(api_module.compress_stream(iter([]), "gzip"))) == b""
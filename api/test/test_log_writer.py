@@ -0,0 +1,118 @@
+import os
+import queue
+import threading
+
+import pytest
+
+#
+# Behaviour tests for the batched interaction_log writer: batching, the single executemany()
+# per statement shape, and the drain at exit. No database needed, see fake_db in conftest.py.
+#
+#   pytest test/test_log_writer.py
+#
+
+
+def insert(n: int):
+    return ("insert", {"session_id": f"s{n}", "app_version": "0.7.0"}, "")
+
+
+@pytest.fixture
+def batches(api_module, monkeypatch):
+    """Batches handed to write_log_events, instead of writing them."""
+    written = []
+    monkeypatch.setattr(api_module, "write_log_events", lambda events: written.append(list(events)))
+    monkeypatch.setattr(api_module.Config, "LOG_BATCH_SIZE", 3)
+    monkeypatch.setattr(api_module.Config, "LOG_FLUSH_INTERVAL", 0.05)
+    return written
+
+
+def test_queued_events_are_written_in_batches(api_module, batches):
+    log_queue = queue.Queue()
+    for n in range(7):
+        log_queue.put(insert(n))
+    log_queue.put(api_module.LOG_WRITER_STOP)
+
+    api_module.run_log_writer(log_queue)
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert [event for batch in batches for event in batch] == [insert(n) for n in range(7)]
+
+
+def test_partial_batch_is_written_after_flush_interval(api_module, batches):
+    log_queue = queue.Queue()
+    writer = threading.Thread(target=api_module.run_log_writer, args=(log_queue,), daemon=True)
+    writer.start()
+    log_queue.put(insert(1))
+    writer.join(timeout=0.5)
+    assert batches == [[insert(1)]]
+
+    log_queue.put(api_module.LOG_WRITER_STOP)
+    writer.join(timeout=1)
+    assert not writer.is_alive()
+
+
+def test_drain_writes_everything_queued_and_stops_writer(api_module, batches, monkeypatch):
+    log_queue = queue.Queue()
+    writer = threading.Thread(target=api_module.run_log_writer, args=(log_queue,), daemon=True)
+    monkeypatch.setitem(api_module.log_writer, "queue", log_queue)
+    monkeypatch.setitem(api_module.log_writer, "thread", writer)
+    monkeypatch.setitem(api_module.log_writer, "pid", os.getpid())
+    for n in range(5):
+        log_queue.put(insert(n))
+    writer.start()
+
+    api_module.drain_log_queue()
+    assert not writer.is_alive()
+    assert [event for batch in batches for event in batch] == [insert(n) for n in range(5)]
+
+
+def test_drain_writes_what_a_stuck_writer_left(api_module, batches, monkeypatch):
+    log_queue = queue.Queue()
+    stuck = threading.Thread(target=threading.Event().wait, args=(5,), daemon=True)
+    stuck.start()
+    monkeypatch.setitem(api_module.log_writer, "queue", log_queue)
+    monkeypatch.setitem(api_module.log_writer, "thread", stuck)
+    monkeypatch.setitem(api_module.log_writer, "pid", os.getpid())
+    monkeypatch.setattr(api_module.Config, "LOG_SHUTDOWN_TIMEOUT", 0.1)
+    log_queue.put(insert(1))
+
+    api_module.drain_log_queue()
+    assert batches == [[insert(1)]]
+
+
+def test_batch_is_one_insert_and_one_update_per_column_set(api_module, fake_db):
+    events = [
+        insert(1),
+        ("update", {"app_response": "ok"}, 11),
+        insert(2),
+        ("update", {"app_response": "error"}, 12),
+        ("update", {"client_response_rating": "up"}, 11),
+    ]
+    api_module.write_log_events(events)
+
+    statements = [" ".join(query.split()) for query, _ in fake_db.queries]
+    assert len(statements) == 3
+    assert statements[0].startswith("INSERT INTO interaction_log")
+    assert len(fake_db.queries[0][1]) == 2
+    assert statements[1] == "UPDATE interaction_log SET app_response = %s WHERE id = %s"
+    assert fake_db.queries[1][1] == [["ok", 11], ["error", 12]]
+    assert statements[2] == "UPDATE interaction_log SET client_response_rating = %s WHERE id = %s"
+    assert fake_db.commits == 1
+
+
+def test_inserts_fill_missing_columns(api_module, fake_db):
+    api_module.write_log_events([insert(1)])
+    row = fake_db.queries[0][1][0]
+    assert len(row) == len(api_module.LOG_COLUMNS)
+    assert row[api_module.LOG_COLUMNS.index("session_id")] == "s1"
+    assert row[api_module.LOG_COLUMNS.index("client_query")] == ""
+
+
+def test_request_entry_keeps_arrival_time(api_module, fake_db):
+    entry = api_module.start_request_log("s1", "0.7.0", client_query="Request: [GET] /data/query")
+    arrived = entry["created_at"]
+    api_module.log_event(session_id="s1", app_version="0.7.0", log_id=entry, app_response="SUCCESS")
+
+    api_module.write_log_events([("insert", entry, "")])
+    row = fake_db.queries[0][1][0]
+    assert row[api_module.LOG_COLUMNS.index("created_at")] == arrived
+    assert row[api_module.LOG_COLUMNS.index("app_response")] == "SUCCESS"
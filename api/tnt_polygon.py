@@ -0,0 +1,8 @@
+#
+# TNT neighborhood polygon. Shared by api.py and setup/post_ingest.py: post_ingest computes
+# in_tnt_polygon for it and records it in derived_data_state, and the API only trusts the
+# flags while the recorded polygon matches this one. After editing it, run setup/post_ingest.py.
+#
+# Using less specific rectangular shape for now.
+# Format: "lng_bottom_left lat_bottom_left, lng_top_left lat_top_left, lng_top_right lat_top_right, lng_bottom_right lat_bottom_right, lng_bottom_left lat_bottom_left"
+DEFAULT_POLYGON_COORDINATES = "-71.081297 42.284182, -71.081784 42.293107, -71.071730 42.293255, -71.071601 42.284301, -71.081297 42.284182"
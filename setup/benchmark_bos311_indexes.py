@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+import mysql.connector
+import argparse
+import logging
+import os
+import re
+import statistics
+import time
+from dotenv import load_dotenv
+from pathlib import Path
+from typing import Dict, List
+
+#
+# Before/after benchmark for setup/migrations/002_bos311_generated_columns.sql.
+#
+# Builds a scratch copy of bos311_data (BENCH_TABLE) filled with synthetic rows, times the
+# query shapes the API used before the migration (DATE_FORMAT month filter, CASE category),
+# applies the migration's ALTER TABLE to the scratch table, then times the new shapes
+# (open_month / normalized_category). The real bos311_data is never touched.
+#
+# Set .env w/ database info. Needs CREATE/DROP privileges on the database.
+#
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "database": os.getenv("DB_NAME"),
+}
+
+BENCH_TABLE = "bos311_data_bench"
+MIGRATION_FILE = Path(__file__).parent / "migrations" / "002_bos311_generated_columns.sql"
+INSERT_BATCH = 100000
+
+# Mapped types plus a few unmapped ones, so the category filter actually filters
+TYPES = [
+    "Poor Conditions of Property", "Needle Pickup", "Unsatisfactory Living Conditions", "Rodent Activity",
+    "Unsafe Dangerous Conditions", "Pest Infestation - Residential", "Missed Trash/Recycling/Yard Waste/Bulk Item",
+    "Illegal Dumping", "Requests for Street Cleaning", "Request for Pothole Repair", "Unshoveled Sidewalk",
+    "Tree Maintenance Requests", "Sidewalk Repair (Make Safe)", "Street Light Outages", "Sign Repair",
+    "Parking Enforcement", "Space Savers", "Parking on Front/Back Yards (Illegal Parking)",
+    "Municipal Parking Lot Complaints", "Private Parking Lot Complaints",
+    "Abandoned Vehicles", "Graffiti Removal", "General Comments For a Program or Policy", "Animal Generic Request",
+]
+NEIGHBORHOODS = ["Dorchester", "Roxbury", "Mattapan", "South Boston", "Jamaica Plain", "Back Bay", "Allston / Brighton", "East Boston"]
+DISTRICTS = ["B2", "B3", "C11", "C6", "D4", "E13", "A1", "E18"]
+
+LIVING = "'Poor Conditions of Property', 'Needle Pickup', 'Unsatisfactory Living Conditions', 'Rodent Activity', 'Unsafe Dangerous Conditions', 'Pest Infestation - Residential'"
+TRASH = "'Missed Trash/Recycling/Yard Waste/Bulk Item', 'Illegal Dumping'"
+STREETS = "'Requests for Street Cleaning', 'Request for Pothole Repair', 'Unshoveled Sidewalk', 'Tree Maintenance Requests', 'Sidewalk Repair (Make Safe)', 'Street Light Outages', 'Sign Repair'"
+PARKING = "'Parking Enforcement', 'Space Savers', 'Parking on Front/Back Yards (Illegal Parking)', 'Municipal Parking Lot Complaints', 'Private Parking Lot Complaints'"
+CASE_CATEGORY = f"""CASE
+    WHEN type IN ({LIVING}) THEN 'Living Conditions'
+    WHEN type IN ({TRASH}) THEN 'Trash, Recycling, And Waste'
+    WHEN type IN ({STREETS}) THEN 'Streets, Sidewalks, And Parks'
+    WHEN type IN ({PARKING}) THEN 'Parking'
+END"""
+# Same predicate the API uses (SQLConstants.CATEGORY_NAMES["all"] in api/api.py)
+ALL_CATEGORIES = "'Living Conditions', 'Trash, Recycling, And Waste', 'Streets, Sidewalks, And Parks', 'Parking'"
+BASE_WHERE = "police_district IN ('B2', 'B3', 'C11') AND neighborhood = 'Dorchester'"
+
+# name -> (query before migration, query after migration)
+QUERIES = {
+    "311_by_geo all, one month": (
+        f"SELECT id, type, open_dt, latitude, longitude, {CASE_CATEGORY} AS normalized_type FROM {BENCH_TABLE} "
+        f"WHERE type IN ({LIVING}, {TRASH}, {STREETS}, {PARKING}) AND {BASE_WHERE} AND DATE_FORMAT(open_dt, '%Y-%m') = '2021-06'",
+        f"SELECT id, type, open_dt, latitude, longitude, normalized_category AS normalized_type FROM {BENCH_TABLE} "
+        f"WHERE normalized_category IN ({ALL_CATEGORIES}) AND {BASE_WHERE} AND open_month = '2021-06'",
+    ),
+    "311_by_geo trash, one month": (
+        f"SELECT id, type, open_dt, latitude, longitude, {CASE_CATEGORY} AS normalized_type FROM {BENCH_TABLE} "
+        f"WHERE type IN ({TRASH}) AND {BASE_WHERE} AND DATE_FORMAT(open_dt, '%Y-%m') = '2021-06'",
+        f"SELECT id, type, open_dt, latitude, longitude, normalized_category AS normalized_type FROM {BENCH_TABLE} "
+        f"WHERE normalized_category IN ('Trash, Recycling, And Waste') AND {BASE_WHERE} AND open_month = '2021-06'",
+    ),
+    "311_by_geo all, no month": (
+        f"SELECT id, type, open_dt, latitude, longitude, {CASE_CATEGORY} AS normalized_type FROM {BENCH_TABLE} "
+        f"WHERE type IN ({LIVING}, {TRASH}, {STREETS}, {PARKING}) AND {BASE_WHERE}",
+        f"SELECT id, type, open_dt, latitude, longitude, normalized_category AS normalized_type FROM {BENCH_TABLE} "
+        f"WHERE normalized_category IN ({ALL_CATEGORIES}) AND {BASE_WHERE}",
+    ),
+    "category totals, one month": (
+        f"SELECT {CASE_CATEGORY} AS category, type, COUNT(*) FROM {BENCH_TABLE} "
+        f"WHERE type IN ({LIVING}, {TRASH}, {STREETS}, {PARKING}) AND {BASE_WHERE} AND DATE_FORMAT(open_dt, '%Y-%m') = '2021-06' "
+        f"GROUP BY category, type",
+        f"SELECT normalized_category AS category, type, COUNT(*) FROM {BENCH_TABLE} "
+        f"WHERE normalized_category IN ({ALL_CATEGORIES}) AND {BASE_WHERE} AND open_month = '2021-06' GROUP BY category, type",
+    ),
+}
+
+
+def connect_to_database() -> mysql.connector.connection.MySQLConnection:
+    """Establish connection to MySQL database."""
+    try:
+        connection = mysql.connector.connect(**DB_CONFIG)
+        logging.info("Successfully connected to MySQL database")
+        return connection
+    except mysql.connector.Error as err:
+        logging.error(f"Database connection error: {err}")
+        raise
+
+
+def quoted(values: List[str]) -> str:
+    return ", ".join("'" + v.replace("'", "''") + "'" for v in values)
+
+
+def create_bench_table(connection: mysql.connector.connection.MySQLConnection, rows: int) -> None:
+    """Create the scratch table with the pre-migration bos311_data layout and fill it."""
+    cursor = connection.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    cursor.execute(f"""
+        CREATE TABLE {BENCH_TABLE} (
+          `id` int NOT NULL AUTO_INCREMENT,
+          `open_dt` datetime DEFAULT NULL,
+          `type` varchar(100) DEFAULT NULL,
+          `police_district` varchar(20) DEFAULT NULL,
+          `neighborhood` varchar(100) DEFAULT NULL,
+          `latitude` decimal(18,14) DEFAULT NULL,
+          `longitude` decimal(18,14) DEFAULT NULL,
+          PRIMARY KEY (`id`),
+          KEY `idx_bos311_filter` (`neighborhood`,`police_district`,`type`,`open_dt`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+    """)
+    cursor.execute("SET SESSION cte_max_recursion_depth = %s", (INSERT_BATCH + 1,))
+
+    # ELT() picks from the lists with a uniform random index; dates span 2018-2024
+    insert = f"""
+        INSERT INTO {BENCH_TABLE} (open_dt, type, police_district, neighborhood, latitude, longitude)
+        WITH RECURSIVE seq (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+        SELECT
+            TIMESTAMP('2018-01-01') + INTERVAL FLOOR(RAND() * 7 * 365 * 86400) SECOND,
+            ELT(1 + FLOOR(RAND() * {len(TYPES)}), {quoted(TYPES)}),
+            ELT(1 + FLOOR(RAND() * {len(DISTRICTS)}), {quoted(DISTRICTS)}),
+            ELT(1 + FLOOR(RAND() * {len(NEIGHBORHOODS)}), {quoted(NEIGHBORHOODS)}),
+            42.23 + RAND() * 0.17,
+            -71.19 + RAND() * 0.20
+        FROM seq
+    """
+    remaining = rows
+    while remaining > 0:
+        batch = min(INSERT_BATCH, remaining)
+        cursor.execute(insert, (batch,))
+        connection.commit()
+        remaining -= batch
+        logging.info(f"Inserted {rows - remaining}/{rows} rows")
+
+    cursor.execute(f"ANALYZE TABLE {BENCH_TABLE}")
+    cursor.fetchall()
+    cursor.close()
+
+
+def apply_migration(connection: mysql.connector.connection.MySQLConnection) -> None:
+    """Run the migration's ALTER TABLE against the scratch table."""
+    sql = MIGRATION_FILE.read_text(encoding="utf-8")
+    sql = "\n".join(line for line in sql.splitlines() if not line.lstrip().startswith("#"))
+    alter = next(stmt for stmt in sql.split(";") if "ALTER TABLE" in stmt)
+    alter = re.sub(r"`bos311_data`", BENCH_TABLE, alter)
+
+    cursor = connection.cursor()
+    start = time.perf_counter()
+    cursor.execute(alter)
+    logging.info(f"Migration applied in {time.perf_counter() - start:.1f}s")
+    cursor.execute(f"ANALYZE TABLE {BENCH_TABLE}")
+    cursor.fetchall()
+    cursor.close()
+
+
+def time_query(connection: mysql.connector.connection.MySQLConnection, query: str, runs: int) -> Dict[str, float]:
+    """Run a query several times and return median/min latency in ms and the row count."""
+    cursor = connection.cursor()
+    timings = []
+    rows = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        cursor.execute(query)
+        rows = len(cursor.fetchall())
+        timings.append((time.perf_counter() - start) * 1000)
+    cursor.close()
+    return {"median_ms": statistics.median(timings), "min_ms": min(timings), "rows": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bos311_data month/category filters before and after migration 002.")
+    parser.add_argument("--rows", type=int, default=2000000, help="synthetic rows to generate (default: 2,000,000)")
+    parser.add_argument("--runs", type=int, default=5, help="timed runs per query")
+    parser.add_argument("--keep", action="store_true", help=f"keep {BENCH_TABLE} after the run")
+    args = parser.parse_args()
+
+    connection = connect_to_database()
+    try:
+        create_bench_table(connection, args.rows)
+        before = {name: time_query(connection, queries[0], args.runs) for name, queries in QUERIES.items()}
+        apply_migration(connection)
+        after = {name: time_query(connection, queries[1], args.runs) for name, queries in QUERIES.items()}
+
+        print(f"\n{args.rows:,} rows, median of {args.runs} runs")
+        print(f"{'query':<32}{'before ms':>12}{'after ms':>12}{'speedup':>10}{'rows':>10}")
+        for name in QUERIES:
+            b, a = before[name], after[name]
+            if b["rows"] != a["rows"]:
+                logging.warning(f"{name}: row count changed ({b['rows']} -> {a['rows']})")
+            speedup = b["median_ms"] / a["median_ms"] if a["median_ms"] else float("inf")
+            print(f"{name:<32}{b['median_ms']:>12.1f}{a['median_ms']:>12.1f}{speedup:>9.1f}x{a['rows']:>10}")
+    finally:
+        if not args.keep:
+            cursor = connection.cursor()
+            cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+            cursor.close()
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+import mysql.connector
+import argparse
+import logging
+import os
+import time
+from dotenv import load_dotenv
+from typing import List, Tuple
+
+#
+# Synthetic data for local development and for the benchmarks in api/test/.
+#
+# Fills bos311_data, shots_fired_data, homicide_data and zipcode_geo (setup/initialize_db.sql,
+# with every migration in setup/migrations/ applied) with generated rows. --scale 1 matches
+# today's volume (~1.87M 311 rows); the benchmarks are meant to run at 1x to 10x. Rows are
+# generated inside MySQL with a recursive CTE, so a 10x load doesn't go through Python.
+#
+# Neighborhoods, police districts, zip codes and coordinates are drawn together from PLACES,
+# weighted towards the Dorchester districts the API filters on, and a share of the rows
+# falls inside the TNT polygon. 311 types are weighted roughly like the real data.
+#
+# Afterwards run setup/post_ingest.py --full to fill the rollup, in_tnt_polygon and H3 cells.
+#
+# Set .env w/ database info. Use a local database; existing rows are only removed with --truncate.
+#
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+load_dotenv()
+
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "database": os.getenv("DB_NAME"),
+}
+
+# Rows per table at --scale 1
+BASE_ROWS = {"bos311_data": 1872650, "shots_fired_data": 8770, "homicide_data": 425}
+INSERT_BATCH = 100000
+
+# (neighborhood, police district, zip code, latitude, longitude, spread in degrees, weight)
+PLACES: List[Tuple[str, str, str, float, float, float, int]] = [
+    ("Dorchester", "C11", "02122", 42.2960, -71.0590, 0.020, 14),
+    ("Dorchester", "B3", "02124", 42.2860, -71.0750, 0.015, 10),
+    ("Dorchester", "B3", "02121", 42.2887, -71.0765, 0.005, 3),  # inside the TNT polygon
+    ("Dorchester", "B2", "02125", 42.3150, -71.0650, 0.012, 5),
+    ("Roxbury", "B2", "02119", 42.3150, -71.0900, 0.020, 10),
+    ("Mattapan", "B3", "02126", 42.2720, -71.0920, 0.015, 5),
+    ("South Boston", "C6", "02127", 42.3350, -71.0450, 0.015, 6),
+    ("Jamaica Plain", "E13", "02130", 42.3100, -71.1150, 0.020, 6),
+    ("Back Bay", "D4", "02116", 42.3500, -71.0810, 0.010, 5),
+    ("South End", "D4", "02118", 42.3400, -71.0730, 0.010, 6),
+    ("Allston / Brighton", "D14", "02135", 42.3530, -71.1400, 0.020, 7),
+    ("East Boston", "A7", "02128", 42.3750, -71.0300, 0.020, 6),
+    ("Downtown / Financial District", "A1", "02108", 42.3550, -71.0600, 0.008, 5),
+    ("Charlestown", "A15", "02129", 42.3780, -71.0620, 0.008, 3),
+    ("Hyde Park", "E18", "02136", 42.2560, -71.1240, 0.020, 4),
+    ("Roslindale", "E5", "02131", 42.2840, -71.1280, 0.015, 4),
+    ("West Roxbury", "E5", "02132", 42.2800, -71.1600, 0.020, 4),
+]
+
+# 311 types and relative frequency; the unmapped ones get a NULL normalized_category
+TYPES_311: List[Tuple[str, int]] = [
+    ("Poor Conditions of Property", 2), ("Needle Pickup", 3), ("Unsatisfactory Living Conditions", 2),
+    ("Rodent Activity", 2), ("Unsafe Dangerous Conditions", 1), ("Pest Infestation - Residential", 1),
+    ("Missed Trash/Recycling/Yard Waste/Bulk Item", 5), ("Illegal Dumping", 3),
+    ("Requests for Street Cleaning", 6), ("Request for Pothole Repair", 4), ("Unshoveled Sidewalk", 1),
+    ("Tree Maintenance Requests", 2), ("Sidewalk Repair (Make Safe)", 2), ("Street Light Outages", 3),
+    ("Sign Repair", 1), ("Parking Enforcement", 9), ("Space Savers", 1),
+    ("Parking on Front/Back Yards (Illegal Parking)", 1), ("Municipal Parking Lot Complaints", 1),
+    ("Private Parking Lot Complaints", 1), ("Abandoned Vehicles", 3), ("Graffiti Removal", 2),
+    ("Schedule a Bulk Item Pickup", 8), ("General Comments For a Program or Policy", 1),
+    ("Animal Generic Request", 1), ("Request for Snow Plowing", 2),
+]
+SOURCES_311 = [("Constituent Call", 5), ("Citizens Connect App", 4), ("Employee Generated", 2), ("Self Service", 1)]
+
+# Shots fired and homicides are concentrated in fewer districts
+PLACE_WEIGHTS_911 = [8, 8, 2, 5, 10, 6, 1, 1, 0, 1, 1, 1, 0, 1, 2, 1, 0]
+WEAPONS = [("Firearm", 8), ("Knife", 2), ("Other", 1)]
+RACES = [("Black or African American", 7), ("Hispanic", 2), ("White", 1), ("Asian", 1)]
+GENDERS = [("Male", 9), ("Female", 1)]
+
+
+def connect_to_database() -> mysql.connector.connection.MySQLConnection:
+    """Establish connection to MySQL database."""
+    try:
+        connection = mysql.connector.connect(**DB_CONFIG)
+        logging.info("Successfully connected to MySQL database")
+        return connection
+    except mysql.connector.Error as err:
+        logging.error(f"Database connection error: {err}")
+        raise
+
+
+def quoted(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'" if isinstance(value, str) else repr(value)
+
+
+def weighted_index(weights: List[int]) -> str:
+    """SQL picking a 1-based index with probability proportional to its weight."""
+    slots = [str(i + 1) for i, weight in enumerate(weights) for _ in range(weight)]
+    return f"ELT(1 + FLOOR(RAND() * {len(slots)}), {', '.join(slots)})"
+
+
+def pick(index: str, values: List) -> str:
+    return f"ELT({index}, {', '.join(quoted(v) for v in values)})"
+
+
+def place_columns(index: str) -> dict:
+    """neighborhood / district / zip / latitude / longitude expressions for a PLACES index."""
+    column = lambda n: [place[n] for place in PLACES]
+    return {
+        "neighborhood": pick(index, column(0)),
+        "district": pick(index, column(1)),
+        "zipcode": pick(index, column(2)),
+        "latitude": f"ROUND({pick(index, column(3))} + dy * {pick(index, column(5))}, 8)",
+        "longitude": f"ROUND({pick(index, column(4))} + dx * {pick(index, column(5))}, 8)",
+    }
+
+
+def insert_rows(connection, table: str, insert: str, rows: int, params: Tuple) -> None:
+    """Run a generating INSERT in batches of INSERT_BATCH rows. The first bind value is the row offset."""
+    cursor = connection.cursor()
+    cursor.execute("SET SESSION cte_max_recursion_depth = %s", (INSERT_BATCH + 1,))
+    start = time.perf_counter()
+    done = 0
+    while done < rows:
+        batch = min(INSERT_BATCH, rows - done)
+        cursor.execute(insert, (batch, done) + params)
+        connection.commit()
+        done += batch
+        logging.info(f"{table}: {done:,}/{rows:,} rows ({done / (time.perf_counter() - start):,.0f} rows/s)")
+    cursor.close()
+
+
+def generate_311(connection, rows: int, start_date: str, span_seconds: int) -> None:
+    place = place_columns("p")
+    types = [t for t, _ in TYPES_311]
+    # Closed cases mostly close within days, with a long tail past the 72 hour target
+    insert = f"""
+        INSERT INTO bos311_data (
+            case_enquiry_id, open_dt, sla_target_dt, closed_dt, on_time, case_status, closure_reason,
+            case_title, subject, reason, type, queue, department, location, police_district, neighborhood,
+            location_zipcode, latitude, longitude, source, coordinates
+        )
+        WITH RECURSIVE seq (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+        SELECT /*+ NO_MERGE(r) */
+            101000000000 + row_offset + n,
+            opened,
+            opened + INTERVAL 72 HOUR,
+            IF(closed, opened + INTERVAL hours HOUR, NULL),
+            IF(closed AND hours > 72, 'OVERDUE', 'ONTIME'),
+            IF(closed, 'Closed', 'Open'),
+            IF(closed, 'Case Closed. Case Resolved.', NULL),
+            {pick("t", types)},
+            'Public Works Department',
+            {pick("t", types)},
+            {pick("t", types)},
+            'INFO_Mass DOT',
+            'PWDx',
+            CONCAT(FLOOR(1 + RAND() * 300), ' Synthetic St, ', {place["neighborhood"]}),
+            {place["district"]},
+            {place["neighborhood"]},
+            {place["zipcode"]},
+            {place["latitude"]},
+            {place["longitude"]},
+            {pick("s", [s for s, _ in SOURCES_311])},
+            POINT({place['longitude']}, {place['latitude']})
+        FROM (
+            SELECT
+                n,
+                %s AS row_offset,
+                TIMESTAMP(%s) + INTERVAL FLOOR(RAND() * %s) SECOND AS opened,
+                {weighted_index([w for _, w in TYPES_311])} AS t,
+                {weighted_index([place[6] for place in PLACES])} AS p,
+                {weighted_index([w for _, w in SOURCES_311])} AS s,
+                RAND() < 0.92 AS closed,
+                FLOOR(1 + POW(RAND(), 3) * 2000) AS hours,
+                RAND() - 0.5 AS dx,
+                RAND() - 0.5 AS dy
+            FROM seq
+        ) AS r
+    """
+    insert_rows(connection, "bos311_data", insert, rows, (start_date, span_seconds))
+
+
+def generate_shots_fired(connection, rows: int, start_date: str, span_seconds: int) -> None:
+    place = place_columns("p")
+    insert = f"""
+        INSERT INTO shots_fired_data (
+            object_id, incident_num, incident_date, incident_date_time, address, district,
+            ballistics_evidence, latitude, longitude, hour_of_day, day_of_week, year, quarter, month,
+            neighborhood, geometry_x, geometry_y, coordinates
+        )
+        WITH RECURSIVE seq (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+        SELECT /*+ NO_MERGE(r) */
+            row_offset + n,
+            CONCAT('I', 190000000 + row_offset + n),
+            UNIX_TIMESTAMP(occurred) * 1000,
+            occurred,
+            CONCAT(FLOOR(1 + RAND() * 300), ' Synthetic St'),
+            {place["district"]},
+            RAND() < 0.6,
+            {place["latitude"]},
+            {place["longitude"]},
+            HOUR(occurred),
+            DAYOFWEEK(occurred),
+            YEAR(occurred),
+            QUARTER(occurred),
+            MONTH(occurred),
+            {place["neighborhood"]},
+            {place["longitude"]},
+            {place["latitude"]},
+            POINT({place['longitude']}, {place['latitude']})
+        FROM (
+            SELECT
+                n,
+                %s AS row_offset,
+                TIMESTAMP(%s) + INTERVAL FLOOR(RAND() * %s) SECOND AS occurred,
+                {weighted_index(PLACE_WEIGHTS_911)} AS p,
+                RAND() - 0.5 AS dx,
+                RAND() - 0.5 AS dy
+            FROM seq
+        ) AS r
+    """
+    insert_rows(connection, "shots_fired_data", insert, rows, (start_date, span_seconds))
+
+
+def generate_homicides(connection, rows: int, start_date: str, span_seconds: int) -> None:
+    place = place_columns("p")
+    insert = f"""
+        INSERT INTO homicide_data (
+            object_id, reporting_event_number, ruled_date, homicide_date, district, victim_age, race,
+            gender, weapon, hour_of_day, day_of_week, year, quarter, month, neighborhood, ethnicity_nibrs
+        )
+        WITH RECURSIVE seq (n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < %s)
+        SELECT /*+ NO_MERGE(r) */
+            row_offset + n,
+            CONCAT('I', 180000000 + row_offset + n),
+            occurred + INTERVAL FLOOR(RAND() * 30) DAY,
+            occurred,
+            {place["district"]},
+            FLOOR(15 + POW(RAND(), 2) * 50),
+            {pick("race", [r for r, _ in RACES])},
+            {pick("gender", [g for g, _ in GENDERS])},
+            {pick("weapon", [w for w, _ in WEAPONS])},
+            HOUR(occurred),
+            DAYOFWEEK(occurred),
+            YEAR(occurred),
+            QUARTER(occurred),
+            MONTH(occurred),
+            {place["neighborhood"]},
+            IF({pick("race", [r for r, _ in RACES])} = 'Hispanic', 'Hispanic or Latino', 'Not Hispanic or Latino')
+        FROM (
+            SELECT
+                n,
+                %s AS row_offset,
+                TIMESTAMP(%s) + INTERVAL FLOOR(RAND() * %s) SECOND AS occurred,
+                {weighted_index(PLACE_WEIGHTS_911)} AS p,
+                {weighted_index([w for _, w in RACES])} AS race,
+                {weighted_index([w for _, w in GENDERS])} AS gender,
+                {weighted_index([w for _, w in WEAPONS])} AS weapon
+            FROM seq
+        ) AS r
+    """
+    insert_rows(connection, "homicide_data", insert, rows, (start_date, span_seconds))
+
+
+def generate_zipcodes(connection) -> None:
+    """One square boundary per zip code in PLACES, for zip_geo requests."""
+    cursor = connection.cursor()
+    boundaries = {}
+    for _, _, zipcode, lat, lon, spread, _ in PLACES:
+        boundaries.setdefault(zipcode, (lat, lon, spread))
+    for zipcode, (lat, lon, spread) in boundaries.items():
+        half = spread / 2
+        ring = [(lon - half, lat - half), (lon + half, lat - half), (lon + half, lat + half), (lon - half, lat + half), (lon - half, lat - half)]
+        polygon = "POLYGON((" + ", ".join(f"{x:.6f} {y:.6f}" for x, y in ring) + "))"
+        cursor.execute(
+            "REPLACE INTO zipcode_geo (zipcode, boundary) VALUES (%s, ST_GeomFromText(%s))",
+            (zipcode, polygon),
+        )
+    connection.commit()
+    cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the RethinkAI tables with synthetic 311 / 911 data.")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiple of today's row counts, e.g. 0.01 for a quick run or 10 (default: 1)")
+    parser.add_argument("--start", default="2015-01-01", help="earliest generated date (default: 2015-01-01)")
+    parser.add_argument("--end", default="2025-06-01", help="latest generated date (default: 2025-06-01)")
+    parser.add_argument("--truncate", action="store_true", help="delete existing rows first")
+    args = parser.parse_args()
+
+    if args.scale <= 0:
+        parser.error("--scale must be positive")
+
+    connection = connect_to_database()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT TIMESTAMPDIFF(SECOND, %s, %s)", (args.start, args.end))
+        span_seconds = cursor.fetchone()[0]
+        if not span_seconds or span_seconds <= 0:
+            parser.error("--end must be after --start")
+
+        for table in BASE_ROWS:
+            if args.truncate:
+                cursor.execute(f"TRUNCATE TABLE {table}")
+            else:
+                cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+                if cursor.fetchone()[0]:
+                    parser.error(f"{table} already has rows, pass --truncate to replace them")
+        if args.truncate:
+            # Derived from the truncated tables, rebuilt by post_ingest.py --full
+            cursor.execute("DELETE FROM incident_monthly_rollup")
+            cursor.execute("DELETE FROM rollup_watermark")
+            connection.commit()
+        cursor.close()
+
+        rows = {table: max(1, round(count * args.scale)) for table, count in BASE_ROWS.items()}
+        generate_311(connection, rows["bos311_data"], args.start, span_seconds)
+        generate_shots_fired(connection, rows["shots_fired_data"], args.start, span_seconds)
+        generate_homicides(connection, rows["homicide_data"], args.start, span_seconds)
+        generate_zipcodes(connection)
+
+        cursor = connection.cursor()
+        for table in BASE_ROWS:
+            cursor.execute(f"ANALYZE TABLE {table}")
+            cursor.fetchall()
+        cursor.close()
+
+        logging.info(f"Generated {', '.join(f'{count:,} {table}' for table, count in rows.items())}")
+        logging.info("Now run setup/post_ingest.py --full to fill the rollup, in_tnt_polygon and H3 cells")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -53,6 +53,7 @@ CREATE TABLE `bos311_data` (
   `census_block_geo_id` bigint DEFAULT NULL,
   `latitude` decimal(18,14) DEFAULT NULL,
   `longitude` decimal(18,14) DEFAULT NULL,
+  `coordinates` point DEFAULT NULL,
   `geom_4326` varchar(100) DEFAULT NULL,
   `source` varchar(100) DEFAULT NULL,
   PRIMARY KEY (`id`),
@@ -116,6 +117,7 @@ CREATE TABLE `shots_fired_data` (
   `ballistics_evidence` int DEFAULT NULL,
   `latitude` decimal(10,8) DEFAULT NULL,
   `longitude` decimal(10,8) DEFAULT NULL,
+  `coordinates` point DEFAULT NULL,
   `census_block_geo_id` bigint DEFAULT NULL,
   `hour_of_day` int DEFAULT NULL,
   `day_of_week` int DEFAULT NULL,
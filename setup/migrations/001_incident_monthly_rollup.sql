@@ -0,0 +1,31 @@
+# Created: October 18, 2026
+# Encoding: Unicode (UTF-8)
+#
+# Monthly rollup of 311 and 911 counts. Read by the 311_summary and 311_summary_context
+# queries in api/api.py instead of scanning bos311_data / shots_fired_data / homicide_data.
+# Kept up to date by setup/post_ingest.py, run it after every data load.
+#
+
+USE `rethink_ai_boston`;
+
+CREATE TABLE IF NOT EXISTS `incident_monthly_rollup` (
+  `year` smallint NOT NULL,
+  `month` tinyint NOT NULL,
+  `neighborhood` varchar(100) NOT NULL DEFAULT '',
+  `district` varchar(20) NOT NULL DEFAULT '',
+  `in_tnt_polygon` tinyint NOT NULL DEFAULT 0,
+  `normalized_category` varchar(50) NOT NULL,
+  `type` varchar(100) NOT NULL,
+  `total` int NOT NULL DEFAULT 0,
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`year`,`month`,`neighborhood`,`district`,`in_tnt_polygon`,`normalized_category`,`type`),
+  KEY `idx_rollup_category` (`normalized_category`,`year`,`month`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+# Highest source row id already folded into the rollup, per source table
+CREATE TABLE IF NOT EXISTS `rollup_watermark` (
+  `source_table` varchar(64) NOT NULL,
+  `last_id` int NOT NULL DEFAULT 0,
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`source_table`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -0,0 +1,28 @@
+# Created: October 18, 2026
+# Encoding: Unicode (UTF-8)
+#
+# Stored generated columns on bos311_data so the API can filter on the month and the
+# normalized 311 category directly instead of DATE_FORMAT(open_dt, ...) / CASE WHEN type IN (...)
+# on every row. The category mapping must match SQLConstants.CATEGORY_TYPES / CATEGORY_NAMES
+# in api/api.py.
+#
+# Adding STORED columns rebuilds the table; expect this to take a few minutes on the full
+# 311 dataset. setup/benchmark_bos311_indexes.py measures the before/after on synthetic data.
+#
+
+USE `rethink_ai_boston`;
+
+ALTER TABLE `bos311_data`
+  ADD COLUMN `open_month` char(7) GENERATED ALWAYS AS (DATE_FORMAT(`open_dt`, '%Y-%m')) STORED,
+  ADD COLUMN `normalized_category` varchar(50) GENERATED ALWAYS AS (
+    CASE
+      WHEN `type` IN ('Poor Conditions of Property', 'Needle Pickup', 'Unsatisfactory Living Conditions', 'Rodent Activity', 'Unsafe Dangerous Conditions', 'Pest Infestation - Residential') THEN 'Living Conditions'
+      WHEN `type` IN ('Missed Trash/Recycling/Yard Waste/Bulk Item', 'Illegal Dumping') THEN 'Trash, Recycling, And Waste'
+      WHEN `type` IN ('Requests for Street Cleaning', 'Request for Pothole Repair', 'Unshoveled Sidewalk', 'Tree Maintenance Requests', 'Sidewalk Repair (Make Safe)', 'Street Light Outages', 'Sign Repair') THEN 'Streets, Sidewalks, And Parks'
+      WHEN `type` IN ('Parking Enforcement', 'Space Savers', 'Parking on Front/Back Yards (Illegal Parking)', 'Municipal Parking Lot Complaints', 'Private Parking Lot Complaints') THEN 'Parking'
+    END
+  ) STORED,
+  # Covers 311_by_geo under the base Dorchester filter, with or without a month
+  ADD KEY `idx_bos311_month_covering` (`neighborhood`,`police_district`,`open_month`,`normalized_category`,`type`,`open_dt`,`latitude`,`longitude`),
+  # Month/category lookups that don't filter on neighborhood (spatial requests, rollup refresh)
+  ADD KEY `idx_bos311_month_category` (`open_month`,`normalized_category`);
@@ -0,0 +1,58 @@
+# Created: October 18, 2026
+# Encoding: Unicode (UTF-8)
+#
+# Precomputed TNT polygon membership for is_spatial requests. in_tnt_polygon is kept up to
+# date by setup/post_ingest.py, which also recomputes it for every row when the polygon it
+# was computed for (stored in derived_data_state) no longer matches DEFAULT_POLYGON_COORDINATES.
+#
+# coordinates is added when the table doesn't have it yet (databases created before it was in
+# setup/initialize_db.sql) and filled from longitude / latitude where it is NULL.
+#
+# coordinates stays nullable, so loaders that don't write it keep working: post_ingest.py
+# fills it from longitude / latitude for new rows before flagging them. Rows without a
+# location are never inside the polygon. A SPATIAL INDEX would need the column NOT NULL, so
+# there is none; is_spatial requests filter on in_tnt_polygon instead.
+#
+
+USE `rethink_ai_boston`;
+
+CREATE TABLE IF NOT EXISTS `derived_data_state` (
+  `name` varchar(64) NOT NULL,
+  `value` text,
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+SET @add_coordinates = IF(
+  (SELECT COUNT(*) FROM information_schema.columns
+   WHERE table_schema = DATABASE() AND table_name = 'bos311_data' AND column_name = 'coordinates') = 0,
+  'ALTER TABLE `bos311_data` ADD COLUMN `coordinates` point DEFAULT NULL',
+  'DO 0'
+);
+PREPARE add_coordinates FROM @add_coordinates;
+EXECUTE add_coordinates;
+DEALLOCATE PREPARE add_coordinates;
+
+UPDATE `bos311_data` SET `coordinates` = POINT(`longitude`, `latitude`)
+WHERE `coordinates` IS NULL AND `longitude` IS NOT NULL AND `latitude` IS NOT NULL;
+
+ALTER TABLE `bos311_data`
+  ADD COLUMN `in_tnt_polygon` tinyint NOT NULL DEFAULT 0,
+  ADD KEY `idx_bos311_tnt_month` (`in_tnt_polygon`,`open_month`,`normalized_category`);
+
+SET @add_coordinates = IF(
+  (SELECT COUNT(*) FROM information_schema.columns
+   WHERE table_schema = DATABASE() AND table_name = 'shots_fired_data' AND column_name = 'coordinates') = 0,
+  'ALTER TABLE `shots_fired_data` ADD COLUMN `coordinates` point DEFAULT NULL',
+  'DO 0'
+);
+PREPARE add_coordinates FROM @add_coordinates;
+EXECUTE add_coordinates;
+DEALLOCATE PREPARE add_coordinates;
+
+UPDATE `shots_fired_data` SET `coordinates` = POINT(`longitude`, `latitude`)
+WHERE `coordinates` IS NULL AND `longitude` IS NOT NULL AND `latitude` IS NOT NULL;
+
+ALTER TABLE `shots_fired_data`
+  ADD COLUMN `in_tnt_polygon` tinyint NOT NULL DEFAULT 0,
+  ADD KEY `idx_shots_tnt_year` (`in_tnt_polygon`,`year`);
@@ -0,0 +1,17 @@
+# Created: October 18, 2026
+# Encoding: Unicode (UTF-8)
+#
+# H3 cell ids for each 311 report at resolutions 8-11, filled in by setup/post_ingest.py.
+# Read by the 311_hexbins request in api/api.py so dashboards get per-cell counts instead of
+# binning every point client side.
+#
+
+USE `rethink_ai_boston`;
+
+ALTER TABLE `bos311_data`
+  ADD COLUMN `h3_res8` char(15) DEFAULT NULL,
+  ADD COLUMN `h3_res9` char(15) DEFAULT NULL,
+  ADD COLUMN `h3_res10` char(15) DEFAULT NULL,
+  ADD COLUMN `h3_res11` char(15) DEFAULT NULL,
+  # Covers 311_hexbins for one month, under either the base or the spatial filter
+  ADD KEY `idx_bos311_month_h3` (`open_month`,`normalized_category`,`neighborhood`,`police_district`,`in_tnt_polygon`,`h3_res8`,`h3_res9`,`h3_res10`,`h3_res11`);
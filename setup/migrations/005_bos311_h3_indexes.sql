@@ -0,0 +1,15 @@
+# Created: October 18, 2026
+# Encoding: Unicode (UTF-8)
+#
+# Lookup indexes on the H3 cell columns from 004_bos311_h3_cells.sql. 311_summary with a
+# list of cells joins them against bos311_data through JSON_TABLE; each index covers that
+# join under either the base or the spatial filter, with or without a month.
+#
+
+USE `rethink_ai_boston`;
+
+ALTER TABLE `bos311_data`
+  ADD KEY `idx_bos311_h3_res8` (`h3_res8`,`normalized_category`,`type`,`open_month`,`neighborhood`,`police_district`,`in_tnt_polygon`),
+  ADD KEY `idx_bos311_h3_res9` (`h3_res9`,`normalized_category`,`type`,`open_month`,`neighborhood`,`police_district`,`in_tnt_polygon`),
+  ADD KEY `idx_bos311_h3_res10` (`h3_res10`,`normalized_category`,`type`,`open_month`,`neighborhood`,`police_district`,`in_tnt_polygon`),
+  ADD KEY `idx_bos311_h3_res11` (`h3_res11`,`normalized_category`,`type`,`open_month`,`neighborhood`,`police_district`,`in_tnt_polygon`);
@@ -0,0 +1,20 @@
+# Created: October 18, 2026
+# Encoding: Unicode (UTF-8)
+#
+# Answers to repeated /chat prompts, shared by all API workers. Keyed by a hash of the
+# context cache name, context data version, normalized prompt and structured_response flag
+# (see chat_answer_key() in api/api.py). The API drops expired rows and trims the table to
+# CHAT_ANSWER_CACHE_MAX_ROWS as it writes.
+#
+
+USE `rethink_ai_boston`;
+
+CREATE TABLE IF NOT EXISTS `chat_answer_cache` (
+  `cache_key` char(40) NOT NULL,
+  `answer` mediumtext NOT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `expires_at` timestamp NOT NULL,
+  PRIMARY KEY (`cache_key`),
+  KEY `idx_chat_answer_expires` (`expires_at`),
+  KEY `idx_chat_answer_created` (`created_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
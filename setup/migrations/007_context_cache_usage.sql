@@ -0,0 +1,17 @@
+# Created: October 18, 2026
+# Encoding: Unicode (UTF-8)
+#
+# When each Gemini context cache was last used, by any API worker. Every worker reports the
+# caches its requests used once per GEMINI_CACHE_REFRESH_INTERVAL; the one worker elected to
+# run the context cache refresher reads this to decide which caches to keep alive (see
+# report_context_cache_use() in api/api.py). Times are UTC.
+#
+
+USE `rethink_ai_boston`;
+
+CREATE TABLE IF NOT EXISTS `context_cache_usage` (
+  `cache_name` varchar(255) NOT NULL,
+  `last_used` datetime NOT NULL,
+  PRIMARY KEY (`cache_name`),
+  KEY `idx_context_cache_last_used` (`last_used`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+import mysql.connector
+import argparse
+import h3
+import logging
+import os
+import sys
+from dotenv import load_dotenv
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+#
+# Post-ingest maintenance for the derived tables the API reads from.
+# Run after loading new rows into bos311_data, shots_fired_data or homicide_data.
+# Expects every migration in setup/migrations/ to have been applied.
+#
+# incident_monthly_rollup (setup/migrations/001_incident_monthly_rollup.sql) is updated
+# incrementally: only the (year, month) partitions touched by rows newer than the last
+# run are recomputed. Use --full to rebuild everything, e.g. after rows were edited
+# or deleted in place.
+#
+# in_tnt_polygon on bos311_data / shots_fired_data (setup/migrations/003_tnt_polygon_flag.sql)
+# is set for new rows on every run. When DEFAULT_POLYGON_COORDINATES (api/tnt_polygon.py) differs from the polygon
+# recorded in derived_data_state, the flag is recomputed for every row and the rollup is rebuilt.
+#
+# Every completed run records its time in derived_data_state ('post_ingest_run'). Together with
+# rollup_watermark it makes up the data version the API's /data/query and /chat answer caches
+# are keyed on, so every API worker stops serving older results, even after a --full run.
+#
+# h3_res8 .. h3_res11 on bos311_data (setup/migrations/004_bos311_h3_cells.sql) are filled in
+# for new rows on every run (every row with --full).
+#
+
+# Set up logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s", filename="post_ingest.log")
+
+load_dotenv()
+
+# Database configuration - replace with your actual credentials
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "database": os.getenv("DB_NAME"),
+}
+
+# The polygon is defined next to the API (api/tnt_polygon.py), which falls back to live
+# ST_Contains() filters while the stored polygon doesn't match it
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "api"))
+from tnt_polygon import DEFAULT_POLYGON_COORDINATES  # noqa: E402
+
+# normalized 311 categories, as stored in bos311_data.normalized_category
+CATEGORIES_311 = ["Living Conditions", "Trash, Recycling, And Waste", "Streets, Sidewalks, And Parks", "Parking"]
+
+# H3 resolutions precomputed for 311 rows, one h3_res<N> column each
+H3_RESOLUTIONS = (8, 9, 10, 11)
+H3_BATCH_SIZE = 10000
+
+TNT_POLYGON = f"ST_GeomFromText('POLYGON(({DEFAULT_POLYGON_COORDINATES}))')"
+
+#
+# One entry per source table:
+#   months:     (year, month) partitions touched by rows with id in (%s, %s]
+#   categories: normalized_category values the source owns in the rollup
+#   refresh:    INSERT ... SELECT recomputing one (year, month) partition
+#   params:     bind values for refresh; 311 rows are matched on the open_month generated column
+#   spatial:    whether the table has coordinates / in_tnt_polygon
+#   h3:         whether the table has h3_res<N> columns
+#
+ROLLUP_SOURCES = {
+    "bos311_data": {
+        "months": """
+            SELECT DISTINCT YEAR(open_dt), MONTH(open_dt)
+            FROM bos311_data
+            WHERE id > %s AND id <= %s AND open_dt IS NOT NULL
+        """,
+        "categories": CATEGORIES_311,
+        "refresh": f"""
+            INSERT INTO incident_monthly_rollup
+                (year, month, neighborhood, district, in_tnt_polygon, normalized_category, type, total)
+            SELECT
+                YEAR(open_dt),
+                MONTH(open_dt),
+                COALESCE(neighborhood, ''),
+                COALESCE(police_district, ''),
+                in_tnt_polygon,
+                normalized_category,
+                type,
+                COUNT(*)
+            FROM bos311_data
+            WHERE open_month = %s
+                AND normalized_category IS NOT NULL
+            GROUP BY 1, 2, 3, 4, 5, 6, 7
+        """,
+        "params": lambda year, month: (f"{year:04d}-{month:02d}",),
+        "spatial": True,
+        "h3": True,
+    },
+    "shots_fired_data": {
+        "months": """
+            SELECT DISTINCT year, month
+            FROM shots_fired_data
+            WHERE id > %s AND id <= %s AND year IS NOT NULL AND month IS NOT NULL
+        """,
+        "categories": ["Shots Fired"],
+        "refresh": f"""
+            INSERT INTO incident_monthly_rollup
+                (year, month, neighborhood, district, in_tnt_polygon, normalized_category, type, total)
+            SELECT
+                year,
+                month,
+                COALESCE(neighborhood, ''),
+                COALESCE(district, ''),
+                in_tnt_polygon,
+                'Shots Fired',
+                CASE WHEN ballistics_evidence = 1 THEN 'Confirmed' ELSE 'Unconfirmed' END,
+                COUNT(*)
+            FROM shots_fired_data
+            WHERE year = %s AND month = %s
+                AND ballistics_evidence IN (0, 1)
+            GROUP BY 1, 2, 3, 4, 5, 6, 7
+        """,
+        "params": lambda year, month: (year, month),
+        "spatial": True,
+        "h3": False,
+    },
+    # homicide_data has no coordinates, so it never counts as inside the polygon
+    "homicide_data": {
+        "months": """
+            SELECT DISTINCT year, month
+            FROM homicide_data
+            WHERE id > %s AND id <= %s AND year IS NOT NULL AND month IS NOT NULL
+        """,
+        "categories": ["Homicides"],
+        "refresh": """
+            INSERT INTO incident_monthly_rollup
+                (year, month, neighborhood, district, in_tnt_polygon, normalized_category, type, total)
+            SELECT
+                year,
+                month,
+                COALESCE(neighborhood, ''),
+                COALESCE(district, ''),
+                0,
+                'Homicides',
+                'Homicide',
+                COUNT(*)
+            FROM homicide_data
+            WHERE year = %s AND month = %s
+            GROUP BY 1, 2, 3, 4, 5, 6, 7
+        """,
+        "params": lambda year, month: (year, month),
+        "spatial": False,
+        "h3": False,
+    },
+}
+
+
+def connect_to_database() -> mysql.connector.connection.MySQLConnection:
+    """Establish connection to MySQL database."""
+    try:
+        connection = mysql.connector.connect(**DB_CONFIG)
+        logging.info("Successfully connected to MySQL database")
+        return connection
+    except mysql.connector.Error as err:
+        logging.error(f"Database connection error: {err}")
+        raise
+
+
+def get_stored_polygon(connection: mysql.connector.connection.MySQLConnection) -> Optional[str]:
+    """Get the polygon in_tnt_polygon was last computed for."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT value FROM derived_data_state WHERE name = 'tnt_polygon'")
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        cursor.close()
+
+
+def save_polygon(connection: mysql.connector.connection.MySQLConnection) -> None:
+    """Record DEFAULT_POLYGON_COORDINATES as the polygon in_tnt_polygon is computed for."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            INSERT INTO derived_data_state (name, value) VALUES ('tnt_polygon', %s)
+            ON DUPLICATE KEY UPDATE value = VALUES(value)
+            """,
+            (DEFAULT_POLYGON_COORDINATES,),
+        )
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def save_run_time(connection: mysql.connector.connection.MySQLConnection) -> None:
+    """Record when the derived tables were last updated. The API keys its response and answer caches on it."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(
+            """
+            INSERT INTO derived_data_state (name, value) VALUES ('post_ingest_run', NOW(6))
+            ON DUPLICATE KEY UPDATE value = VALUES(value)
+            """
+        )
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def update_h3_cells(cursor, source_table: str, last_id: int, max_id: int) -> int:
+    """Fill in the h3_res<N> columns for rows with id in (last_id, max_id]. Returns rows updated."""
+    columns = [f"h3_res{resolution}" for resolution in H3_RESOLUTIONS]
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE IF NOT EXISTS h3_cells_update (id int NOT NULL PRIMARY KEY, {', '.join(f'{c} char(15)' for c in columns)})"
+    )
+
+    updated = 0
+    while last_id < max_id:
+        cursor.execute(
+            f"""
+            SELECT id, latitude, longitude FROM {source_table}
+            WHERE id > %s AND id <= %s
+            ORDER BY id
+            LIMIT %s
+            """,
+            (last_id, max_id, H3_BATCH_SIZE),
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+
+        cells = [
+            (row_id, *(h3.latlng_to_cell(float(latitude), float(longitude), resolution) for resolution in H3_RESOLUTIONS))
+            for row_id, latitude, longitude in rows
+            if latitude is not None and longitude is not None
+        ]
+        if not cells:
+            continue
+
+        cursor.execute("DELETE FROM h3_cells_update")
+        cursor.executemany(
+            f"INSERT INTO h3_cells_update (id, {', '.join(columns)}) VALUES ({', '.join(['%s'] * (len(columns) + 1))})",
+            cells,
+        )
+        cursor.execute(
+            f"""
+            UPDATE {source_table} t JOIN h3_cells_update c ON c.id = t.id
+            SET {', '.join(f't.{c} = c.{c}' for c in columns)}
+            """
+        )
+        updated += len(cells)
+
+    return updated
+
+
+def get_watermark(cursor, source_table: str) -> int:
+    """Get the last source id folded into the rollup."""
+    cursor.execute("SELECT last_id FROM rollup_watermark WHERE source_table = %s", (source_table,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def get_touched_months(cursor, source_table: str, last_id: int, max_id: int) -> List[Tuple[int, int]]:
+    """Get the (year, month) partitions that have rows newer than the watermark."""
+    cursor.execute(ROLLUP_SOURCES[source_table]["months"], (last_id, max_id))
+    return sorted((int(year), int(month)) for year, month in cursor.fetchall())
+
+
+def refresh_month(cursor, source_table: str, year: int, month: int) -> int:
+    """Recompute one (year, month) partition of the rollup for a source table."""
+    source = ROLLUP_SOURCES[source_table]
+    placeholders = ", ".join(["%s"] * len(source["categories"]))
+    cursor.execute(
+        f"DELETE FROM incident_monthly_rollup WHERE year = %s AND month = %s AND normalized_category IN ({placeholders})",
+        (year, month, *source["categories"]),
+    )
+    cursor.execute(source["refresh"], source["params"](year, month))
+    return cursor.rowcount
+
+
+def update_rollup(connection: mysql.connector.connection.MySQLConnection, source_table: str, full: bool = False) -> int:
+    """Update derived columns and fold rows added since the last run into the rollup. Returns the number of months recomputed."""
+    cursor = connection.cursor()
+
+    try:
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {source_table}")
+        max_id = cursor.fetchone()[0]
+        last_id = 0 if full else get_watermark(cursor, source_table)
+
+        # Flag new rows (every row on a full rebuild) before they are rolled up. Loaders
+        # may leave coordinates NULL, so it is filled from longitude / latitude first
+        if ROLLUP_SOURCES[source_table]["spatial"] and max_id > last_id:
+            cursor.execute(
+                f"""
+                UPDATE {source_table} SET coordinates = POINT(longitude, latitude)
+                WHERE id > %s AND id <= %s
+                    AND coordinates IS NULL AND longitude IS NOT NULL AND latitude IS NOT NULL
+                """,
+                (last_id, max_id),
+            )
+            cursor.execute(
+                f"UPDATE {source_table} SET in_tnt_polygon = COALESCE(ST_Contains({TNT_POLYGON}, coordinates), 0) WHERE id > %s AND id <= %s",
+                (last_id, max_id),
+            )
+
+        if ROLLUP_SOURCES[source_table]["h3"] and max_id > last_id:
+            cells = update_h3_cells(cursor, source_table, last_id, max_id)
+            logging.info(f"{source_table}: H3 cells set for {cells} rows")
+
+        if full:
+            placeholders = ", ".join(["%s"] * len(ROLLUP_SOURCES[source_table]["categories"]))
+            cursor.execute(
+                f"DELETE FROM incident_monthly_rollup WHERE normalized_category IN ({placeholders})",
+                tuple(ROLLUP_SOURCES[source_table]["categories"]),
+            )
+
+        months = get_touched_months(cursor, source_table, last_id, max_id) if max_id > last_id else []
+
+        for year, month in months:
+            rows = refresh_month(cursor, source_table, year, month)
+            logging.info(f"{source_table}: recomputed {year}-{month:02d} ({rows} rollup rows)")
+
+        cursor.execute(
+            """
+            INSERT INTO rollup_watermark (source_table, last_id) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE last_id = VALUES(last_id)
+            """,
+            (source_table, max_id),
+        )
+        connection.commit()
+        return len(months)
+
+    except mysql.connector.Error as err:
+        logging.error(f"Error updating rollup for {source_table}: {err}")
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update derived tables after a data load.")
+    parser.add_argument("--full", action="store_true", help="rebuild the rollup from scratch instead of incrementally")
+    args = parser.parse_args()
+
+    try:
+        connection = connect_to_database()
+
+        # A changed polygon invalidates every flag and every spatial rollup row. The new polygon is
+        # only recorded once the rollup is rebuilt, so a failed run is retried in full next time.
+        polygon_changed = get_stored_polygon(connection) != DEFAULT_POLYGON_COORDINATES
+        if polygon_changed:
+            logging.info("Polygon changed, recomputing in_tnt_polygon for all rows")
+
+        for source_table, source in ROLLUP_SOURCES.items():
+            full = args.full or (polygon_changed and source["spatial"])
+            months = update_rollup(connection, source_table, full=full)
+            logging.info(f"{source_table}: {months} months recomputed")
+
+        if polygon_changed:
+            save_polygon(connection)
+
+        save_run_time(connection)
+        logging.info("Post-ingest update completed")
+
+    except Exception as e:
+        logging.error(f"Unexpected error: {e}")
+    finally:
+        if "connection" in locals() and connection.is_connected():
+            connection.close()
+            logging.info("Database connection closed")
+
+
+if __name__ == "__main__":
+    main()